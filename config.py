@@ -11,6 +11,13 @@ load_dotenv()
 API_KEY = os.getenv("DASHSCOPE_API_KEY")
 BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
 
+# LLM_BACKEND=mock 时改连本地替身服务 (mock_server.py)，用于离线压测，不花钱
+LLM_BACKEND = os.getenv("LLM_BACKEND", "dashscope")
+MOCK_BASE_URL = os.getenv("MOCK_BASE_URL", "http://127.0.0.1:8765/v1")
+if LLM_BACKEND == "mock":
+    API_KEY = "mock-key"
+    BASE_URL = MOCK_BASE_URL
+
 # ================= 模型配置 =================
 # 生成文本的弱模型 (Weak Model)
 GENERATOR_MODEL = "qwen3-vl-flash" 
@@ -24,6 +31,161 @@ GENERATIONS = 10           # 迭代轮数
 ELITISM_COUNT = 2        # 精英保留数量
 SAMPLES_PER_EVAL = 5      # 每次评估 Prompt 时，随机抽取多少张图片进行测试 (避免太慢)
 
+# ================= 并发评估配置 =================
+# True: 整代种群的 (Prompt, 样本) 评估流水线并发执行 (AsyncOpenAI)
+# False: 退回逐个 Prompt、逐张图片的串行评估
+ASYNC_EVAL = True
+# 每个模型同时在途的初始最大请求数 (按服务商配额调整；运行中由 AIMD 自适应调整)
+MAX_CONCURRENCY = {
+    GENERATOR_MODEL: 8,
+    EVALUATOR_MODEL: 8,
+    OPTIMIZER_MODEL: 4,
+}
+DEFAULT_MAX_CONCURRENCY = 4  # 未在上表中列出的模型
+# 跨种群批量评分：同一代里同一张图片的所有 Tweet 合并成一次评估器请求
+EVAL_BATCH_MODE = False
+EVAL_BATCH_SIZE = 8          # 单次批量评分最多包含的 Tweet 数
+
+# ================= 传输层：限流 / 重试 / 自适应并发 (llm_transport.py) =================
+# 每个模型每分钟最多发起的请求数 (令牌桶)
+RATE_LIMIT_RPM = {
+    GENERATOR_MODEL: 600,
+    EVALUATOR_MODEL: 300,
+    OPTIMIZER_MODEL: 120,
+}
+DEFAULT_RATE_LIMIT_RPM = 60
+MAX_RETRIES = 4                    # 429 / 5xx / 超时 / 返回格式错误的最大重试次数
+RETRY_BASE_DELAY = 1.0             # 指数退避基数 (秒)
+RETRY_MAX_DELAY = 30.0             # 单次退避上限 (秒)
+AIMD_MAX_CONCURRENCY_FACTOR = 2    # 自适应并发上限最多增长到 MAX_CONCURRENCY 的几倍
+EVAL_FAILED_RETRY_ROUNDS = 1       # 重试耗尽后标记为 failed 的样本，本代内再整体补评几轮
+
+# ================= 请求布局 (服务端前缀缓存) =================
+# "prefix_cache": 固定内容 (仇恨定义、评分标准、输出格式要求) 放在 system 消息最前，其后是图片，
+#                 最后才是每次调用不同的 Prompt / Tweet，让服务端的前缀 (KV) 缓存能命中
+# "legacy": 原来的布局 (图片在前，固定内容与可变文本混在同一段文本里；已有的响应缓存 Key 不变)，默认
+# 改用 "prefix_cache" 后发给模型的消息结构不同，生成/评分结果可能随之变化，已有的响应缓存也不再命中
+PROMPT_LAYOUT = "legacy"
+
+# ================= 生成器流式输出 =================
+# True: 生成器以流式读取，清理后的 Tweet 超过 GENERATOR_MAX_CHARS 字符即断开连接，
+#       截到预算内最后一个句末 (没有句末则最后一个空格)；记录首 token 延迟和截断率
+#       (超长的 Tweet 会被截断，生成文本与非流式不同，缓存 Key 也分开)
+# False: 原来的非流式调用 (默认)
+GENERATOR_STREAM = False
+GENERATOR_MAX_CHARS = 200     # 与 OUTPUT_CONSTRAINT 的长度要求一致
+
+# ================= 多候选生成 =================
+# 每张图片一次生成器请求产出 GENERATOR_CANDIDATES 条 Tweet (图片只上传一次)，逐条评分后聚合成该样本的分数
+# 1 = 原来的单条生成 (缓存 Key 与流式行为都不变)
+GENERATOR_CANDIDATES = 1
+# "n": 用 API 的 n 参数一次返回多个 choice；
+# "numbered_list": 服务端不支持 n 时，让模型在一条回复里输出编号列表再拆开 (拆出的条数不足时按实际条数评分)
+GENERATOR_N_MODE = "n"
+# 同一样本多条候选的聚合方式: "mean" (平均) / "worst" (最差一条) / "best" (best-of-k)
+CANDIDATE_AGGREGATION = "mean"
+
+# ================= 用量 / 费用统计 (llm_metrics.py) =================
+# 每千 token 的 (输入价, 输出价)，单位随意 (如 元)；用于估算费用，请按服务商当前价目表修改
+MODEL_PRICES = {
+    GENERATOR_MODEL: (0.00015, 0.0015),
+    EVALUATOR_MODEL: (0.001, 0.01),
+    OPTIMIZER_MODEL: (0.0032, 0.0128),
+}
+CACHED_TOKEN_PRICE_RATIO = 0.4   # 命中服务端前缀缓存的输入 token 按输入价的这个比例计费
+METRICS_PROM_FILE = "llm_metrics.prom"   # 每代覆盖写一次的 Prometheus 文本文件 (None 表示不导出)
+
+# ================= 适应度账本 (fitness_ledger.py) =================
+# 精英/重复个体不重新从零评估：只在没见过的图片上追加样本，fitness 取累计均值
+USE_FITNESS_LEDGER = True
+LEDGER_CI_Z = 1.96           # 置信区间的 z 值 (1.96 ≈ 95%)
+
+# ================= 评估样本抽取 (sampling.py) =================
+# "panel": 同一代所有个体在同一组按难度分层、逐代轮转的图片上评估 (降低个体间比较的方差)
+# "independent": 每个 Prompt 各自随机抽 SAMPLES_PER_EVAL 张 (旧行为，默认)
+SAMPLING_MODE = "independent"
+SAMPLING_STRATA = 3          # 按历史平均样本分划分的难度层数 (历史里没出现过的图片另成一层)
+SAMPLING_SEED = 2024         # 各层轮转顺序的打乱种子 (不消耗 GA 的全局随机数)
+
+# ================= 评估调度 (racing.py) =================
+# fixed: 每个候选固定 SAMPLES_PER_EVAL 张图片
+# racing: 先小批量评估，再淘汰置信上界够不到精英线的候选，剩余预算给竞争者
+EVAL_SCHEDULER = "fixed"
+RACE_INITIAL_SAMPLES = 2                               # 第一轮每个候选的样本数 (至少 2，才能估计方差)
+RACE_STEP_SAMPLES = 2                                  # 之后每轮给竞争者追加的样本数
+RACE_MAX_SAMPLES = 2 * SAMPLES_PER_EVAL                # 单个候选累计样本上限
+RACE_BUDGET_PER_GEN = POPULATION_SIZE * SAMPLES_PER_EVAL  # 每代最多评估的样本数 (每个样本 = 生成 + 评分)
+RACE_CONFIDENCE_Z = 1.0                                # 淘汰用的置信区间 z 值 (越小淘汰越激进)
+
+# ================= 子代生产 (evolution.produce_offspring) =================
+# 初始化种群和繁殖时一次并发提交一批变异/交叉请求，按完成顺序去重，种群满了就跳过还没开始的请求
+# (实际在途请求数还受 MAX_CONCURRENCY[OPTIMIZER_MODEL] 的自适应上限约束)
+OFFSPRING_OVERPROVISION = 1.5   # 补轮时的超额提交倍数 (抵消重复/不合格的输出；第一轮不超额)
+OFFSPRING_WORKERS = 16          # 提交请求的线程数
+OFFSPRING_MAX_ROUNDS = 3        # 去重后仍不够时最多补几轮
+
+# ================= 变异算子选择 (lineage.py) =================
+# get_next_variant 在 concept_shift / span / global 三种变异之间、以及每种变异的具体策略之间如何选择：
+# "fixed": 原来的 40/40/20 固定概率，策略均匀随机 (默认)
+# "thompson": Beta-Bernoulli Thompson 采样；"ucb": UCB1
+# 奖励 = 子代首次评估的 fitness 是否高于父代 (交叉取两个父代中较高的)；谱系和 operator_stats 在各模式下都会记录
+OPERATOR_SELECTION = "fixed"
+OPERATOR_PRIOR = (1.0, 1.0)     # Thompson 的 Beta 先验 (成功, 失败)
+UCB_EXPLORATION = 1.0           # UCB1 探索系数 c：平均奖励 + c * sqrt(2 ln N / n)
+
+# ================= 近重复检测 (similarity.py) =================
+# 繁殖时拒绝与新种群个体 / 历史个体几乎相同的子代 (MinHash + LSH 估计词 n-gram 的 Jaccard 相似度)
+USE_SIMILARITY_DEDUP = True
+SIMILARITY_THRESHOLD = 0.8           # 相似度 >= 该值视为近重复
+SIMILARITY_INHERIT = True            # 与历史个体极其接近时保留子代，但直接继承邻居的 fitness (需要 USE_FITNESS_LEDGER)
+SIMILARITY_INHERIT_THRESHOLD = 0.95
+SIMILARITY_NUM_PERM = 64             # MinHash 签名长度
+SIMILARITY_BANDS = 16                # LSH 分段数 (每段 NUM_PERM / BANDS 行)
+SIMILARITY_SHINGLE_SIZE = 3          # 按词切 n-gram 的 n
+
+# ================= 代理适应度模型 (surrogate.py) =================
+# off: 不用; report: 只预测并报告与真实 fitness 的秩相关; screen: 繁殖时按预估分预筛子代
+SURROGATE_MODE = "report"
+SURROGATE_CANDIDATE_FACTOR = 2.0   # screen 模式下先产生几倍的子代，只评估预估分最高的那部分
+SURROGATE_MIN_RECORDS = 50         # 训练记录少于该数时不预筛
+SURROGATE_HASH_DIM = 512           # 词 1/2-gram 哈希特征维数
+SURROGATE_L2 = 1.0                 # 岭回归正则系数
+
+# ================= GA 调度 (pipeline.py) =================
+# generational: 每代严格"整代评估 -> 排序 -> 繁殖"
+# pipelined: 本代已有 PIPELINE_MIN_PARENTS 个个体评完分就开始繁殖下一代，子代一出生就开始评估，
+#            生成器/评估器/变异器三个模型同时在忙 (评估固定为每个体 SAMPLES_PER_EVAL 张，不走 racing / 批量评分)
+GA_SCHEDULER = "generational"
+PIPELINE_MIN_PARENTS = max(2, POPULATION_SIZE // 3)
+PIPELINE_BREED_WORKERS = 4   # 同时在繁殖的子代数 (越小，越晚出生的子代能从越多已评分的父代里选)
+
+# ================= 岛屿模型 (island_ga.py) =================
+ISLAND_COUNT = 4                 # 岛数 (= 工作进程数)，每个岛 POPULATION_SIZE 个个体
+ISLAND_MIGRATION_INTERVAL = 2    # 每几代迁移一次
+ISLAND_MIGRANTS = 2              # 每次迁出的个体数 (本岛前几名)
+ISLAND_BASE_SEED = 1234          # 岛 i 的随机种子 = ISLAND_BASE_SEED + i
+ISLAND_STRATEGY_MIX = True       # True: 各岛轮流分到 CONCEPT_STRATEGIES 的不同子集
+ISLAND_MIGRATION_TIMEOUT = 1800  # 等待邻居移民的最长秒数，超时则跳过本次迁移
+
+# ================= 运行日志 (run_journal.py) =================
+JOURNAL_FSYNC = False   # True: 每条记录都 fsync (更抗断电，但更慢)
+
+# ================= 结果分析 (results_store.py) =================
+ANALYTICS_DIR = "analytics"   # history 导入后的 Parquet 列式存储目录
+
+# ================= 响应缓存 (response_cache.py) =================
+# off / read_through / record_only / replay (严格回放，未命中即报错，可离线复现整次 GA)
+CACHE_MODE = os.getenv("LLM_CACHE_MODE", "read_through")
+CACHE_DB = "llm_cache.sqlite"
+CACHE_MAX_BYTES = 512 * 1024 * 1024   # 超过后按最久未访问淘汰
+CACHE_MAX_AGE_DAYS = 30               # 超过天数的条目直接淘汰 (0 表示不限)
+
+# ================= 图片负载预处理 (image_store.py) =================
+IMAGE_MAX_SIDE = 1024          # 长边超过则等比缩小
+IMAGE_JPEG_QUALITY = 85        # 重新编码的 JPEG 质量
+IMAGE_LRU_SIZE = 256           # 进程内缓存的 data URL 数量
+IMAGE_PACK_FILE = ".image_cache/payloads.pack"  # 磁盘 pack 文件 (索引为同名 .idx)
+
 # ================= 固定的定义 (不参与变异) =================
 HATE_SPEECH_DEF = """
 Definition:
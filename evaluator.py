@@ -1,71 +1,366 @@
 # evaluator.py
+import asyncio
 import random
 import logging
-from llm_client import call_generator, call_evaluator
-from config import HATE_SPEECH_DEF, SAMPLES_PER_EVAL, W_HATE, W_FLUENCY, W_REL, W_STYLE, W_PREACHY
+from collections import defaultdict
+import llm_metrics
+from scoring import score_sample
+from llm_client import (
+    call_generator, call_evaluator, acall_generator, acall_evaluator, acall_evaluator_batch, run_async,
+    call_generator_candidates, acall_generator_candidates
+)
+from config import (
+    HATE_SPEECH_DEF, SAMPLES_PER_EVAL, ASYNC_EVAL,
+    EVAL_BATCH_MODE, EVAL_BATCH_SIZE, EVAL_FAILED_RETRY_ROUNDS, GENERATOR_CANDIDATES, CANDIDATE_AGGREGATION
+)
 
-def calculate_fitness(prompt_candidate, dataset):
+METRIC_KEYS = {"hate": "hate_score", "fluency": "fluency_score", "relevance": "relevance_score",
+               "style": "style_score", "preachy": "preachiness_score"}
+
+def _sample_record(sample, gen_text, scores):
+    # 记录详情
+    if gen_text is None or scores is None:
+        # 生成或评分在重试耗尽后仍失败：显式标记，不计入 fitness
+        return {
+            "sid": sample.get('sid', 'unknown'),
+            "image_path": sample['image_path'],
+            "generated_text": gen_text,
+            "raw_scores": None,
+            "fitness": None,
+            "status": "failed"
+        }
+    return {
+        "sid": sample.get('sid', 'unknown'),
+        "image_path": sample['image_path'],
+        "generated_text": gen_text,
+        "raw_scores": scores,
+        "fitness": score_sample(scores)
+    }
+
+def _candidates_record(sample, texts, scores):
     """
-    在随机抽样的数据集上评估 Prompt 的表现
-    返回: (avg_fitness, average_metrics, detailed_results)
+    多候选样本 (GENERATOR_CANDIDATES > 1)：每条候选单独算 fitness，按 CANDIDATE_AGGREGATION 聚合成样本分数
+    - mean: raw_scores 取各分项均值 (fitness 是分项的线性组合，等于各候选 fitness 的均值)
+    - worst / best: 取 fitness 最低 / 最高的那条候选的 raw_scores 和文本
+    评分失败的候选不计入；生成失败或全部候选评分失败时整个样本 failed。
+    候选明细记在 candidates 里
+    """
+    if texts is None:
+        return _sample_record(sample, None, None)
+    candidates = [
+        {"text": t, "raw_scores": sc, "fitness": None if sc is None else score_sample(sc)}
+        for t, sc in zip(texts, scores)
+    ]
+    ok = [c for c in candidates if c["fitness"] is not None]
+    if not ok:
+        record = _sample_record(sample, texts[0], None)
+    elif CANDIDATE_AGGREGATION == "worst":
+        pick = min(ok, key=lambda c: c["fitness"])
+        record = _sample_record(sample, pick["text"], pick["raw_scores"])
+    elif CANDIDATE_AGGREGATION == "best":
+        pick = max(ok, key=lambda c: c["fitness"])
+        record = _sample_record(sample, pick["text"], pick["raw_scores"])
+    else:
+        mean_scores = {key: sum(c["raw_scores"][key] for c in ok) / len(ok) for key in METRIC_KEYS.values()}
+        record = _sample_record(sample, ok[0]["text"], mean_scores)
+    record["candidates"] = candidates
+    return record
+
+def is_failed(record):
+    return record.get("status") == "failed"
+
+def evaluation_failed(detailed_results):
+    """一个成功样本都没有 (全部重试耗尽，或账本里还没有样本)：该个体的 fitness 不是真实分数"""
+    return all(is_failed(r) for r in detailed_results)
+
+def summarize_samples(detailed_results):
     """
-    # 随机采样
-    test_samples = random.sample(dataset, min(len(dataset), SAMPLES_PER_EVAL))
-    
+    由样本详情汇总出 (avg_fitness, average_metrics)，failed 样本不计入；
+    全部失败时返回 0 分占位 (调用方用 evaluation_failed 判断，不参与排名和精英保留)
+    """
+    ok_results = [r for r in detailed_results if not is_failed(r)]
     total_score = 0
     metrics_log = {"hate": 0, "fluency": 0, "relevance": 0, "style": 0, "preachy": 0}
-    detailed_results = []
-    
-    for sample in test_samples:
-        img_path = sample['image_path']
-        sid = sample.get('sid', 'unknown')
-        
-        # 1. 生成
-        gen_text = call_generator(img_path, HATE_SPEECH_DEF, prompt_candidate)
-        
-        # 2. 评分
-        scores = call_evaluator(img_path, gen_text, HATE_SPEECH_DEF)
-        
-        # 3. 归一化计算
-        # Hate: 越低越好
-        s_hate = max(0, 100 - scores.get('hate_score', 100)) / 100.0
-        
-        # Preachy: 越低越好 (新增)
-        s_preachy = max(0, 100 - scores.get('preachiness_score', 100)) / 100.0
-        
-        # 其他: 越高越好
-        s_fluency = scores.get('fluency_score', 0) / 100.0
-        s_rel = scores.get('relevance_score', 0) / 100.0
-        s_style = scores.get('style_score', 0) / 100.0
-        
-        # 加权求和
-        fitness = (s_hate * W_HATE) + \
-                  (s_preachy * W_PREACHY) + \
-                  (s_fluency * W_FLUENCY) + \
-                  (s_rel * W_REL) + \
-                  (s_style * W_STYLE)
-        
-        total_score += fitness
-        
+    if not ok_results:
+        return 0.0, metrics_log
+
+    for record in ok_results:
+        scores = record["raw_scores"]
+        total_score += record["fitness"]
+
         # 累加指标
-        metrics_log["hate"] += scores.get('hate_score', 0)
-        metrics_log["fluency"] += scores.get('fluency_score', 0)
-        metrics_log["relevance"] += scores.get('relevance_score', 0)
-        metrics_log["style"] += scores.get('style_score', 0)
-        metrics_log["preachy"] += scores.get('preachiness_score', 0)
-        
-        # 记录详情
-        detailed_results.append({
-            "sid": sid,
-            "image_path": img_path,
-            "generated_text": gen_text,
-            "raw_scores": scores,
-            "fitness": fitness
-        })
+        for metric, key in METRIC_KEYS.items():
+            metrics_log[metric] += scores.get(key, 0)
 
     # 计算平均值
-    avg_fitness = total_score / len(test_samples)
+    avg_fitness = total_score / len(ok_results)
     for k in metrics_log:
-        metrics_log[k] /= len(test_samples)
-        
-    return avg_fitness, metrics_log, detailed_results
\ No newline at end of file
+        metrics_log[k] /= len(ok_results)
+
+    return avg_fitness, metrics_log
+
+def _retry_samples(records):
+    """失败样本还原成数据集样本，用于再评估一轮"""
+    return [{"sid": r["sid"], "image_path": r["image_path"]} for r in records if is_failed(r)]
+
+def _merge_retried(details, retried):
+    by_sid = {r["sid"]: r for r in retried}
+    return [by_sid.get(r["sid"], r) if is_failed(r) else r for r in details]
+
+def draw_samples(dataset, ledger=None, prompt_candidate=None, k=SAMPLES_PER_EVAL, panel=None):
+    # 传入公共评估面板 (sampling.py) 时整组使用，有账本时去掉该 Prompt 已经见过的图片
+    if panel is not None:
+        return list(panel) if ledger is None else ledger.unseen(prompt_candidate, panel)
+    # 随机采样 (有账本时只从该 Prompt 没见过的图片里抽)
+    pool = dataset if ledger is None else ledger.unseen(prompt_candidate, dataset)
+    return random.sample(pool, min(len(pool), k))
+
+def _evaluate_samples_once(prompt_candidate, test_samples):
+    detailed_results = []
+
+    for sample in test_samples:
+        img_path = sample['image_path']
+
+        with llm_metrics.scope(individual=prompt_candidate):
+            if GENERATOR_CANDIDATES > 1:
+                # 一次请求生成多条候选，逐条评分后聚合
+                texts = call_generator_candidates(img_path, HATE_SPEECH_DEF, prompt_candidate, GENERATOR_CANDIDATES)
+                scores = None if texts is None else [call_evaluator(img_path, t, HATE_SPEECH_DEF) for t in texts]
+                detailed_results.append(_candidates_record(sample, texts, scores))
+                continue
+
+            # 1. 生成
+            gen_text = call_generator(img_path, HATE_SPEECH_DEF, prompt_candidate)
+
+            # 2. 评分 (生成失败就不再花评分调用)
+            scores = None if gen_text is None else call_evaluator(img_path, gen_text, HATE_SPEECH_DEF)
+
+        # 3. 归一化计算并记录
+        detailed_results.append(_sample_record(sample, gen_text, scores))
+
+    return detailed_results
+
+def _evaluate_samples(prompt_candidate, test_samples):
+    detailed_results = _evaluate_samples_once(prompt_candidate, test_samples)
+
+    # 传输层重试耗尽的样本，整体再补评一轮
+    for _ in range(EVAL_FAILED_RETRY_ROUNDS):
+        retry = _retry_samples(detailed_results)
+        if not retry:
+            break
+        detailed_results = _merge_retried(detailed_results, _evaluate_samples_once(prompt_candidate, retry))
+
+    return detailed_results
+
+# ================= 并发评估 =================
+
+async def _aevaluate_sample(prompt_candidate, sample):
+    """单个 (Prompt, 图片) 流水线：生成 -> 评分"""
+    img_path = sample['image_path']
+    with llm_metrics.scope(individual=prompt_candidate):
+        if GENERATOR_CANDIDATES > 1:
+            texts = await acall_generator_candidates(img_path, HATE_SPEECH_DEF, prompt_candidate, GENERATOR_CANDIDATES)
+            scores = None if texts is None else await asyncio.gather(
+                *[acall_evaluator(img_path, t, HATE_SPEECH_DEF) for t in texts]
+            )
+            return _candidates_record(sample, texts, scores)
+        gen_text = await acall_generator(img_path, HATE_SPEECH_DEF, prompt_candidate)
+        scores = None if gen_text is None else await acall_evaluator(img_path, gen_text, HATE_SPEECH_DEF)
+    return _sample_record(sample, gen_text, scores)
+
+async def _agenerate(prompt_candidate, sample):
+    with llm_metrics.scope(individual=prompt_candidate):
+        if GENERATOR_CANDIDATES > 1:
+            return await acall_generator_candidates(
+                sample['image_path'], HATE_SPEECH_DEF, prompt_candidate, GENERATOR_CANDIDATES
+            )
+        return await acall_generator(sample['image_path'], HATE_SPEECH_DEF, prompt_candidate)
+
+async def _aevaluate_samples(prompt_candidate, test_samples):
+    detailed_results = list(await asyncio.gather(
+        *[_aevaluate_sample(prompt_candidate, s) for s in test_samples]
+    ))
+    return await _aretry_failed(prompt_candidate, detailed_results)
+
+async def _aretry_failed(prompt_candidate, detailed_results):
+    # 传输层重试耗尽的样本，整体再补评一轮
+    for _ in range(EVAL_FAILED_RETRY_ROUNDS):
+        retry = _retry_samples(detailed_results)
+        if not retry:
+            break
+        retried = await asyncio.gather(*[_aevaluate_sample(prompt_candidate, s) for s in retry])
+        detailed_results = _merge_retried(detailed_results, retried)
+    return detailed_results
+
+async def aevaluate_prompt(prompt_candidate, dataset, ledger=None, on_done=None, panel=None):
+    """
+    单个 Prompt 的异步评估 (流水线调度器用)，返回 (avg_fitness, average_metrics, detailed_results)
+    传入 ledger 时只在没见过的图片上追加样本，返回累计结果；
+    on_done(details) 在新样本评估完成时回调；panel 为本代的公共评估面板 (None 时随机抽样)
+    """
+    details = await _aevaluate_samples(prompt_candidate, draw_samples(dataset, ledger, prompt_candidate, panel=panel))
+    if on_done is not None and details:
+        on_done(details)
+    if ledger is None:
+        avg_fitness, metrics_log = summarize_samples(details)
+        return avg_fitness, metrics_log, details
+    ledger.add(prompt_candidate, details)
+    return ledger_result(ledger, prompt_candidate)
+
+async def acalculate_fitness(prompt_candidate, dataset, test_samples=None):
+    """
+    calculate_fitness 的异步版本：所有样本的流水线并发执行；test_samples 指定要评估的样本 (默认随机抽样)
+    """
+    if test_samples is None:
+        return await aevaluate_prompt(prompt_candidate, dataset)
+    detailed_results = await _aevaluate_samples(prompt_candidate, test_samples)
+    avg_fitness, metrics_log = summarize_samples(detailed_results)
+    return avg_fitness, metrics_log, detailed_results
+
+async def ascore_tweets(items):
+    """
+    批量评分：items 为 [(image_path, tweet_text), ...]，返回对齐的 raw_scores 列表
+    同一张图片的 Tweet 按 EVAL_BATCH_SIZE 分块，每块一次评估器请求；
+    批量响应格式不对时该块回退为逐条评分
+    """
+    groups = defaultdict(list)
+    for k, (img_path, text) in enumerate(items):
+        # 生成失败的 Tweet 不参与评分
+        if text is not None:
+            groups[img_path].append(k)
+
+    results = [None] * len(items)
+
+    async def _score_chunk(img_path, chunk):
+        texts = [items[k][1] for k in chunk]
+        scores = None
+        if len(chunk) > 1:
+            scores = await acall_evaluator_batch(img_path, texts, HATE_SPEECH_DEF)
+            if scores is None:
+                logging.warning(f"  Batch scoring malformed for {img_path}, falling back to per-tweet scoring")
+        if scores is None:
+            scores = await asyncio.gather(*[acall_evaluator(img_path, t, HATE_SPEECH_DEF) for t in texts])
+        for k, sc in zip(chunk, scores):
+            results[k] = sc
+
+    await asyncio.gather(*[
+        _score_chunk(img_path, idxs[start:start + EVAL_BATCH_SIZE])
+        for img_path, idxs in groups.items()
+        for start in range(0, len(idxs), EVAL_BATCH_SIZE)
+    ])
+    return results
+
+async def _aevaluate_panels_batched(population, panels):
+    """
+    跨种群批量评分：先并发生成整代的 Tweet，再把同一张图片的 Tweet 合并成一次评估器请求
+    (合并的评分请求跨多个个体，用量只计入代和运行，不计入单个个体)
+    """
+    jobs = [(i, sample) for i, samples in enumerate(panels) for sample in samples]
+    gen_texts = await asyncio.gather(*[_agenerate(population[i], sample) for i, sample in jobs])
+
+    per_prompt = [[] for _ in population]
+    if GENERATOR_CANDIDATES > 1:
+        # 多候选：所有候选展开后一起按图片合并评分，再按样本收回
+        flat = [(sample['image_path'], t) for (_, sample), texts in zip(jobs, gen_texts) for t in texts or []]
+        flat_scores = iter(await ascore_tweets(flat))
+        for (i, sample), texts in zip(jobs, gen_texts):
+            scores = None if texts is None else [next(flat_scores) for _ in texts]
+            per_prompt[i].append(_candidates_record(sample, texts, scores))
+    else:
+        scores = await ascore_tweets([(sample['image_path'], text) for (_, sample), text in zip(jobs, gen_texts)])
+        for (i, sample), text, sc in zip(jobs, gen_texts, scores):
+            per_prompt[i].append(_sample_record(sample, text, sc))
+
+    # 失败样本逐条补评
+    return list(await asyncio.gather(
+        *[_aretry_failed(p, details) for p, details in zip(population, per_prompt)]
+    ))
+
+async def _aevaluate_panels(population, panels, on_done=None):
+    """并发评估每个 Prompt 各自的样本，返回每个 Prompt 新产生的样本详情"""
+    if EVAL_BATCH_MODE:
+        per_prompt = await _aevaluate_panels_batched(population, panels)
+        if on_done is not None:
+            for i, details in enumerate(per_prompt):
+                if details:
+                    on_done(i, details)
+        return per_prompt
+
+    async def _one(i, p, samples):
+        details = await _aevaluate_samples(p, samples)
+        if on_done is not None and details:
+            on_done(i, details)
+        return details
+
+    return list(await asyncio.gather(
+        *[_one(i, p, samples) for i, (p, samples) in enumerate(zip(population, panels))]
+    ))
+
+def evaluate_panels(population, panels, on_done=None):
+    """
+    在指定样本上评估一批 Prompt (panels[i] 为 population[i] 要评估的样本)，
+    返回每个 Prompt 新产生的 detailed_results 列表。
+    on_done(i, details) 在第 i 个 Prompt 的样本全部完成时立即回调 (用于运行日志)
+    """
+    if not ASYNC_EVAL:
+        per_prompt = []
+        for i, (p, samples) in enumerate(zip(population, panels)):
+            details = _evaluate_samples(p, samples)
+            if on_done is not None and details:
+                on_done(i, details)
+            per_prompt.append(details)
+        return per_prompt
+    n_calls = sum(len(samples) for samples in panels)
+    logging.info(f"  Evaluating {len(population)} prompts ({n_calls} samples) concurrently...")
+    return run_async(_aevaluate_panels(population, panels, on_done))
+
+def evaluate_population(population, dataset, ledger=None, on_done=None, done=None, panel=None):
+    """
+    评估整代种群，返回与 population 顺序一致的 [(avg_fitness, average_metrics, detailed_results), ...]
+    ASYNC_EVAL 打开时，整代所有 (Prompt, 样本) 流水线在各模型的并发上限内同时执行；
+    EVAL_BATCH_MODE 再把同一张图片的 Tweet 合并评分 (仅并发模式下生效)。
+    传入 ledger (FitnessLedger) 时只评估每个 Prompt 没见过的图片，返回累计结果。
+    done ({下标: 样本详情}) 为断点续跑时本代已经评估完的个体，不再重复调用。
+    panel 为本代的公共评估面板 (sampling.PanelSampler)，None 时每个 Prompt 各自随机抽样。
+    """
+    done = done or {}
+    if ledger is None:
+        # 先按种群顺序抽样，保证随机数消耗顺序与串行版本一致
+        panels = [[] if i in done else draw_samples(dataset, panel=panel) for i in range(len(population))]
+        new_results = evaluate_panels(population, panels, on_done)
+        results = []
+        for i, details in enumerate(new_results):
+            details = done.get(i, details)
+            avg_fitness, metrics_log = summarize_samples(details)
+            results.append((avg_fitness, metrics_log, details))
+        return results
+
+    # 同一代里规范化后相同的 Prompt 只评估一次 (续跑时已完成的样本已在账本里)
+    panels = []
+    drawn_keys = set(ledger.key(population[i]) for i in done)
+    for p in population:
+        key = ledger.key(p)
+        # 刚继承了近重复邻居 fitness 的子代本代不评估 (见 similarity.py)
+        skip = key in drawn_keys or ledger.pop_inherited(p)
+        panels.append([] if skip else draw_samples(dataset, ledger, p, panel=panel))
+        drawn_keys.add(key)
+    new_results = evaluate_panels(population, panels, on_done)
+
+    for prompt, details in zip(population, new_results):
+        ledger.add(prompt, details)
+    return [ledger_result(ledger, prompt) for prompt in population]
+
+def calculate_fitness(prompt_candidate, dataset):
+    """
+    在随机抽样的数据集上评估单个 Prompt 的表现 (GA 内部按整代调用 evaluate_population)
+    返回: (avg_fitness, average_metrics, detailed_results)
+    """
+    return evaluate_population([prompt_candidate], dataset)[0]
+
+def ledger_result(ledger, prompt):
+    """账本里的累计结果；一个成功样本都没有时按 0 分处理"""
+    entry = ledger.summary(prompt)
+    if entry is None:
+        avg_fitness, metrics_log = summarize_samples([])
+        return avg_fitness, metrics_log, []
+    return entry["fitness"], entry["metrics"], entry["details"]
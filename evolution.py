@@ -1,7 +1,13 @@
 # evolution.py
+import logging
+import math
 import random
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from llm_client import call_mutator
+from config import OFFSPRING_OVERPROVISION, OFFSPRING_WORKERS, OFFSPRING_MAX_ROUNDS, OPERATOR_SELECTION
+import lineage
 
 # ================= 基础配置 =================
 
@@ -25,6 +31,9 @@ CONCEPT_STRATEGIES = [
     "remove_safety_warnings",     # 对抗：移除过多的安全警告，减少说教
 ]
 
+# 3. 常规全局改写
+GLOBAL_STRATEGIES = ["rephrase", "expand", "condense"]
+
 def split_into_sentences(text):
     """简单的分句逻辑"""
     sentences = re.split(r'(?<=[.!?])\s+', text)
@@ -32,17 +41,18 @@ def split_into_sentences(text):
 
 # ================= 变异函数 =================
 
-def mutate_span_level(current_prompt):
+def mutate_span_level(current_prompt, rng=random, strategy=None):
     """
     [微调] 局部变异：随机修改一个句子，保持大体结构不变。
+    strategy 为 None 时均匀随机选 (其余变异函数同理)
     """
     sentences = split_into_sentences(current_prompt)
     if len(sentences) <= 1:
-        return mutate_global(current_prompt)
+        return mutate_global(current_prompt, rng)
     
-    idx = random.randint(0, len(sentences) - 1)
+    idx = rng.randint(0, len(sentences) - 1)
     target_span = sentences[idx]
-    strategy = random.choice(SPAN_STRATEGIES)
+    strategy = strategy or rng.choice(SPAN_STRATEGIES)
     
     instruction = ""
     if strategy == "rewrite":
@@ -58,12 +68,12 @@ def mutate_span_level(current_prompt):
     sentences[idx] = new_span
     return " ".join(sentences)
 
-def mutate_concept_shift(current_prompt):
+def mutate_concept_shift(current_prompt, rng=random, strategy=None):
     """
     [发散] 概念变异：改变 Prompt 的核心策略或视角。
     这是跳出局部最优的关键。
     """
-    strategy = random.choice(CONCEPT_STRATEGIES)
+    strategy = strategy or rng.choice(CONCEPT_STRATEGIES)
     
     instruction = ""
     if strategy == "shift_focus_to_humor":
@@ -84,9 +94,9 @@ def mutate_concept_shift(current_prompt):
     # 调用 Mutator 进行全篇改写
     return call_mutator(current_prompt, instruction)
 
-def mutate_global(current_prompt):
+def mutate_global(current_prompt, rng=random, strategy=None):
     """[补充] 通用全局变异"""
-    strategy = random.choice(["rephrase", "expand", "condense"])
+    strategy = strategy or rng.choice(GLOBAL_STRATEGIES)
     instruction = f"Please {strategy} the following prompt instruction to be more effective for an AI model."
     return call_mutator(current_prompt, instruction)
 
@@ -98,49 +108,151 @@ def crossover_prompts(prompt_a, prompt_b):
 
 # ================= 核心调度逻辑 =================
 
-def get_next_variant(prompt, current_generation=0):
+MUTATION_OPERATORS = {
+    "concept_shift": mutate_concept_shift,
+    "span": mutate_span_level,
+    "global": mutate_global,
+}
+
+def operator_strategies(operator):
+    # 运行时读取 (岛屿模式会按岛替换 CONCEPT_STRATEGIES)
+    return {"concept_shift": CONCEPT_STRATEGIES, "span": SPAN_STRATEGIES, "global": GLOBAL_STRATEGIES}[operator]
+
+def _choose_operator(prompt, rng):
+    if OPERATOR_SELECTION == "fixed":
+        rand_val = rng.random()
+        # 固定概率配置
+        # 40% 概率进行概念大转移 (发散)
+        # 40% 概率进行局部 Span 微调 (收敛)
+        # 20% 概率进行常规重写
+        if rand_val < 0.4:
+            operator = "concept_shift"
+        elif rand_val < 0.8:
+            operator = "span"
+        else:
+            operator = "global"
+    else:
+        # 老虎机：先选算子，再选该算子内的策略
+        operator = lineage.choose(list(MUTATION_OPERATORS), rng)
+    if operator == "span" and len(split_into_sentences(prompt)) <= 1:
+        # 只有一句话时 span 变异退化为全局改写
+        operator = "global"
+    strategies = operator_strategies(operator)
+    if OPERATOR_SELECTION == "fixed":
+        return operator, rng.choice(strategies)
+    return operator, lineage.choose(strategies, rng, prefix=operator)
+
+def get_next_variant(prompt, current_generation=0, rng=random, parent_fitness=None):
     """
-    统一接口：根据概率选择变异策略。
-    可以引入 '模拟退火' 思想：前期多发散，后期多微调。
+    统一接口：选择变异算子和策略 (OPERATOR_SELECTION：固定概率或按子代提升率自适应)，
+    并把 父代 -> 子代 的谱系记入 lineage。
     """
-    rand_val = random.random()
-    
-    # 动态概率调整（可选）：随着代数增加，减少大幅度变异
-    # mutation_rate_concept = max(0.2, 0.5 - current_generation * 0.05) 
-    
-    # 固定概率配置
-    # 40% 概率进行概念大转移 (发散)
-    # 40% 概率进行局部 Span 微调 (收敛)
-    # 20% 概率进行常规重写
-    
-    if rand_val < 0.4:
-        # 发散：尝试全新的路子
-        return mutate_concept_shift(prompt)
-    elif rand_val < 0.8:
-        # 收敛：修修补补
-        return mutate_span_level(prompt)
+    operator, strategy = _choose_operator(prompt, rng)
+    child = MUTATION_OPERATORS[operator](prompt, rng, strategy)
+    lineage.record(child, [prompt], operator, strategy, parent_fitness)
+    return child
+
+def breed_child(scored_population, rng=random):
+    """
+    锦标赛选父代，再变异 (80%) 或交叉 (20%) 产生一个子代
+    scored_population: [(prompt, fitness, metrics), ...]，不要求排序
+    """
+    if len(scored_population) < 2:
+        # 只有一个已评分个体时没法锦标赛和交叉，直接变异它
+        parent, parent_fitness, _ = scored_population[0]
+        return get_next_variant(parent, rng=rng, parent_fitness=parent_fitness)
+    candidates = rng.sample(scored_population, 2)
+    parent, parent_fitness, _ = max(candidates, key=lambda x: x[1])
+
+    if rng.random() < 0.8:
+        return get_next_variant(parent, rng=rng, parent_fitness=parent_fitness)
+    candidates_2 = rng.sample(scored_population, 2)
+    parent_2, parent_2_fitness, _ = max(candidates_2, key=lambda x: x[1])
+    child = crossover_prompts(parent, parent_2)
+    lineage.record(child, [parent, parent_2], "crossover", parent_fitness=max(parent_fitness, parent_2_fitness))
+    return child
+
+def produce_offspring(make_child, n, existing=(), accept=None, records=None):
+    """
+    并发子代工厂：第一轮提交 n 个变异/交叉请求，结果按完成顺序去重；
+    去重/过滤后不够时再补一轮 (缺额 * OFFSPRING_OVERPROVISION 个请求，抵消重复)，最多 OFFSPRING_MAX_ROUNDS 轮。
+    凑够 n 个后还没开始的请求直接跳过，不再调用变异器。
+    - make_child(rng, k): 产生第 k 个候选，随机性只来自 rng
+      (每个请求一个独立的 Random，种子在主线程按提交顺序从全局随机数里取)
+    - existing: 已在种群里的 Prompt，子代不能与之重复
+    - accept(child): 额外的过滤条件
+    - records: 传入 dict 时，保留下来的子代的谱系记录放进这里，由调用方在最终筛选后 lineage.commit；
+      默认直接提交。丢弃的子代不留谱系记录
+    返回新产生的子代列表 (不含 existing)
+    """
+    children = []
+    taken = set(existing)
+    submitted = 0
+    kept = {}
+    stop = threading.Event()
+
+    def _job(rng, k):
+        # 种群已满时排队中的请求不再调用变异器
+        if stop.is_set():
+            return None, {}
+        with lineage.deferred() as pending:
+            child = make_child(rng, k)
+        return child, pending
+
+    for round_no in range(OFFSPRING_MAX_ROUNDS):
+        want = n - len(children)
+        if want <= 0:
+            break
+        # 第一轮不超额提交：在途的请求没法中途取消，多出来的都是白花的调用
+        n_jobs = want if round_no == 0 else math.ceil(want * OFFSPRING_OVERPROVISION)
+        executor = ThreadPoolExecutor(max_workers=min(OFFSPRING_WORKERS, n_jobs))
+        futures = [
+            executor.submit(_job, random.Random(random.getrandbits(64)), submitted + k)
+            for k in range(n_jobs)
+        ]
+        submitted += n_jobs
+        try:
+            for future in as_completed(futures):
+                child, pending = future.result()
+                if child is None or child in taken or (accept is not None and not accept(child)):
+                    continue
+                taken.add(child)
+                children.append(child)
+                if child in pending:
+                    kept[child] = pending[child]
+                if len(children) >= n:
+                    stop.set()
+                    break
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    if records is None:
+        lineage.commit(kept, children)
     else:
-        # 保底：常规改写
-        return mutate_global(prompt)
+        records.update(kept)
 
-def init_population_expansion(seed_prompt, size):
+    if len(children) < n:
+        logging.warning(f"  [OFFSPRING] Only {len(children)}/{n} unique offspring after {submitted} mutator requests")
+    return children
+
+def init_population_expansion(seed_prompt, size, accept=None):
     population = [seed_prompt]
-    print(f"Generating initial population ({size})...")
-    
-    attempts = 0
-    while len(population) < size and attempts < size * 3:
+    logging.info(f"Generating initial population ({size})...")
+
+    def make_variant(rng, k):
         # 初始化阶段，我们需要极大的多样性
         # 所以强制交替使用 Global 和 Concept Shift
-        if attempts % 2 == 0:
-            new_p = mutate_concept_shift(seed_prompt)
-        else:
-            new_p = mutate_global(seed_prompt)
-            
-        # 简单的去重查重（基于长度或内容）
-        if new_p not in population and len(new_p) > 20:
-            population.append(new_p)
-            print(f"  -> Generated variant {len(population)}/{size}")
-        
-        attempts += 1
-        
-    return population
\ No newline at end of file
+        operator = "concept_shift" if k % 2 == 0 else "global"
+        strategy = rng.choice(operator_strategies(operator))
+        variant = MUTATION_OPERATORS[operator](seed_prompt, rng, strategy)
+        # 初始种群没有父代 fitness，只记谱系，不计奖励
+        lineage.record(variant, [seed_prompt], operator, strategy)
+        return variant
+
+    # 简单的去重查重（基于长度或内容；accept 为额外的近重复过滤）
+    population += produce_offspring(
+        make_variant, size - 1, population, accept=lambda p: len(p) > 20 and (accept is None or accept(p))
+    )
+    logging.info(f"  -> Generated {len(population)}/{size} variants")
+
+    return population
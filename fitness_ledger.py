@@ -0,0 +1,105 @@
+# fitness_ledger.py
+"""
+Prompt 适应度账本
+
+按规范化后的 Prompt 哈希记录它在每张图片上的评估结果 (sample_evaluations)。
+精英/重复个体再次被评估时只在它没见过的图片上花调用，
+报告的 fitness 为全部样本的累计均值，并给出置信区间。
+"""
+import hashlib
+import math
+import re
+import unicodedata
+from evaluator import summarize_samples
+from config import LEDGER_CI_Z
+
+def normalize_prompt(text):
+    """规范化：统一 Unicode 形式，去掉首尾空白，折叠连续空白"""
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+def prompt_key(text):
+    return hashlib.sha256(normalize_prompt(text).encode("utf-8")).hexdigest()[:16]
+
+def confidence_halfwidth(values, z=LEDGER_CI_Z):
+    """均值的置信区间半宽 (正态近似)；样本不足 2 个时返回 None"""
+    n = len(values)
+    if n < 2:
+        return None
+    mean = sum(values) / n
+    var = sum((v - mean) ** 2 for v in values) / (n - 1)
+    return z * math.sqrt(var / n)
+
+class FitnessLedger:
+    def __init__(self):
+        # key -> {sid: sample_record}，保留插入顺序
+        self._samples = {}
+        # 近重复合并 (similarity.py)：子代 key -> 邻居 key，共用同一份样本
+        self._alias = {}
+        self._inherited_from = {}
+        self._pending_inherit = set()
+
+    def key(self, prompt):
+        k = prompt_key(prompt)
+        return self._alias.get(k, k)
+
+    def __contains__(self, prompt):
+        return self.key(prompt) in self._samples
+
+    def seen_sids(self, prompt):
+        return set(self._samples.get(self.key(prompt), {}))
+
+    def unseen(self, prompt, dataset):
+        """dataset 中该 Prompt 还没评估过的样本"""
+        seen = self.seen_sids(prompt)
+        return [d for d in dataset if d.get('sid', 'unknown') not in seen]
+
+    def add(self, prompt, records):
+        bucket = self._samples.setdefault(self.key(prompt), {})
+        for record in records:
+            # 失败的样本不算"见过"，以后还会重新评估
+            if record.get("status") == "failed":
+                continue
+            bucket[record["sid"]] = record
+
+    def inherit(self, prompt, neighbor):
+        """
+        把 prompt 并入近重复的邻居：之后两者共用样本和 fitness，
+        并且 prompt 在下一次评估时不再单独抽样 (见 pop_inherited)
+        """
+        k = prompt_key(prompt)
+        if k == self.key(neighbor):
+            return
+        self._alias[k] = self.key(neighbor)
+        self._inherited_from[k] = neighbor
+        self._pending_inherit.add(k)
+
+    def inherited_from(self, prompt):
+        return self._inherited_from.get(prompt_key(prompt))
+
+    def pop_inherited(self, prompt):
+        """刚继承了邻居 fitness、本代还不需要评估的 Prompt 返回 True (只返回一次)"""
+        k = prompt_key(prompt)
+        if k in self._pending_inherit:
+            self._pending_inherit.discard(k)
+            return True
+        return False
+
+    def records(self, prompt):
+        return list(self._samples.get(self.key(prompt), {}).values())
+
+    def summary(self, prompt):
+        """
+        返回 dict: fitness (累计均值), metrics, details (全部样本), ci (置信区间半宽), n
+        """
+        details = self.records(prompt)
+        if not details:
+            return None
+        fitness, metrics = summarize_samples(details)
+        return {
+            "fitness": fitness,
+            "metrics": metrics,
+            "details": details,
+            "ci": confidence_halfwidth([r["fitness"] for r in details]),
+            "n": len(details),
+        }
@@ -1,63 +1,121 @@
 import os
 import json
+import hashlib
 from pathlib import Path
+from PIL import Image
+import image_store
 
 # ================= 配置 =================
 IMAGE_DIR = "images"           # 图片文件夹路径
 OUTPUT_FILE = "train_images.json" # 输出的 JSON 文件名
 DEFAULT_LABEL = 1              # 默认标签 (1 代表有害图片)
+BUILD_IMAGE_PACK = True        # 同时把预处理后的上传负载写进 image_store 的 pack (GA/验证/岛屿进程共用)
 
 # 支持的图片扩展名
 VALID_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.bmp', '.gif'}
 
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def load_manifest(path=OUTPUT_FILE):
+    """已有的清单，按 image_path 索引 (旧格式只有 sid/path/label 也可以)"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return {d["image_path"]: d for d in json.load(f)}
+
+def describe_image(file_path, old=None):
+    """
+    单张图片的清单记录：尺寸、格式、字节数、sha256
+    mtime 和大小都没变时直接沿用旧记录；变了才重新计算哈希，哈希也没变时不再解码图片
+    返回 (record, 是否重新处理过)
+    """
+    st = os.stat(file_path)
+    if old and old.get("mtime_ns") == st.st_mtime_ns and old.get("bytes") == st.st_size and old.get("sha256"):
+        return old, False
+
+    digest = file_sha256(file_path)
+    record = dict(old or {})
+    record.update({"bytes": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest})
+    if not (old and old.get("sha256") == digest and "width" in old):
+        # 只读文件头取尺寸和格式
+        with Image.open(file_path) as img:
+            record["width"], record["height"] = img.size
+            record["format"] = img.format
+    return record, True
+
 def generate_json():
     # 检查图片目录是否存在
     if not os.path.exists(IMAGE_DIR):
         print(f"[Error] Directory '{IMAGE_DIR}' not found. Please create it and put images inside.")
         return
 
+    old_manifest = load_manifest()
     dataset = []
-    
+
     # 遍历目录
     print(f"Scanning directory: {IMAGE_DIR} ...")
     files = os.listdir(IMAGE_DIR)
-    
+
     count = 0
+    changed = 0
     for filename in files:
         # 获取文件后缀
         file_path = Path(os.path.join(IMAGE_DIR, filename))
         suffix = file_path.suffix.lower()
-        
+
         # 检查是否为图片
         if suffix in VALID_EXTENSIONS:
-            # 提取 sid (文件名去掉后缀)
-            sid = file_path.stem 
-            
-            # 构建记录
+            # 注意：这里存的是相对路径，确保主程序能找到
+            image_path = str(file_path).replace("\\", "/")
+            old = old_manifest.get(image_path)
+            try:
+                info, reprocessed = describe_image(image_path, old)
+            except OSError as e:
+                print(f"[Skip] {image_path}: {e}")
+                continue
+
+            # 构建记录 (已有记录里手动改过的 label 保留)
             record = {
-                "sid": sid,
-                # 注意：这里存的是相对路径，确保主程序能找到
-                "image_path": str(file_path).replace("\\", "/"), 
-                "label": DEFAULT_LABEL
+                # 提取 sid (文件名去掉后缀)
+                "sid": file_path.stem,
+                "image_path": image_path,
+                "label": old.get("label", DEFAULT_LABEL) if old else DEFAULT_LABEL,
             }
-            
+            for key in ("width", "height", "format", "bytes", "sha256", "mtime_ns"):
+                record[key] = info.get(key)
+
             dataset.append(record)
             count += 1
-    
+            changed += reprocessed
+
     # 排序（可选，方便查看）
     dataset.sort(key=lambda x: x['sid'])
 
-    # 写入 JSON 文件
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
+    # 写入 JSON 文件 (先写临时文件再替换，中断不会留下半个清单)
+    tmp = OUTPUT_FILE + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
         json.dump(dataset, f, indent=2, ensure_ascii=False)
-        
-    print(f"\n[Success] Processed {count} images.")
+    os.replace(tmp, OUTPUT_FILE)
+
+    removed = len(set(old_manifest) - {d["image_path"] for d in dataset})
+    print(f"\n[Success] Processed {count} images ({changed} new or changed, {removed} removed).")
     print(f"[Saved] Dataset saved to: {os.path.abspath(OUTPUT_FILE)}")
-    
+
+    if BUILD_IMAGE_PACK:
+        # 用清单里的哈希，不再重复读图算哈希；已在 pack 里的负载直接跳过
+        image_store.register_manifest(dataset)
+        encoded = image_store.warm([d["image_path"] for d in dataset])
+        print(f"[Pack] {encoded} image payloads encoded into {image_store.IMAGE_PACK_FILE}")
+
     # 打印前3条数据示例
     if dataset:
         print("\n--- Example Data ---")
         print(json.dumps(dataset[:3], indent=2))
 
 if __name__ == "__main__":
-    generate_json()
\ No newline at end of file
+    generate_json()
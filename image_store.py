@@ -0,0 +1,196 @@
+# image_store.py
+"""
+图片上传负载 (base64 data URL) 的预处理与缓存
+
+每张图片只做一次：缩放到 IMAGE_MAX_SIDE 以内并以 IMAGE_JPEG_QUALITY 重新编码为 JPEG，
+结果写入磁盘 pack 文件 (IMAGE_PACK_FILE + .idx 偏移索引)，进程内再加一层有界 LRU。
+生成器和评估器对同一张图片不再重复读盘和 base64 编码。
+pack 以只读 mmap 打开：各进程 (GA、岛屿子进程、验证脚本) 共享同一份页缓存，读负载不再逐次 open/seek/read，
+从映射直接解码成请求体需要的 str；
+generate_dataset_json.py 生成清单时可预先把所有图片编码进 pack，清单里的 sha256 经 register_manifest 复用。
+"""
+import base64
+import hashlib
+import io
+import json
+import logging
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from PIL import Image
+from config import IMAGE_MAX_SIDE, IMAGE_JPEG_QUALITY, IMAGE_LRU_SIZE, IMAGE_PACK_FILE
+
+# 负载版本：预处理参数变化后自动生成新的负载 (也用于响应缓存的 Key)
+PAYLOAD_VARIANT = f"max{IMAGE_MAX_SIDE}_q{IMAGE_JPEG_QUALITY}"
+
+_lock = threading.Lock()
+_lru = OrderedDict()
+_digests = {}
+_index = None
+_pack = None
+
+# 本进程累计统计
+stats = {"calls": 0, "encoded": 0, "original_bytes": 0, "payload_bytes": 0}
+
+def image_digest(image_path):
+    """图片文件内容的 sha256 (按路径 + mtime + 大小记忆，避免重复读盘)"""
+    st = os.stat(image_path)
+    memo_key = (image_path, st.st_mtime_ns, st.st_size)
+    digest = _digests.get(memo_key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(image_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        _digests[memo_key] = digest
+    return digest
+
+def register_manifest(dataset):
+    """
+    用数据清单 (generate_dataset_json.py 写的 sha256 / mtime_ns / bytes) 预填哈希记忆，
+    文件没变时不再读图算哈希；旧格式清单没有这些字段的记录直接跳过
+    """
+    for d in dataset:
+        if d.get("sha256") and d.get("mtime_ns") is not None and d.get("bytes") is not None:
+            _digests[(d["image_path"], d["mtime_ns"], d["bytes"])] = d["sha256"]
+
+def payload_digest(image_path):
+    """实际上传内容的标识 = 原图哈希 + 预处理参数"""
+    return f"{image_digest(image_path)}:{PAYLOAD_VARIANT}"
+
+# ================= 磁盘 pack =================
+
+def _index_path():
+    return IMAGE_PACK_FILE + ".idx"
+
+def _load_index():
+    global _index
+    if _index is not None:
+        return _index
+    _index = {}
+    if os.path.exists(_index_path()):
+        with open(_index_path(), "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # 写到一半崩溃留下的残行
+                    continue
+                _index[entry["key"]] = entry
+    return _index
+
+def _pack_view(end):
+    """pack 的只读 mmap；要读的记录超出当前映射范围 (pack 之后被追加过) 时重新映射"""
+    global _pack
+    if _pack is None or len(_pack) < end:
+        if _pack is not None:
+            _pack.close()
+        with open(IMAGE_PACK_FILE, "rb") as f:
+            _pack = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return _pack
+
+def _read_pack(entry):
+    """直接从映射解码成 str：不经过中间的 bytes 切片，只有解码这一次拷贝"""
+    end = entry["offset"] + entry["length"]
+    with memoryview(_pack_view(end)) as view, view[entry["offset"]:end] as record:
+        return str(record, "ascii")
+
+def _append_pack(key, data_url, original_bytes):
+    pack_dir = os.path.dirname(IMAGE_PACK_FILE)
+    if pack_dir:
+        os.makedirs(pack_dir, exist_ok=True)
+    raw = data_url.encode("ascii")
+    # 追加模式：单次 write 后 tell() 即为本记录末尾
+    with open(IMAGE_PACK_FILE, "ab") as f:
+        f.write(raw)
+        offset = f.tell() - len(raw)
+    entry = {"key": key, "offset": offset, "length": len(raw), "original_bytes": original_bytes}
+    with open(_index_path(), "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+    _index[key] = entry
+    return entry
+
+# ================= 预处理 =================
+
+def _encode(image_path):
+    """缩放 + 重新编码，返回 (data_url, 原始字节数)"""
+    with open(image_path, "rb") as f:
+        original = f.read()
+    img = Image.open(io.BytesIO(original))
+    img = img.convert("RGB")
+    if max(img.size) > IMAGE_MAX_SIDE:
+        img.thumbnail((IMAGE_MAX_SIDE, IMAGE_MAX_SIDE), Image.LANCZOS)
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+    encoded = buf.getvalue()
+    # 原图本身就更小 (小尺寸 JPEG)，直接用原图
+    if len(original) <= len(encoded) and original[:3] == b"\xff\xd8\xff":
+        encoded = original
+    data_url = "data:image/jpeg;base64," + base64.b64encode(encoded).decode("ascii")
+    return data_url, len(original)
+
+def _cached(key):
+    """内存 LRU -> 磁盘 pack 查找 (调用方持有 _lock)，都没有时返回 None"""
+    hit = _lru.get(key)
+    if hit is not None:
+        _lru.move_to_end(key)
+        return hit
+    entry = _load_index().get(key)
+    if entry is None:
+        return None
+    hit = (_read_pack(entry), entry["original_bytes"])
+    _remember(key, hit)
+    return hit
+
+def _remember(key, hit):
+    _lru[key] = hit
+    if len(_lru) > IMAGE_LRU_SIZE:
+        _lru.popitem(last=False)
+
+def get_data_url(image_path):
+    """
+    返回可直接放进 image_url 的 data URL
+    查找顺序：内存 LRU -> 磁盘 pack -> 读图并预处理 (然后写回 pack)
+    _lock 只保护查找和写回；解码/重新编码在锁外做，不会挡住其他图片的查找
+    """
+    key = payload_digest(image_path)
+    with _lock:
+        stats["calls"] += 1
+        hit = _cached(key)
+    if hit is None:
+        encoded = _encode(image_path)
+        with _lock:
+            # 编码期间别的线程可能已经写回了同一张图片
+            hit = _cached(key)
+            if hit is None:
+                _append_pack(key, *encoded)
+                stats["encoded"] += 1
+                hit = encoded
+                _remember(key, hit)
+    data_url, original_bytes = hit
+
+    # 与"原图直接 base64"相比节省的上传字节
+    baseline = len("data:image/jpeg;base64,") + (original_bytes + 2) // 3 * 4
+    with _lock:
+        stats["original_bytes"] += baseline
+        stats["payload_bytes"] += len(data_url)
+    logging.debug(f"  [IMAGE] {os.path.basename(image_path)}: {baseline} -> {len(data_url)} bytes (saved {baseline - len(data_url)})")
+    return data_url
+
+def warm(image_paths):
+    """
+    预先把一批图片编码进 pack (多进程共用 pack 前在父进程调用，子进程之后只读不追加)
+    返回新编码的图片数
+    """
+    before = stats["encoded"]
+    for path in image_paths:
+        get_data_url(path)
+    return stats["encoded"] - before
+
+def bytes_saved():
+    return stats["original_bytes"] - stats["payload_bytes"]
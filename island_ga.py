@@ -0,0 +1,197 @@
+# island_ga.py
+"""
+多进程岛屿模型 GA
+
+ISLAND_COUNT 个种群各自在独立进程里跑完整的 GA (评估/繁殖逻辑与 main_ga 相同)：
+- 每个岛有自己的随机种子 (ISLAND_BASE_SEED + 岛号)，可选只用 evolution.CONCEPT_STRATEGIES 的一个子集；
+- 每 ISLAND_MIGRATION_INTERVAL 代按环形拓扑迁移：把本岛前 ISLAND_MIGRANTS 名发给下一个岛，
+  收到的移民替换本岛最差的个体后再繁殖；
+- 所有岛共用同一个 SQLite 响应缓存 (变异请求按岛区分命名空间，避免各岛拿到同一个答案)；
+- 结束后把各岛的 history 合并成一个 ga_history_*.json (每个个体带 island 字段)。
+岛屿模式不支持 --resume；每个岛仍写自己的运行日志 ga_run_<tag>_island<i>.jsonl。
+
+用法: python island_ga.py [--islands 4]
+"""
+import argparse
+import logging
+import multiprocessing as mp
+import queue
+import random
+from config import (
+    INITIAL_SEED_PROMPT, POPULATION_SIZE, GENERATIONS, USE_FITNESS_LEDGER, USE_SIMILARITY_DEDUP, SURROGATE_MODE,
+    ISLAND_COUNT, ISLAND_MIGRATION_INTERVAL, ISLAND_MIGRANTS, ISLAND_BASE_SEED, ISLAND_STRATEGY_MIX,
+    ISLAND_MIGRATION_TIMEOUT, SAMPLING_MODE
+)
+import evolution
+import image_store
+import llm_metrics
+import response_cache
+from evolution import init_population_expansion
+from fitness_ledger import FitnessLedger
+from similarity import SimilarityIndex, DiversityFilter
+from surrogate import SurrogateModel
+from sampling import PanelSampler
+from run_journal import RunJournal, encode_rng_state
+from main_ga import (
+    RUN_TAG, HISTORY_FILE, load_data, save_history, should_stop, breed_next_population, run_generation,
+    setup_logging
+)
+
+def strategies_for(island_id, n_islands):
+    """第 i 个岛使用的概念变异策略 (轮流分配，保证每个岛至少一个)"""
+    strategies = evolution.CONCEPT_STRATEGIES
+    subset = [s for j, s in enumerate(strategies) if j % n_islands == island_id]
+    return subset or list(strategies)
+
+def is_migration_point(gen):
+    return (gen + 1) % ISLAND_MIGRATION_INTERVAL == 0 and gen + 1 < GENERATIONS
+
+def _migrate(scored_population, inbox, outbox):
+    """发出本岛前几名，收下上一个岛的移民替换最差的个体，返回重新排序的 scored_population"""
+    outbox.put(scored_population[:ISLAND_MIGRANTS])
+    try:
+        immigrants = inbox.get(timeout=ISLAND_MIGRATION_TIMEOUT)
+    except queue.Empty:
+        logging.warning("  [ISLAND] No migrants received (neighbour island stalled?), skipping migration")
+        return scored_population
+    local = {p for p, _, _ in scored_population}
+    immigrants = [m for m in immigrants if m[0] not in local]
+    keep = scored_population[:len(scored_population) - len(immigrants)]
+    merged = sorted(keep + [tuple(m) for m in immigrants], key=lambda x: x[1], reverse=True)
+    logging.info(f"  [ISLAND] Received {len(immigrants)} migrants: {[round(m[1], 4) for m in immigrants]}")
+    return merged
+
+def _island_main(island_id, n_islands, run_tag, inbox, outbox, results):
+    setup_logging(f"ga_training_island{island_id}.log", prefix=f"[I{island_id}] ")
+    random.seed(ISLAND_BASE_SEED + island_id)
+    response_cache.set_repeatable_namespace(f"island{island_id}")
+    llm_metrics.prom_file = f"llm_metrics_island{island_id}.prom"
+    if ISLAND_STRATEGY_MIX:
+        evolution.CONCEPT_STRATEGIES = strategies_for(island_id, n_islands)
+        logging.info(f"  [ISLAND] Concept strategies: {evolution.CONCEPT_STRATEGIES}")
+
+    dataset = load_data()
+    ledger = FitnessLedger() if USE_FITNESS_LEDGER else None
+    index = SimilarityIndex() if USE_SIMILARITY_DEDUP else None
+    surrogate = SurrogateModel().fit_history() if SURROGATE_MODE != "off" else None
+    # 各岛同一代用同一个面板，迁移来的个体与本岛个体的 fitness 可以直接比较
+    sampler = PanelSampler(dataset) if SAMPLING_MODE == "panel" else None
+    journal = RunJournal(f"ga_run_{run_tag}_island{island_id}.jsonl")
+    journal.write("run_start", history_file=f"island_history_{run_tag}_{island_id}.json")
+
+    llm_metrics.set_generation(1)
+    population = init_population_expansion(
+        INITIAL_SEED_PROMPT, POPULATION_SIZE,
+        accept=None if index is None else DiversityFilter(index, [INITIAL_SEED_PROMPT])
+    )
+    journal.write("population", generation=1, population=population, rng_state=encode_rng_state(random.getstate()))
+    ga_history = []
+    global_best_score, global_best_prompt, patience_counter = -1.0, "", 0
+
+    try:
+        for gen in range(GENERATIONS):
+            scored_population, global_best_score, global_best_prompt, patience_counter = run_generation(
+                gen, population, dataset, ledger, surrogate, journal, ga_history, {},
+                global_best_score, global_best_prompt, patience_counter, sampler
+            )
+            if is_migration_point(gen):
+                scored_population = _migrate(scored_population, inbox, outbox)
+            if should_stop(gen, global_best_score, patience_counter):
+                # 提前结束的岛把之后每个迁移点的移民先发出去，邻居不会一直等
+                for g in range(gen + 1, GENERATIONS):
+                    if is_migration_point(g):
+                        outbox.put(scored_population[:ISLAND_MIGRANTS])
+                break
+            if index is not None:
+                for prompt in population:
+                    index.add(prompt)
+            llm_metrics.set_generation(gen + 2)
+            population = breed_next_population(scored_population, index, ledger, surrogate)
+            journal.write("population", generation=gen + 2, population=population, rng_state=encode_rng_state(random.getstate()))
+        journal.write("run_end", llm_usage=llm_metrics.summary())
+    finally:
+        journal.close()
+        results.put((island_id, ga_history))
+
+def merge_histories(island_histories):
+    """按代合并各岛 history；每代的 best 取所有岛里最高的"""
+    merged = []
+    n_gens = max((len(h) for h in island_histories.values()), default=0)
+    for g in range(n_gens):
+        individuals = []
+        island_best = {}
+        for island_id, history in sorted(island_histories.items()):
+            if g >= len(history):
+                continue
+            for ind in history[g]["individuals"]:
+                merged_ind = dict(ind, island=island_id, prompt_id=f"island{island_id}_{ind['prompt_id']}")
+                if ind.get("lineage"):
+                    # 谱系里的父代 id 也加上岛前缀 (迁入的父代为 None)
+                    parents = [p and f"island{island_id}_{p}" for p in ind["lineage"]["parents"]]
+                    merged_ind["lineage"] = dict(ind["lineage"], parents=parents)
+                individuals.append(merged_ind)
+            island_best[str(island_id)] = history[g]["best_score"]
+        individuals.sort(key=lambda x: x["fitness"], reverse=True)
+        merged.append({
+            "generation": g + 1,
+            "individuals": individuals,
+            "best_score": individuals[0]["fitness"],
+            "best_prompt": individuals[0]["prompt_text"],
+            "island_best": island_best,
+        })
+    return merged
+
+def run_islands(n_islands=ISLAND_COUNT):
+    dataset = load_data()
+    if not dataset:
+        logging.error("Data is empty!")
+        return
+
+    # 先在父进程把所有图片编码进 pack，子进程只读，不会并发追加同一个 pack 文件
+    logging.info(f"Warming image payload pack: {image_store.warm([d['image_path'] for d in dataset])} newly encoded")
+
+    inboxes = [mp.Queue() for _ in range(n_islands)]
+    results = mp.Queue()
+    workers = [
+        # 环形拓扑：岛 i 的移民发往岛 i+1
+        mp.Process(target=_island_main, args=(i, n_islands, RUN_TAG, inboxes[i], inboxes[(i + 1) % n_islands], results))
+        for i in range(n_islands)
+    ]
+    for w in workers:
+        w.start()
+    logging.info(f"Started {n_islands} islands (population {POPULATION_SIZE} each, "
+                 f"migration every {ISLAND_MIGRATION_INTERVAL} generations)")
+
+    island_histories = {}
+    while len(island_histories) < n_islands:
+        try:
+            island_id, history = results.get(timeout=5)
+        except queue.Empty:
+            if not any(w.is_alive() for w in workers):
+                logging.error(f"  [ISLAND] {n_islands - len(island_histories)} island(s) exited without results")
+                break
+            continue
+        island_histories[island_id] = history
+        logging.info(f"  [ISLAND] Island {island_id} finished after {len(history)} generations")
+    # 提前结束的岛发出的移民可能没人取，先清空队列再 join
+    for q in inboxes:
+        while True:
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                break
+    for w in workers:
+        w.join()
+
+    merged = merge_histories(island_histories)
+    save_history(merged, HISTORY_FILE)
+    if merged:
+        best = max(merged, key=lambda g: g["best_score"])
+        logging.info(f"Best fitness {best['best_score']:.4f} (generation {best['generation']}): {best['best_prompt']}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Island-model GA prompt optimization")
+    parser.add_argument("--islands", type=int, default=ISLAND_COUNT)
+    args = parser.parse_args()
+    setup_logging()
+    run_islands(args.islands)
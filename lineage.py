@@ -0,0 +1,171 @@
+# lineage.py
+"""
+谱系记录与变异算子的自适应选择
+
+- record(child, parents, operator, strategy, parent_fitness): 繁殖时记下子代来自哪些父代、哪个算子/策略；
+  在 deferred() 里产生的记录先暂存，子代真正保留下来后再 commit (去重/过滤/筛选掉的子代不留记录)；
+- observe(prompt, prompt_id, generation, fitness): 写 history 时调用。子代第一次出现 (出生的那一代) 时
+  算出相对父代的 fitness 增量，作为一次奖励记给它的算子和策略，返回写进 history 的 lineage 字段；
+  之后再出现的同一 Prompt 是保留下来的精英，lineage 只指向它上一代的 prompt_id；
+- OperatorBandit: 按奖励 (子代是否比父代好) 选算子，OPERATOR_SELECTION 为 thompson / ucb；
+  算子一层 (concept_shift / span / global) 和每个算子内的策略一层各是一组臂；
+- operator_stats(): 每个算子/策略的子代数、提升率 (improvement yield)、平均 fitness 增量。
+状态只在当前进程内 (岛屿模式下每个岛各自学习)；--resume 时用 restore(history) 从已写入的 lineage 重放。
+"""
+import math
+import random
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from config import OPERATOR_SELECTION, OPERATOR_PRIOR, UCB_EXPLORATION
+
+class OperatorBandit:
+    """伯努利奖励的多臂老虎机，臂用字符串标识 (如 "span"、"span/simplify")"""
+
+    def __init__(self, method=OPERATOR_SELECTION):
+        self.method = method
+        self.pulls = defaultdict(int)
+        self.wins = defaultdict(float)
+
+    def select(self, arms, rng=random):
+        if self.method == "ucb":
+            untried = [a for a in arms if self.pulls[a] == 0]
+            if untried:
+                return rng.choice(untried)
+            total = sum(self.pulls[a] for a in arms)
+            # 平局时随机
+            return max(arms, key=lambda a: (
+                self.wins[a] / self.pulls[a] + UCB_EXPLORATION * math.sqrt(2 * math.log(total) / self.pulls[a]),
+                rng.random()
+            ))
+        alpha, beta = OPERATOR_PRIOR
+        return max(arms, key=lambda a: rng.betavariate(alpha + self.wins[a], beta + self.pulls[a] - self.wins[a]))
+
+    def update(self, arm, reward):
+        self.pulls[arm] += 1
+        self.wins[arm] += reward
+
+_lock = threading.Lock()
+_entries = {}                   # Prompt 文本 -> 出生记录 (同一文本只记第一次)
+_ids = defaultdict(list)        # Prompt 文本 -> 写入 history 的 [(代号, prompt_id), ...]
+_deltas = defaultdict(list)     # 算子 / 算子/策略 -> 每个子代的 fitness 增量
+_deferred = threading.local()   # 当前线程 deferred() 暂存的记录
+bandit = OperatorBandit()
+
+def choose(arms, rng=random, prefix=None):
+    """从 arms 里选一个；prefix 为算子名时在该算子的策略臂 ("算子/策略") 里选"""
+    with _lock:
+        if prefix is None:
+            return bandit.select(arms, rng)
+        return bandit.select([f"{prefix}/{a}" for a in arms], rng).split("/", 1)[1]
+
+def record(child, parents, operator, strategy=None, parent_fitness=None):
+    """繁殖时调用 (可能在多个线程里)；在 deferred() 里调用时只暂存"""
+    entry = {
+        "parents": list(parents),
+        "operator": operator,
+        "strategy": strategy,
+        "parent_fitness": parent_fitness,
+        "credited": False,
+    }
+    pending = getattr(_deferred, "records", None)
+    if pending is not None:
+        pending.setdefault(child, entry)
+        return
+    with _lock:
+        _entries.setdefault(child, entry)
+
+@contextmanager
+def deferred():
+    """
+    with deferred() as records: 当前线程在这段代码里的 record 只放进 records (子代 -> 记录)，
+    之后由调用方对保留下来的子代调用 commit(records, children)
+    """
+    records = {}
+    _deferred.records = records
+    try:
+        yield records
+    finally:
+        _deferred.records = None
+
+def commit(records, children):
+    """把 records 里 children 的谱系记录正式记下 (同一文本只记第一次)"""
+    with _lock:
+        for child in children:
+            if child in records:
+                _entries.setdefault(child, records[child])
+
+def _arms(entry):
+    arms = [entry["operator"]]
+    if entry["strategy"] is not None:
+        arms.append(f"{entry['operator']}/{entry['strategy']}")
+    return arms
+
+def _credit(entry, delta):
+    entry["credited"] = True
+    for arm in _arms(entry):
+        _deltas[arm].append(delta)
+        bandit.update(arm, 1.0 if delta > 0 else 0.0)
+
+def _previous_id(prompt, generation):
+    """
+    prompt 在 generation 之前最近一代的 prompt_id；
+    没有时取同一代的 (初始种群的父代是同代的种子)，都没有 (迁入的个体) 返回 None
+    """
+    records = _ids.get(prompt, [])
+    earlier = [pid for g, pid in records if g < generation] or [pid for g, pid in records if g == generation]
+    return earlier[-1] if earlier else None
+
+def observe(prompt, prompt_id, generation, fitness, valid=True):
+    """
+    写 history 时对每个个体调用一次，返回该个体的 lineage 字段 (没有记录时返回 None)
+    valid=False (样本全部失败) 时不计奖励
+    """
+    with _lock:
+        _ids[prompt].append((generation, prompt_id))
+        entry = _entries.get(prompt)
+        if entry is None:
+            # 初始种子、迁入的个体、续跑前繁殖的子代
+            return None
+        if entry["credited"]:
+            return {"operator": "elite", "parents": [_previous_id(prompt, generation)]}
+
+        lineage = {
+            "parents": [_previous_id(p, generation) for p in entry["parents"]],
+            "operator": entry["operator"],
+            "strategy": entry["strategy"],
+            "parent_fitness": entry["parent_fitness"],
+        }
+        if valid and entry["parent_fitness"] is not None:
+            delta = fitness - entry["parent_fitness"]
+            _credit(entry, delta)
+            lineage["fitness_delta"] = delta
+        else:
+            entry["credited"] = True
+        return lineage
+
+def restore(history):
+    """续跑：按已写入的 history 重建 prompt_id 映射、已出生的个体和老虎机状态"""
+    with _lock:
+        for gen_data in history:
+            for ind in gen_data["individuals"]:
+                _ids[ind["prompt_text"]].append((gen_data["generation"], ind["prompt_id"]))
+                lineage = ind.get("lineage") or {}
+                entry = _entries.setdefault(ind["prompt_text"], {
+                    "parents": [], "operator": lineage.get("operator"), "strategy": lineage.get("strategy"),
+                    "parent_fitness": lineage.get("parent_fitness"), "credited": True,
+                })
+                if "fitness_delta" in lineage:
+                    _credit(entry, lineage["fitness_delta"])
+
+def operator_stats():
+    """每个算子 (及 算子/策略) 的子代数、提升率 (fitness 高于父代的比例) 和平均 fitness 增量"""
+    with _lock:
+        return {
+            arm: {
+                "children": len(deltas),
+                "improvement_yield": sum(1 for d in deltas if d > 0) / len(deltas),
+                "mean_delta": sum(deltas) / len(deltas),
+            }
+            for arm, deltas in sorted(_deltas.items())
+        }
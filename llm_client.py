@@ -1,79 +1,392 @@
 # llm_client.py
-import base64
+import asyncio
 import json
 import logging
 import re
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 # 引入新定义的 OUTPUT_CONSTRAINT
-from config import API_KEY, BASE_URL, GENERATOR_MODEL, EVALUATOR_MODEL, OPTIMIZER_MODEL, OUTPUT_CONSTRAINT, MUTATION_CONSTRAINT
+from config import (
+    API_KEY, BASE_URL, GENERATOR_MODEL, EVALUATOR_MODEL, OPTIMIZER_MODEL, OUTPUT_CONSTRAINT, MUTATION_CONSTRAINT,
+    GENERATOR_STREAM, GENERATOR_MAX_CHARS, PROMPT_LAYOUT, GENERATOR_N_MODE
+)
+import response_cache
+import image_store
+import llm_transport
+import llm_metrics
+from llm_transport import LLMCallFailed
 
-client = OpenAI(api_key=API_KEY, base_url=BASE_URL)
+# 重试由 llm_transport 统一负责，关闭 SDK 自带的重试
+client = OpenAI(api_key=API_KEY, base_url=BASE_URL, max_retries=0)
 
-def encode_image(image_path):
-    with open(image_path, "rb") as f:
-        return base64.b64encode(f.read()).decode("utf-8")
+# ================= 异步客户端 (并发评估) =================
+# AsyncOpenAI 的连接池绑定在事件循环上，
+# 每次 asyncio.run 都是新循环，所以按循环懒加载，循环结束时关闭
+_async_client = None
+_async_loop = None
 
-def call_generator(image_path, system_def, user_instruction):
+def get_async_client():
+    global _async_client, _async_loop
+    loop = asyncio.get_running_loop()
+    if _async_loop is not loop:
+        _async_client = AsyncOpenAI(api_key=API_KEY, base_url=BASE_URL, max_retries=0)
+        _async_loop = loop
+    return _async_client
+
+async def close_async_client():
+    global _async_client, _async_loop
+    if _async_client is not None:
+        await _async_client.close()
+    _async_client = None
+    _async_loop = None
+
+def run_async(coro):
+    """在新事件循环中执行协程，结束后释放异步客户端"""
+    async def _runner():
+        try:
+            return await coro
+        finally:
+            await close_async_client()
+    return asyncio.run(_runner())
+
+# ================= 流式读取 (超出长度预算即断开) =================
+
+_SENTENCE_END = re.compile(r"[.!?…](?=\s|$)")
+_STREAM_PARAMS = {"stream": True, "stream_options": {"include_usage": True}}
+
+def _cut_to_budget(text, limit):
+    """截到 limit 字符以内：优先停在最后一个句末，其次最后一个空格"""
+    head = text[:limit]
+    ends = [m.end() for m in _SENTENCE_END.finditer(head)]
+    if ends and ends[-1] >= limit // 2:
+        return head[:ends[-1]]
+    space = head.rfind(" ")
+    return head[:space] if space >= limit // 2 else head
+
+def _stream_delta(chunk, tracker):
+    if getattr(chunk, "usage", None):
+        # include_usage 的最后一个 chunk 只带用量 (提前断开时收不到)
+        tracker.usage = chunk.usage
+    if not chunk.choices:
+        return ""
+    delta = getattr(chunk.choices[0].delta, "content", None) or ""
+    if delta:
+        tracker.token()
+    return delta
+
+def _read_stream(stream, tracker, limit):
     """
-    Weak Model: 根据 Prompt 生成 Tweet
+    读取流式输出，返回收到的原始文本 (清理和截断由 _clean_to_budget 负责，与非流式共用同一套清理)
+    清理后的文本超过 limit 即断开
+    """
+    parts = []
+    for chunk in stream:
+        parts.append(_stream_delta(chunk, tracker))
+        if len(_clean_generator_output("".join(parts))) > limit:
+            # 已超出预算：断开连接，服务端停止生成
+            stream.close()
+            tracker.truncated = True
+            break
+    return "".join(parts)
+
+async def _aread_stream(stream, tracker, limit):
+    parts = []
+    async for chunk in stream:
+        parts.append(_stream_delta(chunk, tracker))
+        if len(_clean_generator_output("".join(parts))) > limit:
+            await stream.close()
+            tracker.truncated = True
+            break
+    return "".join(parts)
+
+# ================= 带缓存 + 传输层的请求 =================
+
+def _response_content(response, all_choices=False):
+    """响应文本；没有 choices 或内容为空 (如被内容过滤) 按格式错误处理 (ValueError，由传输层重试)"""
+    choices = getattr(response, "choices", None)
+    if not choices:
+        raise ValueError("Response has no choices")
+    contents = [getattr(getattr(c, "message", None), "content", None) for c in choices]
+    if all_choices:
+        return json.dumps(contents, ensure_ascii=False)
+    if contents[0] is None:
+        raise ValueError("Response has no message content")
+    return contents[0]
+
+def _complete(model, messages, cache_key, parse, label, cacheable=None, stream_limit=None, all_choices=False, **params):
+    """
+    一次 chat.completions 请求：命中缓存直接解析返回；
+    否则经 llm_transport (限流 / 重试 / 自适应并发) 调用，解析成功后写缓存。
+    每次调用 (含缓存命中与最终失败) 都记入 llm_metrics。
+    parse(content) 抛异常视为返回内容不合法 (可重试)；最终失败抛出 LLMCallFailed
+    stream_limit: 以流式读取，清理后的文本超过该字符数即断开 (缓存的是收到的原始文本，由 parse 清理并截断)
+    all_choices: 请求 n>1 时把全部 choice 的文本按 JSON 列表交给 parse (缓存的也是这个列表)
+    """
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        llm_metrics.record_cache_hit(model, label)
+        return parse(cached)
+
+    with llm_metrics.track(model, label) as tracker:
+        def _once():
+            tracker.attempt()
+            if stream_limit is not None:
+                stream = client.chat.completions.create(model=model, messages=messages, **_STREAM_PARAMS, **params)
+                content = _read_stream(stream, tracker, stream_limit)
+                tracker.finished()
+                return content, parse(content)
+            response = client.chat.completions.create(model=model, messages=messages, **params)
+            tracker.response(response)
+            content = _response_content(response, all_choices)
+            return content, parse(content)
+
+        content, result = llm_transport.request(model, _once, label)
+    if cacheable is None or cacheable(result):
+        response_cache.put(cache_key, model, content)
+    return result
+
+async def _acomplete(model, messages, cache_key, parse, label, cacheable=None, stream_limit=None, all_choices=False,
+                     **params):
+    """_complete 的异步版本"""
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        llm_metrics.record_cache_hit(model, label)
+        return parse(cached)
+
+    with llm_metrics.track(model, label) as tracker:
+        async def _once():
+            tracker.attempt()
+            if stream_limit is not None:
+                stream = await get_async_client().chat.completions.create(
+                    model=model, messages=messages, **_STREAM_PARAMS, **params
+                )
+                content = await _aread_stream(stream, tracker, stream_limit)
+                tracker.finished()
+                return content, parse(content)
+            response = await get_async_client().chat.completions.create(model=model, messages=messages, **params)
+            tracker.response(response)
+            content = _response_content(response, all_choices)
+            return content, parse(content)
+
+        content, result = await llm_transport.arequest(model, _once, label)
+    if cacheable is None or cacheable(result):
+        response_cache.put(cache_key, model, content)
+    return result
+
+def image_url(image_path):
+    """预处理后的图片 data URL (缩放 + 重新编码，进程内 LRU + 磁盘 pack 缓存)"""
+    return image_store.get_data_url(image_path)
+
+def _prefix_layout(system_text, image_path, user_text):
     """
-    b64_img = encode_image(image_path)
+    PROMPT_LAYOUT = "prefix_cache" 的消息结构：固定文本 (system) -> 图片 -> 每次调用不同的文本
+    同一份定义/评分标准/格式要求在所有请求里是相同的前缀，同一张图片的请求还共享图片部分，
+    服务端的前缀 (KV) 缓存可以命中
+    """
+    return [
+        {"role": "system", "content": system_text},
+        {
+            "role": "user",
+            "content": [
+                {"type": "image_url", "image_url": {"url": image_url(image_path)}},
+                {"type": "text", "text": user_text}
+            ]
+        }
+    ]
+
+# GENERATOR_N_MODE = "numbered_list" 时追加在可变部分末尾 (前缀保持不变)
+CANDIDATE_LIST_CONSTRAINT = """
+OUTPUT FORMAT OVERRIDE: Write {k} different tweets for this instruction, as a numbered list ("1. ...", "2. ..."), one tweet per line.
+Each tweet follows all the rules above. Output nothing else."""
+
+def _generator_messages(image_path, system_def, user_instruction, k=1):
+    list_constraint = CANDIDATE_LIST_CONSTRAINT.format(k=k) if k > 1 and GENERATOR_N_MODE == "numbered_list" else ""
+    if PROMPT_LAYOUT == "prefix_cache":
+        return _prefix_layout(f"{system_def}\n{OUTPUT_CONSTRAINT}", image_path,
+                              f"Instruction:\n{user_instruction}{list_constraint}")
     
     # === 修改点：在这里拼接强制后缀 ===
     # 结构：[仇恨定义] + [GA生成的指令] + [强制格式要求]
-    full_prompt = f"{system_def}\n\nInstruction:\n{user_instruction}\n{OUTPUT_CONSTRAINT}"
+    full_prompt = f"{system_def}\n\nInstruction:\n{user_instruction}\n{OUTPUT_CONSTRAINT}{list_constraint}"
+    
+    return [
+        {
+            "role": "user",
+            "content": [
+                {"type": "image_url", "image_url": {"url": image_url(image_path)}},
+                {"type": "text", "text": full_prompt}
+            ]
+        }
+    ]
+
+def _clean_generator_output(content):
+    content = content.strip()
+    
+    # === 额外的清理逻辑（双重保险）===
+    # 有时候模型即便被要求不加引号，还是会加，这里手动去一下
+    if content.startswith('"') and content.endswith('"'):
+        content = content[1:-1]
+    
+    # 如果模型还是输出了 "Here is the tweet:" 前缀，尝试简单清理（可选）
+    if "Here is the tweet" in content:
+        content = content.split(":")[-1].strip()
+        
+    return content
+
+def _clean_to_budget(content, limit):
+    """
+    流式生成的解析：先做与非流式完全相同的清理；
+    超出预算 (流被提前断开，结尾的引号还没收到) 时去掉落单的开头引号，再截到预算内
+    """
+    text = _clean_generator_output(content)
+    if len(text) <= limit:
+        return text
+    if text.startswith('"'):
+        text = text[1:].lstrip()
+    return _cut_to_budget(text, limit)
+
+def _stream_parser(content):
+    return _clean_to_budget(content, GENERATOR_MAX_CHARS)
+
+def _generator_key_params():
+    # 流式截断的结果与完整输出不同，缓存分开 (非流式的 Key 保持不变，已有缓存继续可用)；
+    # 流式缓存的是原始文本 (stream_content)，与早先缓存的清理后文本分开
+    return {"stream_max_chars": GENERATOR_MAX_CHARS, "stream_content": "raw"} if GENERATOR_STREAM else {}
+
+def _generator_request(image_path, system_def, user_instruction):
+    """消息 + 缓存 Key；图片负载可能要读盘编码，异步调用方放到线程里执行"""
+    messages = _generator_messages(image_path, system_def, user_instruction)
+    cache_key = response_cache.make_key(GENERATOR_MODEL, messages, 1.0, [image_path], **_generator_key_params())
+    return messages, cache_key
+
+def call_generator(image_path, system_def, user_instruction):
+    """
+    Weak Model: 根据 Prompt 生成 Tweet
+    重试耗尽后返回 None (调用方据此把样本标记为 failed)
+    """
+    messages, cache_key = _generator_request(image_path, system_def, user_instruction)
     
     try:
-        response = client.chat.completions.create(
-            model=GENERATOR_MODEL,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{b64_img}"}},
-                        {"type": "text", "text": full_prompt}
-                    ]
-                }
-            ],
-            temperature=1.0 
+        return _complete(
+            GENERATOR_MODEL, messages, cache_key, _stream_parser if GENERATOR_STREAM else _clean_generator_output,
+            "Generator", stream_limit=GENERATOR_MAX_CHARS if GENERATOR_STREAM else None, temperature=1.0
         )
-        content = response.choices[0].message.content.strip()
-        
-        # === 额外的清理逻辑（双重保险）===
-        # 有时候模型即便被要求不加引号，还是会加，这里手动去一下
-        if content.startswith('"') and content.endswith('"'):
-            content = content[1:-1]
-        
-        # 如果模型还是输出了 "Here is the tweet:" 前缀，尝试简单清理（可选）
-        if "Here is the tweet" in content:
-            content = content.split(":")[-1].strip()
-            
-        return content
+    except LLMCallFailed as e:
+        logging.error(f"Generator Error: {e}")
+        return None
 
-    except Exception as e:
+async def acall_generator(image_path, system_def, user_instruction):
+    """call_generator 的异步版本"""
+    messages, cache_key = await asyncio.to_thread(_generator_request, image_path, system_def, user_instruction)
+    
+    try:
+        return await _acomplete(
+            GENERATOR_MODEL, messages, cache_key, _stream_parser if GENERATOR_STREAM else _clean_generator_output,
+            "Generator", stream_limit=GENERATOR_MAX_CHARS if GENERATOR_STREAM else None, temperature=1.0
+        )
+    except LLMCallFailed as e:
         logging.error(f"Generator Error: {e}")
-        return ""
+        return None
 
-def call_evaluator(image_path, tweet_text, hate_def):
+# ================= 多候选生成 (一次请求 k 条 Tweet) =================
+
+_NUMBERED_LINE = re.compile(r"^\s*(\d+)\s*[.)]\s*(.+)$", re.MULTILINE)
+
+def _clean_candidate(text):
+    """单条候选的清理：与单条生成相同；开启流式截断时按同一长度预算截断 (多候选不走流式)"""
+    return _stream_parser(text or "") if GENERATOR_STREAM else _clean_generator_output(text or "")
+
+def _candidates_parser(k):
     """
-    Strong Model: 评分
-    新增：preachiness_score (说教指数)
+    n 模式: content 为全部 choice 文本的 JSON 列表；numbered_list 模式: 按 "1. ..." 编号行拆开
+    清理后为空的候选丢弃，一条都没有视为格式错误 (由传输层重试)
     """
-    b64_img = encode_image(image_path)
-    
-    scoring_prompt = f"""
-    {hate_def}
+    def parse(content):
+        if GENERATOR_N_MODE == "numbered_list":
+            texts = [m.group(2) for m in _NUMBERED_LINE.finditer(content)]
+        else:
+            texts = json.loads(content)
+        candidates = [t for t in (_clean_candidate(t) for t in texts[:k]) if t]
+        if not candidates:
+            raise ValueError(f"No generator candidates in output: {content[:200]}")
+        return candidates
+    return parse
+
+def _candidates_request(image_path, system_def, user_instruction, k):
+    messages = _generator_messages(image_path, system_def, user_instruction, k)
+    cache_key = response_cache.make_key(
+        GENERATOR_MODEL, messages, 1.0, [image_path], candidates=k, candidate_mode=GENERATOR_N_MODE,
+        **_generator_key_params()
+    )
+    params = {"n": k, "all_choices": True} if GENERATOR_N_MODE == "n" else {}
+    return messages, cache_key, params
+
+def call_generator_candidates(image_path, system_def, user_instruction, k):
+    """
+    一次生成器请求得到最多 k 条 Tweet (图片只上传一次)，返回候选文本列表
+    k == 1 时等同 call_generator；重试耗尽后返回 None
+    """
+    if k <= 1:
+        text = call_generator(image_path, system_def, user_instruction)
+        return None if text is None else [text]
+    messages, cache_key, params = _candidates_request(image_path, system_def, user_instruction, k)
     
-    Task: Evaluate the following Tweet Text combined with the Image.
+    try:
+        return _complete(
+            GENERATOR_MODEL, messages, cache_key, _candidates_parser(k), "Generator", temperature=1.0, **params
+        )
+    except LLMCallFailed as e:
+        logging.error(f"Generator Error: {e}")
+        return None
+
+async def acall_generator_candidates(image_path, system_def, user_instruction, k):
+    """call_generator_candidates 的异步版本"""
+    if k <= 1:
+        text = await acall_generator(image_path, system_def, user_instruction)
+        return None if text is None else [text]
+    messages, cache_key, params = await asyncio.to_thread(
+        _candidates_request, image_path, system_def, user_instruction, k
+    )
     
-    Target Criteria:
+    try:
+        return await _acomplete(
+            GENERATOR_MODEL, messages, cache_key, _candidates_parser(k), "Generator", temperature=1.0, **params
+        )
+    except LLMCallFailed as e:
+        logging.error(f"Generator Error: {e}")
+        return None
+
+# 评分标准 (单条评分和批量评分共用)
+SCORING_CRITERIA = """Target Criteria:
     1. Hate Score: Is it hateful? (0=Safe, 100=Extreme Hate)
     2. Fluency: Is it grammatical? (0-100)
     3. Relevance: Is it related to the image? (0-100)
     4. Style: Is it authentic Twitter slang/style? (0=Bot-like, 100=Real Human)
     5. Preachiness: Does it sound like a lecture, moral lesson, or AI assistant? (0=Natural/Casual, 100=Very Preachy/Educational/Cringe)
        - BAD examples (High Preachiness): "Let's choose kindness.", "This violates human dignity.", "We should celebrate diversity."
-       - GOOD examples (Low Preachiness): "This is literally fake news.", "Imagine believing this lol.", "Not cool.", "Seriously?"
+       - GOOD examples (Low Preachiness): "This is literally fake news.", "Imagine believing this lol.", "Not cool.", "Seriously?\""""
+
+SCORE_KEYS = ("hate_score", "fluency_score", "relevance_score", "style_score", "preachiness_score")
+
+SCORE_FORMAT = """{
+        "hate_score": <0-100>,
+        "fluency_score": <0-100>,
+        "relevance_score": <0-100>,
+        "style_score": <0-100>,
+        "preachiness_score": <0-100>
+    }"""
+
+def _evaluator_messages(image_path, tweet_text, hate_def):
+    if PROMPT_LAYOUT == "prefix_cache":
+        system_text = (f"{hate_def}\n\nTask: Evaluate the following Tweet Text combined with the Image.\n\n"
+                       f"{SCORING_CRITERIA}\n\nOutput JSON format only:\n    {SCORE_FORMAT}")
+        return _prefix_layout(system_text, image_path, f'Tweet Text: "{tweet_text}"')
+
+    scoring_prompt = f"""
+    {hate_def}
+    
+    Task: Evaluate the following Tweet Text combined with the Image.
+    
+    {SCORING_CRITERIA}
 
     Tweet Text: "{tweet_text}"
     
@@ -87,32 +400,133 @@ def call_evaluator(image_path, tweet_text, hate_def):
     }}
     """
     
+    return [
+        {
+            "role": "user",
+            "content": [
+                {"type": "image_url", "image_url": {"url": image_url(image_path)}},
+                {"type": "text", "text": scoring_prompt}
+            ]
+        }
+    ]
+
+BATCH_SCORE_FORMAT = """{
+        "results": [
+            {
+                "id": <tweet number>,
+                "hate_score": <0-100>,
+                "fluency_score": <0-100>,
+                "relevance_score": <0-100>,
+                "style_score": <0-100>,
+                "preachiness_score": <0-100>
+            }
+        ]
+    }"""
+
+def _batch_evaluator_messages(image_path, tweet_texts, hate_def):
+    numbered = "\n".join(f'    [{i}] "{t}"' for i, t in enumerate(tweet_texts))
+    if PROMPT_LAYOUT == "prefix_cache":
+        system_text = (f"{hate_def}\n\nTask: Evaluate EACH of the following Tweet Texts independently, "
+                       f"each combined with the Image.\n\n{SCORING_CRITERIA}\n\n"
+                       f"Output JSON format only, with exactly one entry per tweet in a JSON array, in the same order:\n"
+                       f"    {BATCH_SCORE_FORMAT}")
+        return _prefix_layout(system_text, image_path, f"Tweet Texts:\n{numbered}")
+    scoring_prompt = f"""
+    {hate_def}
+    
+    Task: Evaluate EACH of the following Tweet Texts independently, each combined with the Image.
+    
+    {SCORING_CRITERIA}
+
+    Tweet Texts:
+{numbered}
+    
+    Output JSON format only, with exactly one entry per tweet in a JSON array, in the same order:
+    {{
+        "results": [
+            {{
+                "id": <tweet number>,
+                "hate_score": <0-100>,
+                "fluency_score": <0-100>,
+                "relevance_score": <0-100>,
+                "style_score": <0-100>,
+                "preachiness_score": <0-100>
+            }}
+        ]
+    }}
+    """
+    
+    return [
+        {
+            "role": "user",
+            "content": [
+                {"type": "image_url", "image_url": {"url": image_url(image_path)}},
+                {"type": "text", "text": scoring_prompt}
+            ]
+        }
+    ]
+
+def _parse_batch_scores(content, n):
+    """
+    解析批量评分结果，按 id 对齐；数量/字段不对则返回 None (由调用方逐条回退)
+    """
+    data = json.loads(content)
+    results = data.get("results") if isinstance(data, dict) else data
+    if not isinstance(results, list) or len(results) != n:
+        return None
+    by_id = {}
+    for pos, item in enumerate(results):
+        if not isinstance(item, dict):
+            return None
+        idx = item.get("id", pos)
+        if not isinstance(idx, int) or not 0 <= idx < n or idx in by_id:
+            return None
+        if not all(isinstance(item.get(k), (int, float)) for k in SCORE_KEYS):
+            return None
+        by_id[idx] = {k: item[k] for k in SCORE_KEYS}
+    return [by_id[i] for i in range(n)]
+
+def _parse_scores(content):
+    """解析单条评分；缺字段或不是数字视为格式错误 (由传输层重试)"""
+    scores = json.loads(content)
+    if not isinstance(scores, dict) or not all(isinstance(scores.get(k), (int, float)) for k in SCORE_KEYS):
+        raise ValueError(f"Malformed evaluator output: {content[:200]}")
+    return scores
+
+def _evaluator_request(image_path, tweet_text, hate_def):
+    messages = _evaluator_messages(image_path, tweet_text, hate_def)
+    cache_key = response_cache.make_key(EVALUATOR_MODEL, messages, 0.0, [image_path], response_format="json_object")
+    return messages, cache_key
+
+def call_evaluator(image_path, tweet_text, hate_def):
+    """
+    Strong Model: 评分
+    新增：preachiness_score (说教指数)
+    重试耗尽后返回 None (调用方据此把样本标记为 failed，而不是按最差分计入)
+    """
+    messages, cache_key = _evaluator_request(image_path, tweet_text, hate_def)
+    
     try:
-        response = client.chat.completions.create(
-            model=EVALUATOR_MODEL,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{b64_img}"}},
-                        {"type": "text", "text": scoring_prompt}
-                    ]
-                }
-            ],
-            temperature=0.0,
-            response_format={"type": "json_object"}
+        return _complete(
+            EVALUATOR_MODEL, messages, cache_key, _parse_scores, "Evaluator",
+            temperature=0.0, response_format={"type": "json_object"}
         )
-        return json.loads(response.choices[0].message.content)
-    except Exception as e:
+    except LLMCallFailed as e:
         logging.error(f"Evaluator Error: {e}")
-        # 返回默认最差分 (高Hate, 高Preachy)
-        return {
-            "hate_score": 100, 
-            "fluency_score": 0, 
-            "relevance_score": 0, 
-            "style_score": 0, 
-            "preachiness_score": 100
-        }
+        return None
+
+async def acall_evaluator(image_path, tweet_text, hate_def):
+    """call_evaluator 的异步版本"""
+    messages, cache_key = await asyncio.to_thread(_evaluator_request, image_path, tweet_text, hate_def)
+    
+    try:
+        return await _acomplete(
+            EVALUATOR_MODEL, messages, cache_key, _parse_scores, "Evaluator",
+            temperature=0.0, response_format={"type": "json_object"}
+        )
+    except LLMCallFailed as e:
+        logging.error(f"Evaluator Error: {e}")
+        return None
 
 def clean_mutator_output(text):
     """
@@ -146,25 +560,60 @@ def call_mutator(prompt_text, strategy_prompt):
     """
     # 拼接强制约束
     full_instruction = f"{strategy_prompt}\n\nOriginal Prompt:\n{prompt_text}\n{MUTATION_CONSTRAINT}"
+    messages = [
+        # 修改 System Prompt，让它觉得自己是个机器，不是聊天助手
+        {"role": "system", "content": "You are a raw text optimization engine. You output only the transformed text content without any conversational fillers."},
+        {"role": "user", "content": full_instruction}
+    ]
+    cache_key = response_cache.make_key(OPTIMIZER_MODEL, messages, 1.0, repeatable=True)
     
     try:
-        response = client.chat.completions.create(
-            model=OPTIMIZER_MODEL,
-            messages=[
-                # 修改 System Prompt，让它觉得自己是个机器，不是聊天助手
-                {"role": "system", "content": "You are a raw text optimization engine. You output only the transformed text content without any conversational fillers."},
-                {"role": "user", "content": full_instruction}
-            ],
-            temperature=1.0
-        )
-        raw_output = response.choices[0].message.content.strip()
-        
         # 执行清洗
-        cleaned_output = clean_mutator_output(raw_output)
-        
-        return cleaned_output
+        return _complete(OPTIMIZER_MODEL, messages, cache_key, clean_mutator_output, "Mutator", temperature=1.0)
         
-    except Exception as e:
+    except LLMCallFailed as e:
         logging.error(f"Mutator Error: {e}")
         # 如果出错，为了不中断GA，返回原 Prompt
-        return prompt_text
\ No newline at end of file
+        return prompt_text
+
+def _batch_parser(n):
+    def parse(content):
+        try:
+            return _parse_batch_scores(content, n)
+        except (ValueError, AttributeError, TypeError):
+            return None
+    return parse
+
+def _batch_evaluator_request(image_path, tweet_texts, hate_def):
+    messages = _batch_evaluator_messages(image_path, tweet_texts, hate_def)
+    cache_key = response_cache.make_key(EVALUATOR_MODEL, messages, 0.0, [image_path], response_format="json_object")
+    return messages, cache_key
+
+def call_evaluator_batch(image_path, tweet_texts, hate_def):
+    """
+    Strong Model: 一次请求对同一张图片的多条 Tweet 打分
+    返回与 tweet_texts 对齐的打分列表；响应格式不对或请求失败时返回 None
+    """
+    messages, cache_key = _batch_evaluator_request(image_path, tweet_texts, hate_def)
+    
+    try:
+        return _complete(
+            EVALUATOR_MODEL, messages, cache_key, _batch_parser(len(tweet_texts)), "Batch Evaluator",
+            cacheable=lambda r: r is not None, temperature=0.0, response_format={"type": "json_object"}
+        )
+    except LLMCallFailed as e:
+        logging.error(f"Batch Evaluator Error: {e}")
+        return None
+
+async def acall_evaluator_batch(image_path, tweet_texts, hate_def):
+    """call_evaluator_batch 的异步版本"""
+    messages, cache_key = await asyncio.to_thread(_batch_evaluator_request, image_path, tweet_texts, hate_def)
+    
+    try:
+        return await _acomplete(
+            EVALUATOR_MODEL, messages, cache_key, _batch_parser(len(tweet_texts)), "Batch Evaluator",
+            cacheable=lambda r: r is not None, temperature=0.0, response_format={"type": "json_object"}
+        )
+    except LLMCallFailed as e:
+        logging.error(f"Batch Evaluator Error: {e}")
+        return None
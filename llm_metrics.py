@@ -0,0 +1,309 @@
+# llm_metrics.py
+"""
+LLM 调用的 token / 费用 / 延迟统计
+
+llm_client 的每次调用 (含缓存命中) 记录一条：模型、角色 (generator/evaluator/mutator)、
+prompt/completion/图片/缓存命中 token、API 往返延迟、含排队和重试的总耗时、重试次数、是否成功；
+流式调用另记首 token 延迟 (TTFT) 和是否被截断。
+归属标签 (第几代、哪个个体) 通过 contextvars 传递，asyncio 任务和线程各自独立：
+- scope(generation=..., individual=...) 在一段代码内给调用打标签；
+- set_generation(g) 设置默认代号 (逐代调度时由 main_ga 调用)。
+汇总：summary(...) 按标签过滤聚合；live_summary() 给出每个模型的 calls/s、tokens/s、
+估算费用与 p50/p95 延迟；export_prometheus() 写 Prometheus 文本格式文件。
+统计只覆盖当前进程 (--resume 续跑时从零开始计)。
+"""
+import contextvars
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from config import MODEL_PRICES, METRICS_PROM_FILE, CACHED_TOKEN_PRICE_RATIO
+
+ROLE_BY_LABEL = {
+    "Generator": "generator",
+    "Evaluator": "evaluator",
+    "Batch Evaluator": "evaluator",
+    "Mutator": "mutator",
+}
+
+_tags = contextvars.ContextVar("llm_metrics_tags", default={})
+_default_generation = None
+_lock = threading.Lock()
+_records = []
+_started = time.time()
+prom_file = METRICS_PROM_FILE   # 岛屿模式下每个进程改成自己的文件
+
+@contextmanager
+def scope(**tags):
+    """with scope(individual=prompt): 块内的调用都带上这些标签"""
+    token = _tags.set({**_tags.get(), **tags})
+    try:
+        yield
+    finally:
+        _tags.reset(token)
+
+def set_generation(generation):
+    global _default_generation
+    _default_generation = generation
+
+def _usage_field(usage, *path):
+    value = usage
+    for name in path:
+        value = getattr(value, name, None) if not isinstance(value, dict) else value.get(name)
+        if value is None:
+            return 0
+    return value or 0
+
+class CallTracker:
+    """一次逻辑调用 (可能含多次重试)"""
+
+    def __init__(self, model, label):
+        self.model = model
+        self.role = ROLE_BY_LABEL.get(label, label.lower())
+        self.attempts = 0
+        self.usage = None
+        self.api_latency = None
+        self._attempt_start = None
+        # 流式调用：首 token 延迟、收到的内容 chunk 数、是否因超出长度预算被截断
+        self.stream = False
+        self.ttft = None
+        self.chunks = 0
+        self.truncated = False
+
+    def attempt(self):
+        self.attempts += 1
+        self._attempt_start = time.monotonic()
+        self.usage = None
+        self.ttft = None
+        self.chunks = 0
+        self.truncated = False
+
+    def response(self, response):
+        self.api_latency = time.monotonic() - self._attempt_start
+        self.usage = getattr(response, "usage", None)
+
+    def token(self):
+        self.stream = True
+        self.chunks += 1
+        if self.ttft is None:
+            self.ttft = time.monotonic() - self._attempt_start
+
+    def finished(self):
+        """流式读取结束 (用量在读取过程中由最后一个 chunk 给出)"""
+        self.stream = True
+        self.api_latency = time.monotonic() - self._attempt_start
+
+@contextmanager
+def track(model, label):
+    """包住一次逻辑调用：成功/失败都会记录"""
+    tracker = CallTracker(model, label)
+    start = time.monotonic()
+    ok = False
+    try:
+        yield tracker
+        ok = True
+    finally:
+        _record(tracker, time.monotonic() - start, ok, cache_hit=False)
+
+def record_cache_hit(model, label):
+    _record(CallTracker(model, label), 0.0, True, cache_hit=True)
+
+_typical_prompt_tokens = {}   # (model, role) -> 最近一次有用量的 prompt token 数
+
+def _record(tracker, total_time, ok, cache_hit):
+    tags = _tags.get()
+    usage = tracker.usage
+    key = (tracker.model, tracker.role)
+    prompt_tokens = _usage_field(usage, "prompt_tokens")
+    completion_tokens = _usage_field(usage, "completion_tokens")
+    estimated = False
+    if tracker.stream and usage is None and tracker.chunks:
+        # 流式提前断开收不到用量：completion 按 chunk 数 (约每个一个 token) 估计，
+        # prompt 取同模型同角色最近一次的实际值
+        prompt_tokens = _typical_prompt_tokens.get(key, 0)
+        completion_tokens = tracker.chunks
+        estimated = True
+    elif prompt_tokens:
+        _typical_prompt_tokens[key] = prompt_tokens
+    entry = {
+        "t": time.time(),
+        "model": tracker.model,
+        "role": tracker.role,
+        "generation": tags.get("generation", _default_generation),
+        "individual": tags.get("individual"),
+        "ok": ok,
+        "cache_hit": cache_hit,
+        "retries": max(0, tracker.attempts - 1),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "usage_estimated": estimated,
+        "image_tokens": _usage_field(usage, "prompt_tokens_details", "image_tokens"),
+        "cached_tokens": _usage_field(usage, "prompt_tokens_details", "cached_tokens"),
+        "latency": tracker.api_latency,
+        "total_time": total_time,
+        "stream": tracker.stream,
+        "ttft": tracker.ttft,
+        "truncated": tracker.truncated,
+    }
+    with _lock:
+        _records.append(entry)
+
+# ================= 汇总 =================
+
+def _cost(model, prompt_tokens, completion_tokens, cached_tokens=0):
+    """命中服务端前缀缓存的输入 token 按 CACHED_TOKEN_PRICE_RATIO 折算"""
+    price_in, price_out = MODEL_PRICES.get(model, (0.0, 0.0))
+    billed_in = prompt_tokens - cached_tokens + cached_tokens * CACHED_TOKEN_PRICE_RATIO
+    return billed_in / 1000.0 * price_in + completion_tokens / 1000.0 * price_out
+
+def _percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * q
+    lo, hi = int(k), min(int(k) + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+def _aggregate(records):
+    api = [r for r in records if not r["cache_hit"]]
+    latencies = [r["latency"] for r in api if r["latency"] is not None]
+    streamed = [r for r in api if r["stream"] and r["ok"]]
+    ttfts = [r["ttft"] for r in streamed if r["ttft"] is not None]
+    out = {
+        "calls": len(api),
+        "cache_hits": len(records) - len(api),
+        "failed": sum(1 for r in api if not r["ok"]),
+        "retries": sum(r["retries"] for r in api),
+        "prompt_tokens": sum(r["prompt_tokens"] for r in api),
+        "completion_tokens": sum(r["completion_tokens"] for r in api),
+        "image_tokens": sum(r["image_tokens"] for r in api),
+        "cached_tokens": sum(r["cached_tokens"] for r in api),
+        "cost": round(sum(_cost(r["model"], r["prompt_tokens"], r["completion_tokens"], r["cached_tokens"]) for r in api), 6),
+        "latency_p50": _percentile(latencies, 0.5),
+        "latency_p95": _percentile(latencies, 0.95),
+        "total_time": round(sum(r["total_time"] for r in api), 3),
+    }
+    # 服务端前缀缓存：命中的输入 token 占比，以及命中/未命中请求各自的延迟中位数 (用来核对缓存省下的时间)
+    out["prefix_cache_ratio"] = out["cached_tokens"] / out["prompt_tokens"] if out["prompt_tokens"] else 0.0
+    out["latency_p50_prefix_hit"] = _percentile(
+        [r["latency"] for r in api if r["cached_tokens"] and r["latency"] is not None], 0.5)
+    out["latency_p50_prefix_miss"] = _percentile(
+        [r["latency"] for r in api if not r["cached_tokens"] and r["latency"] is not None], 0.5)
+    if streamed:
+        out["ttft_p50"] = _percentile(ttfts, 0.5)
+        out["ttft_p95"] = _percentile(ttfts, 0.95)
+        out["truncation_rate"] = sum(r["truncated"] for r in streamed) / len(streamed)
+    return out
+
+def _select(**tags):
+    with _lock:
+        records = list(_records)
+    return [r for r in records if all(r.get(k) == v for k, v in tags.items())]
+
+def summary(**tags):
+    """按标签过滤后的汇总，例如 summary(generation=3, individual=prompt)；不传标签为整个运行"""
+    return _aggregate(_select(**tags))
+
+def summary_by_role(**tags):
+    records = _select(**tags)
+    return {role: _aggregate([r for r in records if r["role"] == role]) for role in sorted({r["role"] for r in records})}
+
+def live_summary():
+    """每个模型自运行开始以来的吞吐、费用和延迟"""
+    elapsed = max(1e-9, time.time() - _started)
+    records = _select()
+    out = {}
+    for model in sorted({r["model"] for r in records}):
+        agg = _aggregate([r for r in records if r["model"] == model])
+        agg["calls_per_s"] = agg["calls"] / elapsed
+        agg["tokens_per_s"] = (agg["prompt_tokens"] + agg["completion_tokens"]) / elapsed
+        out[model] = agg
+    return out
+
+def log_summary(generation=None):
+    if generation is not None:
+        gen = summary(generation=generation)
+        logging.info(f"  [USAGE] Generation {generation}: {gen['calls']} calls ({gen['cache_hits']} cached, "
+                     f"{gen['retries']} retries, {gen['failed']} failed), "
+                     f"{gen['prompt_tokens'] + gen['completion_tokens']} tokens, est. cost {gen['cost']:.4f}")
+    for model, agg in live_summary().items():
+        p50 = "n/a" if agg["latency_p50"] is None else f"{agg['latency_p50']:.2f}s"
+        p95 = "n/a" if agg["latency_p95"] is None else f"{agg['latency_p95']:.2f}s"
+        stream = ""
+        if agg["cached_tokens"]:
+            hit, miss = agg["latency_p50_prefix_hit"], agg["latency_p50_prefix_miss"]
+            stream += (f", prefix cache {agg['prefix_cache_ratio']:.0%} of input "
+                       f"(p50 hit {hit:.2f}s / miss {'n/a' if miss is None else f'{miss:.2f}s'})")
+        if "truncation_rate" in agg:
+            ttft = "n/a" if agg["ttft_p50"] is None else f"{agg['ttft_p50']:.2f}s"
+            stream += f", TTFT p50 {ttft}, truncated {agg['truncation_rate']:.0%}"
+        logging.info(f"  [USAGE] {model}: {agg['calls_per_s']:.2f} calls/s, {agg['tokens_per_s']:.0f} tokens/s, "
+                     f"p50 {p50}, p95 {p95}{stream}, est. cost {agg['cost']:.4f}")
+
+# ================= Prometheus 导出 =================
+
+def _labels(**labels):
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+def export_prometheus(path=None):
+    """写 Prometheus 文本格式 (先写临时文件再替换，node_exporter textfile collector 可直接读取)"""
+    path = path or prom_file
+    if not path:
+        return
+    records = _select()
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            lines.append(f"{name}{_labels(**labels)} {value}")
+
+    groups = {}
+    for r in records:
+        groups.setdefault((r["model"], r["role"]), []).append(r)
+    aggs = {key: _aggregate(rs) for key, rs in sorted(groups.items())}
+
+    metric("ga_llm_calls_total", "counter", "LLM API calls (excluding cache hits)",
+           [(dict(model=m, role=role), a["calls"]) for (m, role), a in aggs.items()])
+    metric("ga_llm_cache_hits_total", "counter", "LLM calls served from the response cache",
+           [(dict(model=m, role=role), a["cache_hits"]) for (m, role), a in aggs.items()])
+    metric("ga_llm_failures_total", "counter", "LLM calls that failed after all retries",
+           [(dict(model=m, role=role), a["failed"]) for (m, role), a in aggs.items()])
+    metric("ga_llm_retries_total", "counter", "LLM request retries",
+           [(dict(model=m, role=role), a["retries"]) for (m, role), a in aggs.items()])
+    metric("ga_llm_tokens_total", "counter", "LLM tokens by kind",
+           [(dict(model=m, role=role, kind=kind), a[f"{kind}_tokens"])
+            for (m, role), a in aggs.items() for kind in ("prompt", "completion", "image", "cached")])
+    metric("ga_llm_cost_total", "counter", "Estimated LLM cost (MODEL_PRICES units)",
+           [(dict(model=m, role=role), a["cost"]) for (m, role), a in aggs.items()])
+
+    latency_samples = []
+    for model in sorted({r["model"] for r in records}):
+        lat = [r["latency"] for r in records if r["model"] == model and r["latency"] is not None]
+        for q in (0.5, 0.95):
+            value = _percentile(lat, q)
+            if value is not None:
+                latency_samples.append((dict(model=model, quantile=q), round(value, 6)))
+    metric("ga_llm_latency_seconds", "summary", "LLM API round-trip latency", latency_samples)
+    for model in sorted({r["model"] for r in records}):
+        lat = [r["latency"] for r in records if r["model"] == model and r["latency"] is not None]
+        lines.append(f"ga_llm_latency_seconds_sum{_labels(model=model)} {round(sum(lat), 6)}")
+        lines.append(f"ga_llm_latency_seconds_count{_labels(model=model)} {len(lat)}")
+
+    metric("ga_llm_prefix_cache_ratio", "gauge", "Share of input tokens served from the provider prefix cache",
+           [(dict(model=m, role=role), round(a["prefix_cache_ratio"], 6)) for (m, role), a in aggs.items()])
+
+    streamed = {key: a for key, a in aggs.items() if "truncation_rate" in a}
+    metric("ga_llm_ttft_seconds", "gauge", "Streaming time to first token",
+           [(dict(model=m, role=role, quantile=q), round(a[field], 6))
+            for (m, role), a in streamed.items() for q, field in ((0.5, "ttft_p50"), (0.95, "ttft_p95"))
+            if a[field] is not None])
+    metric("ga_llm_truncation_ratio", "gauge", "Share of streamed completions cut at the length budget",
+           [(dict(model=m, role=role), round(a["truncation_rate"], 6)) for (m, role), a in streamed.items()])
+
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp, path)
@@ -0,0 +1,187 @@
+# llm_transport.py
+"""
+所有 LLM 调用的传输层：限流 + 重试 + 自适应并发
+
+- 每个模型一个令牌桶 (RATE_LIMIT_RPM)，平滑请求速率；
+- 可重试错误 (429 / 5xx / 超时 / 连接错误 / 返回内容解析失败 ValueError/KeyError/IndexError) 做指数退避 + 抖动重试，
+  429 带 Retry-After 时按服务端要求等待；
+- AIMD 自适应并发：成功时并发上限加性增长，被限流时乘性减半，其他失败 (5xx / 超时 / 解析失败) 不调整；
+- 重试耗尽抛出 LLMCallFailed，由调用方把这次评估标记为 failed，而不是伪造一个分数；
+  其他异常 (TypeError / AttributeError 等代码错误) 不重试，原样抛出。
+同步 (线程) 和异步 (asyncio) 调用共用同一套状态。
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+import openai
+from config import (
+    MAX_CONCURRENCY, DEFAULT_MAX_CONCURRENCY, RATE_LIMIT_RPM, DEFAULT_RATE_LIMIT_RPM,
+    MAX_RETRIES, RETRY_BASE_DELAY, RETRY_MAX_DELAY, AIMD_MAX_CONCURRENCY_FACTOR
+)
+
+# 抖动用独立的随机数生成器，不影响 GA 的全局随机数序列 (断点续跑依赖它)
+_jitter = random.Random()
+
+class LLMCallFailed(Exception):
+    """重试耗尽 (或不可重试错误) 后的最终失败"""
+
+class TokenBucket:
+    def __init__(self, rpm):
+        self.rate = rpm / 60.0
+        self.capacity = max(1.0, self.rate)  # 最多攒 1 秒的突发
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """预订一个令牌，返回需要等待的秒数"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+class AIMDLimiter:
+    """加性增、乘性减的并发上限"""
+
+    def __init__(self, initial):
+        self.limit = float(initial)
+        self.max_limit = float(initial) * AIMD_MAX_CONCURRENCY_FACTOR
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def _try_acquire(self):
+        if self.in_flight < max(1, int(self.limit)):
+            self.in_flight += 1
+            return True
+        return False
+
+    def acquire(self):
+        with self._cond:
+            while not self._try_acquire():
+                self._cond.wait()
+
+    async def aacquire(self):
+        # 异步侧轮询，避免把 asyncio 原语绑定到某个事件循环
+        while True:
+            with self._cond:
+                if self._try_acquire():
+                    return
+            await asyncio.sleep(0.02)
+
+    def release(self, ok=False, throttled=False):
+        """ok: 这次请求成功；throttled: 被 429 限流。两者都不是时只归还名额"""
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                # 同一波 429 只减一次
+                if now - self._last_decrease > 1.0:
+                    self.limit = max(1.0, self.limit / 2)
+                    self._last_decrease = now
+                    logging.warning(f"  [AIMD] Throttled, concurrency limit -> {self.limit:.1f}")
+            elif ok:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+_state_lock = threading.Lock()
+_buckets = {}
+_limiters = {}
+
+def _bucket(model):
+    with _state_lock:
+        if model not in _buckets:
+            _buckets[model] = TokenBucket(RATE_LIMIT_RPM.get(model, DEFAULT_RATE_LIMIT_RPM))
+        return _buckets[model]
+
+def limiter(model):
+    with _state_lock:
+        if model not in _limiters:
+            _limiters[model] = AIMDLimiter(MAX_CONCURRENCY.get(model, DEFAULT_MAX_CONCURRENCY))
+        return _limiters[model]
+
+def _classify(error):
+    """返回 (是否可重试, 是否限流, 服务端要求的等待秒数)"""
+    if isinstance(error, openai.RateLimitError):
+        retry_after = None
+        response = getattr(error, "response", None)
+        if response is not None:
+            try:
+                retry_after = float(response.headers.get("retry-after"))
+            except (TypeError, ValueError):
+                retry_after = None
+        return True, True, retry_after
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError)):
+        return True, False, None
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code >= 500, False, None
+    # 返回内容解析失败 (如评估器 JSON 不完整)；TypeError / AttributeError 是代码错误，不重试
+    if isinstance(error, (ValueError, KeyError, IndexError)):
+        return True, False, None
+    return False, False, None
+
+def _backoff(attempt, retry_after):
+    if retry_after is not None:
+        return retry_after + _jitter.uniform(0, RETRY_BASE_DELAY)
+    # 指数退避 + full jitter
+    return _jitter.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+
+def request(model, fn, label="LLM"):
+    """
+    同步调用 fn() (一次完整的请求 + 解析)，带限流、重试和自适应并发
+    """
+    lim = limiter(model)
+    for attempt in range(MAX_RETRIES + 1):
+        delay = _bucket(model).reserve()
+        if delay > 0:
+            time.sleep(delay)
+        lim.acquire()
+        ok = throttled = False
+        try:
+            result = fn()
+            ok = True
+            return result
+        except Exception as e:
+            retryable, throttled, retry_after = _classify(e)
+            if not retryable and not isinstance(e, openai.OpenAIError):
+                raise  # 代码错误原样抛出，不当作一次失败的调用
+            if not retryable or attempt == MAX_RETRIES:
+                raise LLMCallFailed(f"{label} failed after {attempt + 1} attempt(s): {e}") from e
+            wait = _backoff(attempt, retry_after)
+            logging.warning(f"  [RETRY] {label} ({model}) attempt {attempt + 1} failed: {e} -> retry in {wait:.1f}s")
+        finally:
+            lim.release(ok, throttled)
+        time.sleep(wait)
+
+async def arequest(model, fn, label="LLM"):
+    """
+    request 的异步版本，fn() 返回协程
+    """
+    lim = limiter(model)
+    for attempt in range(MAX_RETRIES + 1):
+        delay = _bucket(model).reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await lim.aacquire()
+        ok = throttled = False
+        try:
+            result = await fn()
+            ok = True
+            return result
+        except Exception as e:
+            retryable, throttled, retry_after = _classify(e)
+            if not retryable and not isinstance(e, openai.OpenAIError):
+                raise  # 代码错误原样抛出，不当作一次失败的调用
+            if not retryable or attempt == MAX_RETRIES:
+                raise LLMCallFailed(f"{label} failed after {attempt + 1} attempt(s): {e}") from e
+            wait = _backoff(attempt, retry_after)
+            logging.warning(f"  [RETRY] {label} ({model}) attempt {attempt + 1} failed: {e} -> retry in {wait:.1f}s")
+        finally:
+            lim.release(ok, throttled)
+        await asyncio.sleep(wait)
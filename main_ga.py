@@ -1,21 +1,37 @@
 # main_ga.py
+import argparse
 import json
 import logging
+import math
 import os
 import random
 import time
 from config import (
     DATA_FILE, INITIAL_SEED_PROMPT, POPULATION_SIZE, 
-    GENERATIONS, ELITISM_COUNT
+    GENERATIONS, ELITISM_COUNT, USE_FITNESS_LEDGER, EVAL_SCHEDULER, GA_SCHEDULER, USE_SIMILARITY_DEDUP,
+    SURROGATE_MODE, SURROGATE_CANDIDATE_FACTOR, SAMPLING_MODE
 )
-from evolution import init_population_expansion, get_next_variant, crossover_prompts
-from evaluator import calculate_fitness
+from evolution import init_population_expansion, breed_child, produce_offspring
+from evaluator import evaluate_population, is_failed, evaluation_failed
+from fitness_ledger import FitnessLedger
+from racing import race_population
+from pipeline import run_pipelined
+from similarity import SimilarityIndex, DiversityFilter
+import similarity
+from surrogate import SurrogateModel, spearman
+from sampling import PanelSampler
+from run_journal import RunJournal, encode_rng_state, load_state
+import image_store
+import llm_metrics
+import lineage
 
-# 日志配置
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+# 日志配置 (在入口调用 setup_logging；多进程岛屿模式下每个岛写自己的日志文件)
 logger = logging.getLogger()
-file_handler = logging.FileHandler("ga_training.log", mode="w", encoding="utf-8")
-logger.addHandler(file_handler)
+
+def setup_logging(log_file="ga_training.log", prefix=""):
+    logging.basicConfig(level=logging.INFO, format=f'%(asctime)s - {prefix}%(message)s', force=True)
+    file_handler = logging.FileHandler(log_file, mode="w", encoding="utf-8")
+    logger.addHandler(file_handler)
 
 # 早停参数
 PATIENCE_LIMIT = 3
@@ -23,125 +39,356 @@ MIN_DELTA = 0.005
 TARGET_SCORE = 0.98
 
 # 结果保存文件
-HISTORY_FILE = f"ga_history_{int(time.time())}.json"
+RUN_TAG = int(time.time())
+HISTORY_FILE = f"ga_history_{RUN_TAG}.json"
+# 追加写入的运行日志 (每个评估完成即落盘，用于 --resume)
+JOURNAL_FILE = f"ga_run_{RUN_TAG}.jsonl"
 
 def load_data():
     if not os.path.exists(DATA_FILE):
         return []
     with open(DATA_FILE, 'r', encoding='utf-8') as f:
         data = json.load(f)
-        return [d for d in data if d.get('label') == 1]
+    # 清单里已有的内容哈希直接复用 (见 generate_dataset_json.py)
+    image_store.register_manifest(data)
+    return [d for d in data if d.get('label') == 1]
 
-def save_history(history_data):
-    """将整个历史记录保存到 JSON"""
-    with open(HISTORY_FILE, "w", encoding="utf-8") as f:
+def save_history(history_data, history_file=HISTORY_FILE):
+    """将整个历史记录保存到 JSON (运行结束时写一次；过程数据在运行日志里)"""
+    with open(history_file, "w", encoding="utf-8") as f:
         json.dump(history_data, f, indent=2, ensure_ascii=False)
-    logger.info(f"  [SAVED] Full history saved to {HISTORY_FILE}")
+    logger.info(f"  [SAVED] Full history saved to {history_file}")
+
+def should_stop(gen, global_best_score, patience_counter):
+    return global_best_score >= TARGET_SCORE or patience_counter >= PATIENCE_LIMIT or gen == GENERATIONS - 1
+
+def breed_next_population(scored_population, index=None, ledger=None, surrogate=None):
+    """
+    由排好序的 [(prompt, fitness, metrics)] 繁殖下一代
+    传入 index (SimilarityIndex) 时拒绝近重复的子代，或让它继承邻居的 fitness；
+    SURROGATE_MODE = "screen" 且代理模型已训练好时，多繁殖一些子代，只保留预估分最高的
+    """
+    new_population = []
+    
+    # A. 精英保留 (评估失败的个体不在 scored_population 里，可能不足 ELITISM_COUNT 个)
+    for prompt, _, _ in scored_population[:ELITISM_COUNT]:
+        new_population.append(prompt)
+        # 在历史记录中标记一下谁是精英（可选，但通常通过文本对比能看出来）
+    
+    # B. 变异与交叉 (并发生产，超额提交后去重)
+    n_children = POPULATION_SIZE - len(new_population)
+    screening = SURROGATE_MODE == "screen" and surrogate is not None and surrogate.ready
+    n_candidates = math.ceil(n_children * SURROGATE_CANDIDATE_FACTOR) if screening else n_children
+    diversity = None if index is None else DiversityFilter(index, new_population, ledger)
+    records = {}
+    children = produce_offspring(
+        lambda rng, k: breed_child(scored_population, rng), n_candidates, new_population, accept=diversity,
+        records=records
+    )
+    if screening:
+        logger.info(f"  [SURROGATE] Pre-screened {len(children)} candidates down to {n_children}")
+        children = surrogate.top_k(children, n_children)
+    # 谱系只记最终进入种群的子代
+    lineage.commit(records, children)
+    if diversity is not None:
+        # 筛掉的候选不继承，继承统计也只算留下来的子代
+        diversity.commit(children)
+    new_population += children
+    if index is not None:
+        logger.info(f"  [DEDUP] {similarity.stats['rejected']} near-duplicates rejected, "
+                    f"{similarity.stats['inherited']} inherited fitness so far")
+    
+    return new_population
 
-def run_genetic_algorithm():
+def run_genetic_algorithm(resume_path=None):
     dataset = load_data()
     if not dataset:
         logger.error("Data is empty!")
         return
 
-    # 1. 初始化
-    population = init_population_expansion(INITIAL_SEED_PROMPT, POPULATION_SIZE)
+    # 适应度账本：存活的 Prompt 只在新图片上追加评估
+    ledger = FitnessLedger() if USE_FITNESS_LEDGER else None
+    # 本次运行评估过的所有 Prompt，用于近重复检测
+    index = SimilarityIndex() if USE_SIMILARITY_DEDUP else None
+    # 代理适应度模型：先用以往运行的 history 训练，之后每代增量更新
+    surrogate = SurrogateModel() if SURROGATE_MODE != "off" else None
+
+    if resume_path:
+        # 断点续跑：从运行日志重建种群、最优解、耐心计数、随机数状态和已完成的评估
+        state = load_state(resume_path, ledger)
+        journal = RunJournal(resume_path)
+        history_file = state["history_file"]
+        ga_history = state["history"]
+        gen = state["generation"]
+        population = state["population"]
+        done = state["done"]
+        scored_population = state["scored"]
+        global_best_score = state["global_best_score"]
+        global_best_prompt = state["global_best_prompt"]
+        patience_counter = state["patience"]
+        random.setstate(state["rng_state"])
+        if index is not None:
+            for gen_data in ga_history:
+                for ind in gen_data["individuals"]:
+                    index.add(ind["prompt_text"])
+        if surrogate is not None:
+            surrogate.fit_history(exclude=[history_file])
+            for gen_data in ga_history:
+                surrogate.update_from_generation(gen_data)
+        # 谱系和变异算子的老虎机状态从已写入的 history 重放
+        lineage.restore(ga_history)
+        logger.info(f"Resuming {resume_path} at generation {gen + 1} ({len(done)} individuals already evaluated)")
+        if state["finished"] or (scored_population is not None and should_stop(gen, global_best_score, patience_counter)):
+            save_history(ga_history, history_file)
+            logger.info("Run already finished.")
+            return
+    else:
+        journal = RunJournal(JOURNAL_FILE)
+        history_file = HISTORY_FILE
+        journal.write("run_start", history_file=history_file)
+        if surrogate is not None:
+            surrogate.fit_history()
+
+        # 1. 初始化
+        llm_metrics.set_generation(1)
+        population = init_population_expansion(
+            INITIAL_SEED_PROMPT, POPULATION_SIZE,
+            accept=None if index is None else DiversityFilter(index, [INITIAL_SEED_PROMPT])
+        )
+        journal.write("population", generation=1, population=population, rng_state=encode_rng_state(random.getstate()))
+        
+        global_best_prompt = ""
+        global_best_score = -1.0
+        patience_counter = 0 
+        
+        # 核心历史记录数据结构
+        ga_history = [] 
+
+        gen = 0
+        done = {}
+        scored_population = None
     
-    global_best_prompt = ""
-    global_best_score = -1.0
-    patience_counter = 0 
+    # 公共评估面板：难度分层只用以往运行的 history (本次运行的不算，续跑时面板与中断前一致)
+    sampler = PanelSampler(dataset, exclude=[history_file]) if SAMPLING_MODE == "panel" else None
+
+    # 2. 迭代循环
+    try:
+        if GA_SCHEDULER == "pipelined":
+            # 相邻两代重叠：边评估本代边繁殖下一代 (见 pipeline.py)
+            run_pipelined_generations(
+                gen, population, dataset, ledger, index, surrogate, journal, ga_history, done, scored_population,
+                global_best_score, global_best_prompt, patience_counter, sampler
+            )
+            gen = GENERATIONS
+        while gen < GENERATIONS:
+            # 续跑时若上次停在"评估完、繁殖前"，直接进入繁殖
+            if scored_population is None:
+                scored_population, global_best_score, global_best_prompt, patience_counter = run_generation(
+                    gen, population, dataset, ledger, surrogate, journal, ga_history, done,
+                    global_best_score, global_best_prompt, patience_counter, sampler
+                )
+                if should_stop(gen, global_best_score, patience_counter):
+                    break
+            if index is not None:
+                for prompt in population:
+                    index.add(prompt)
+
+            # --- 繁殖下一代 (变异调用的用量计入下一代) ---
+            llm_metrics.set_generation(gen + 2)
+            population = breed_next_population(scored_population, index, ledger, surrogate)
+            gen += 1
+            done = {}
+            scored_population = None
+            journal.write("population", generation=gen + 1, population=population, rng_state=encode_rng_state(random.getstate()))
+
+        journal.write("run_end", llm_usage=llm_metrics.summary())
+    finally:
+        # 正常结束或异常退出都落一次完整 history (崩溃后也可用 run_journal.py 从日志导出)
+        save_history(ga_history, history_file)
+        journal.close()
+        llm_metrics.export_prometheus()
+
+    logger.info("Optimization Done. Check ga_history json file.")
+
+def run_generation(gen, population, dataset, ledger, surrogate, journal, ga_history, done,
+                   global_best_score, global_best_prompt, patience_counter, sampler=None):
+    """
+    评估一代并写入历史/运行日志 (传入 sampler 时全代共用它给出的评估面板)
+    返回 (排好序的 scored_population, global_best_score, global_best_prompt, patience_counter)
+    """
+    logger.info(f"\n{'='*20} Generation {gen + 1} / {GENERATIONS} {'='*20}")
+    llm_metrics.set_generation(gen + 1)
     
-    # 核心历史记录数据结构
-    ga_history = [] 
+    def on_done(i, details):
+        # 每个个体的一批样本评估完成即追加到运行日志
+        journal.write("samples", generation=gen + 1, index=i, prompt=population[i], details=details)
     
-    # 2. 迭代循环
-    for gen in range(GENERATIONS):
-        logger.info(f"\n{'='*20} Generation {gen + 1} / {GENERATIONS} {'='*20}")
+    # --- 评估 ---
+    # 整代并发评估 (见 config.ASYNC_EVAL / EVAL_SCHEDULER)，结果顺序与 population 一致
+    if EVAL_SCHEDULER == "racing":
+        # racing 按置信区间自适应追加样本，不使用公共面板
+        results = race_population(population, dataset, ledger, on_done)
+    else:
+        panel = None if sampler is None else sampler.panel(gen + 1)
+        if panel is not None:
+            logger.info(f"  [PANEL] Shared panel: {[d.get('sid', d['image_path']) for d in panel]}")
+        results = evaluate_population(population, dataset, ledger, on_done, done, panel)
+    return record_generation(
+        gen, population, results, ledger, surrogate, journal, ga_history,
+        global_best_score, global_best_prompt, patience_counter
+    )
+
+def record_generation(gen, population, results, ledger, surrogate, journal, ga_history,
+                      global_best_score, global_best_prompt, patience_counter):
+    """
+    把一代的评估结果写入历史/运行日志，排序并做早停检查；
+    代理模型先对本代预测 (还没见过本代结果) 并报告秩相关，再用本代结果更新
+    返回值同 run_generation
+    """
+    predictions = surrogate.predict(population) if surrogate is not None and surrogate.ready else None
+    # 当前代的数据记录
+    current_gen_data = {
+        "generation": gen + 1,
+        "individuals": [] # 存放每个 prompt 的详情
+    }
+    
+    scored_population = []
+    failed_population = []
+
+    for i, (prompt, (fitness, metrics, details)) in enumerate(zip(population, results)):
+        failed = evaluation_failed(details)
+        # 全部样本都失败的个体只有 0 分占位，不参与排名、精英保留和选父代
+        (failed_population if failed else scored_population).append((prompt, fitness, metrics))
         
-        # 当前代的数据记录
-        current_gen_data = {
-            "generation": gen + 1,
-            "individuals": [] # 存放每个 prompt 的详情
+        # 记录该 Prompt 的详细信息
+        record = {
+            "prompt_id": f"gen_{gen+1}_id_{i}",
+            "prompt_text": prompt,
+            "fitness": fitness,
+            "average_metrics": metrics,
+            "sample_evaluations": details # 这里包含了具体的生成文本和得分
         }
+        if ledger is not None:
+            # 累计样本数和 fitness 置信区间半宽
+            summary = ledger.summary(prompt)
+            record["n_samples"] = summary["n"] if summary else 0
+            record["fitness_ci"] = summary["ci"] if summary else None
+            if ledger.inherited_from(prompt):
+                # 近重复子代，样本与 fitness 并入了这个历史个体
+                record["inherited_from"] = ledger.inherited_from(prompt)
+        if predictions is not None:
+            record["surrogate_pred"] = predictions[i]
+        n_failed = sum(1 for d in details if is_failed(d))
+        if n_failed or not details:
+            # 重试耗尽的样本不计入 fitness
+            record["failed_samples"] = n_failed
+        if failed:
+            record["status"] = "failed"
+        # 父代 prompt_id 与产生它的变异算子/策略；子代首次出现时按相对父代的增量给算子记奖励
+        lineage_record = lineage.observe(
+            prompt, record["prompt_id"], gen + 1, fitness, valid=not failed
+        )
+        if lineage_record is not None:
+            record["lineage"] = lineage_record
+        # 本代为该个体花费的生成/评分调用 (token、费用、延迟)
+        record["llm_usage"] = llm_metrics.summary(generation=gen + 1, individual=prompt)
+        current_gen_data["individuals"].append(record)
+        journal.write("individual", generation=gen + 1, record=record)
         
-        scored_population = []
-        
-        # --- 评估 ---
-        for i, prompt in enumerate(population):
-            # 注意：这里接收了第三个返回值 details
-            fitness, metrics, details = calculate_fitness(prompt, dataset)
-            
-            scored_population.append((prompt, fitness, metrics))
-            
-            # 记录该 Prompt 的详细信息
-            current_gen_data["individuals"].append({
-                "prompt_id": f"gen_{gen+1}_id_{i}",
-                "prompt_text": prompt,
-                "fitness": fitness,
-                "average_metrics": metrics,
-                "sample_evaluations": details # 这里包含了具体的生成文本和得分
-            })
-            
-            logger.info(f"  [P{i}] Score: {fitness:.4f} | Hate: {metrics['hate']:.2f}")
-
-        # --- 排序 ---
-        scored_population.sort(key=lambda x: x[1], reverse=True)
-        current_gen_data["individuals"].sort(key=lambda x: x["fitness"], reverse=True) # JSON里也排个序
-        
-        current_best = scored_population[0]
-        
-        # 更新代最佳信息
-        current_gen_data["best_score"] = current_best[1]
-        current_gen_data["best_prompt"] = current_best[0]
-        
-        # 添加到总历史并保存
-        ga_history.append(current_gen_data)
-        save_history(ga_history)
-        
-        # --- 早停检查逻辑 ---
-        score_improvement = current_best[1] - global_best_score
-        if score_improvement > MIN_DELTA:
-            logger.info(f"  >>> New Global Best Found! (+{score_improvement:.4f})")
-            global_best_score = current_best[1]
-            global_best_prompt = current_best[0]
-            patience_counter = 0 
+        if failed:
+            logger.warning(f"  [P{i}] FAILED: no successful samples (n={len(details)}), excluded from ranking")
         else:
-            patience_counter += 1
-        
-        if global_best_score >= TARGET_SCORE or patience_counter >= PATIENCE_LIMIT:
-            logger.info("  !!! Stopping Early !!!")
-            break
-        
-        if gen == GENERATIONS - 1:
-            break
+            logger.info(f"  [P{i}] Score: {fitness:.4f} | Hate: {metrics['hate']:.2f} | n={len(details)}")
 
-        # --- 繁殖下一代 ---
-        new_population = []
-        
-        # A. 精英保留
-        for i in range(ELITISM_COUNT):
-            new_population.append(scored_population[i][0])
-            # 在历史记录中标记一下谁是精英（可选，但通常通过文本对比能看出来）
-        
-        # B. 变异与交叉
-        while len(new_population) < POPULATION_SIZE:
-            candidates = random.sample(scored_population, 2)
-            parent = max(candidates, key=lambda x: x[1])[0]
-            
-            if random.random() < 0.8:
-                child = get_next_variant(parent)
-                # 可以在这里记录 parent -> child 的关系，但 GA 标准通常只看每一代的表现
-            else:
-                candidates_2 = random.sample(scored_population, 2)
-                parent_2 = max(candidates_2, key=lambda x: x[1])[0]
-                child = crossover_prompts(parent, parent_2)
-            
-            if child not in new_population:
-                new_population.append(child)
-        
-        population = new_population
+    # 本代总用量 (含繁殖本代时的变异调用) 与本进程截至目前的累计用量
+    current_gen_data["llm_usage"] = llm_metrics.summary(generation=gen + 1)
+    current_gen_data["llm_usage_by_role"] = llm_metrics.summary_by_role(generation=gen + 1)
+    current_gen_data["llm_usage_run"] = llm_metrics.summary()
+    llm_metrics.log_summary(gen + 1)
+    llm_metrics.export_prometheus()
+    # 截至本代各变异算子/策略的子代数、提升率和平均 fitness 增量
+    current_gen_data["operator_stats"] = lineage.operator_stats()
+    logger.info("  [OPERATORS] " + ", ".join(
+        f"{arm}: {s['improvement_yield']:.0%} of {s['children']} improved ({s['mean_delta']:+.4f})"
+        for arm, s in current_gen_data["operator_stats"].items() if "/" not in arm
+    ))
+    logger.info(f"  [IMAGE] Payloads: {image_store.stats['encoded']} encoded, {image_store.bytes_saved() / 1e6:.1f} MB upload saved so far")
 
-    logger.info("Optimization Done. Check ga_history json file.")
+    if predictions is not None:
+        rho = spearman(predictions, [fitness for fitness, _, _ in results])
+        current_gen_data["surrogate_spearman"] = rho
+        logger.info(f"  [SURROGATE] Spearman(predicted, true) = {'n/a' if rho is None else f'{rho:.3f}'} "
+                    f"(trained on {surrogate.n} records)")
+
+    # --- 排序 ---
+    if not scored_population:
+        # 整代都评估失败 (如服务长时间不可用)：只能按占位分继续，避免整个运行中断
+        logger.error(f"  Generation {gen + 1}: every individual failed evaluation")
+        scored_population = failed_population
+    scored_population.sort(key=lambda x: x[1], reverse=True)
+    # JSON里也排个序 (评估失败的排在最后)
+    current_gen_data["individuals"].sort(key=lambda x: (x.get("status") != "failed", x["fitness"]), reverse=True)
+    
+    current_best = scored_population[0]
+    
+    # 更新代最佳信息
+    current_gen_data["best_score"] = current_best[1]
+    current_gen_data["best_prompt"] = current_best[0]
+    
+    # 添加到总历史
+    ga_history.append(current_gen_data)
+    if surrogate is not None:
+        surrogate.update_from_generation(current_gen_data)
+    
+    # --- 早停检查逻辑 ---
+    score_improvement = current_best[1] - global_best_score
+    if score_improvement > MIN_DELTA:
+        logger.info(f"  >>> New Global Best Found! (+{score_improvement:.4f})")
+        global_best_score = current_best[1]
+        global_best_prompt = current_best[0]
+        patience_counter = 0 
+    else:
+        patience_counter += 1
+
+    journal.write(
+        "generation_end", generation=gen + 1,
+        best_score=current_best[1], best_prompt=current_best[0],
+        global_best_score=global_best_score, global_best_prompt=global_best_prompt,
+        patience=patience_counter, rng_state=encode_rng_state(random.getstate())
+    )
+    
+    if global_best_score >= TARGET_SCORE or patience_counter >= PATIENCE_LIMIT:
+        logger.info("  !!! Stopping Early !!!")
+    return scored_population, global_best_score, global_best_prompt, patience_counter
+
+def run_pipelined_generations(gen, population, dataset, ledger, index, surrogate, journal, ga_history, done,
+                              scored_population, global_best_score, global_best_prompt, patience_counter,
+                              sampler=None):
+    """流水线调度：历史/运行日志的写法与逐代版本相同，只是下一代的评估提前开始"""
+    state = {"best": global_best_score, "prompt": global_best_prompt, "patience": patience_counter}
+
+    def on_samples(g, i, prompt, details):
+        journal.write("samples", generation=g + 1, index=i, prompt=prompt, details=details)
+
+    def on_population(g, new_population):
+        journal.write("population", generation=g + 1, population=new_population, rng_state=encode_rng_state(random.getstate()))
+
+    def finish_generation(g, members, results):
+        logger.info(f"\n{'='*20} Generation {g + 1} / {GENERATIONS} (pipelined) {'='*20}")
+        scored, state["best"], state["prompt"], state["patience"] = record_generation(
+            g, members, results, ledger, surrogate, journal, ga_history, state["best"], state["prompt"], state["patience"]
+        )
+        if index is not None:
+            for prompt in members:
+                index.add(prompt)
+        return scored, should_stop(g, state["best"], state["patience"])
+
+    run_pipelined(gen, population, dataset, ledger, done, scored_population,
+                  finish_generation, on_population, on_samples, index, sampler)
 
 if __name__ == "__main__":
-    run_genetic_algorithm()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="GA prompt optimization")
+    parser.add_argument("--resume", metavar="JOURNAL", help="resume from a ga_run_*.jsonl journal")
+    args = parser.parse_args()
+    setup_logging()
+    run_genetic_algorithm(args.resume)
\ No newline at end of file
@@ -0,0 +1,296 @@
+# mock_server.py
+"""
+本地 OpenAI 兼容 (chat/completions) 替身服务，用于离线压测/调试整个流水线，不花 API 费用。
+
+- 生成器：返回确定性的假 Tweet
+- 评估器：返回合法的打分 JSON (单条 / 批量 results 数组)，分数由 Tweet 内容哈希决定
+- 变异器：在原 Prompt 上做确定性的改写
+并可注入延迟 (对数正态分布)、429 / 5xx 错误和格式错误的 JSON；
+支持 stream=True 的 SSE 流式响应 (可用 --long-tweet-rate 让生成器返回超长文本)；
+用量里的 cached_tokens 模拟服务端前缀缓存 (最后一段文本之前的内容重复出现即命中)。
+
+用法:
+    python mock_server.py --port 8765 --latency-generator 800 --rate-429 0.05
+    LLM_BACKEND=mock python main_ga.py
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FAKE_TWEETS = [
+    "imagine believing this lol",
+    "this meme is so lazy it hurts",
+    "not the flex you think it is",
+    "who made this, a potato? 💀",
+    "fake news with extra steps",
+    "seriously? this again?",
+    "ratio'd by basic facts",
+    "bro really thought this was deep",
+]
+
+# --long-tweet-rate 时生成器返回的冗长说教文本 (用来压测流式截断)
+LONG_TWEET = ("While this image may seem funny to some, it is important to remember that every community deserves "
+              "respect and dignity. Let's take a moment to reflect on how our words affect others. Spreading "
+              "kindness online is more powerful than spreading hate, and together we can build a better internet.")
+
+FAKE_EDITS = [
+    "Keep it short and casual.",
+    "Sound like a real person scrolling at 2am.",
+    "Roast the meme, not the people in it.",
+    "Use lowercase and one emoji max.",
+    "Skip any moral lessons.",
+]
+
+_stats_lock = threading.Lock()
+stats = {"requests": 0, "errors_429": 0, "errors_5xx": 0, "malformed": 0, "streams_cut": 0}
+
+def _digest(*parts):
+    return int(hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest(), 16)
+
+def _message_text(messages):
+    parts = []
+    for m in messages:
+        content = m.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+        elif isinstance(content, list):
+            parts.extend(item.get("text", "") for item in content if item.get("type") == "text")
+    return "\n".join(parts)
+
+def _has_image(messages):
+    return any(
+        isinstance(m.get("content"), list) and any(item.get("type") == "image_url" for item in m["content"])
+        for m in messages
+    )
+
+def _role(body):
+    messages = body.get("messages", [])
+    if any(m.get("role") == "system" and "optimization engine" in str(m.get("content")) for m in messages):
+        return "mutator"
+    if body.get("response_format", {}).get("type") == "json_object":
+        return "evaluator"
+    return "generator"
+
+def _fake_scores(tweet):
+    h = _digest("score", tweet)
+    return {
+        "hate_score": h % 31,
+        "fluency_score": 60 + (h >> 8) % 41,
+        "relevance_score": 50 + (h >> 16) % 51,
+        "style_score": 30 + (h >> 24) % 71,
+        "preachiness_score": (h >> 32) % 81,
+    }
+
+def _fake_content(role, text, index=0, long_rate=0.0):
+    if role == "mutator":
+        original = text.split("Original Prompt:", 1)[-1].split("---------------------", 1)[0].strip()
+        edit = FAKE_EDITS[_digest("mutate", text, str(index)) % len(FAKE_EDITS)]
+        return f"{original} {edit}".strip()
+    if role == "evaluator":
+        tweets = re.findall(r'^\s*\[(\d+)\] "(.*)"$', text, flags=re.MULTILINE)
+        if tweets:
+            return json.dumps({"results": [dict(id=int(i), **_fake_scores(t)) for i, t in tweets]})
+        match = re.search(r'Tweet Text: "(.*)"', text, flags=re.DOTALL)
+        return json.dumps(_fake_scores(match.group(1) if match else text))
+    listed = re.search(r"Write (\d+) different tweets", text)
+    if listed:
+        # GENERATOR_N_MODE = "numbered_list"：一条回复里的编号列表
+        count = int(listed.group(1))
+        return "\n".join(f"{j + 1}. {_fake_tweet(text, index * count + j, long_rate)}" for j in range(count))
+    return _fake_tweet(text, index, long_rate)
+
+def _fake_tweet(text, index, long_rate):
+    if _digest("long", text, str(index)) % 1000 < long_rate * 1000:
+        return LONG_TWEET
+    base = FAKE_TWEETS[_digest("tweet", text, str(index)) % len(FAKE_TWEETS)]
+    return f"{base} #{_digest('tag', text, str(index)) % 1000}"
+
+_seen_prefixes = set()
+
+def _cached_prefix_tokens(messages):
+    """
+    模拟服务端前缀缓存：最后一段文本之前的全部内容 (system、图片等) 见过就算命中，
+    命中的 token 数按该前缀估算
+    """
+    prefix = json.dumps(messages, sort_keys=True)
+    last = messages[-1].get("content") if messages else None
+    if isinstance(last, list) and last and last[-1].get("type") == "text":
+        prefix = json.dumps(messages[:-1] + [dict(messages[-1], content=last[:-1])], sort_keys=True)
+    elif isinstance(last, str):
+        prefix = json.dumps(messages[:-1], sort_keys=True)
+    key = _digest("prefix", prefix)
+    with _stats_lock:
+        hit = key in _seen_prefixes
+        _seen_prefixes.add(key)
+    if not hit:
+        return 0
+    prefix_messages = json.loads(prefix)
+    return len(_message_text(prefix_messages)) // 4 + (256 if _has_image(prefix_messages) else 0)
+
+def _usage(text, content, has_image, cached_tokens=0):
+    prompt_tokens = len(text) // 4 + (256 if has_image else 0)
+    completion_tokens = sum(max(1, len(c) // 4) for c in content)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_tokens_details": {"cached_tokens": min(cached_tokens, prompt_tokens), "image_tokens": 256 if has_image else 0},
+    }
+
+def make_handler(args):
+    rng = random.Random(args.seed)
+    rng_lock = threading.Lock()
+    latency_ms = {
+        "generator": args.latency_generator,
+        "evaluator": args.latency_evaluator,
+        "mutator": args.latency_mutator,
+    }
+
+    def draw(fn):
+        with rng_lock:
+            return fn(rng)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *a):
+            if args.verbose:
+                super().log_message(fmt, *a)
+
+        def _send_json(self, status, payload, headers=None):
+            raw = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def _send_stream(self, body, content, usage):
+            """SSE 流式响应：内容按词切成 chunk，每个 chunk 之间间隔 --stream-chunk-ms，最后发用量"""
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            base = {"id": f"mock-{_digest(content) % 10**12}", "object": "chat.completion.chunk",
+                    "created": int(time.time()), "model": body.get("model", "mock")}
+            pieces = re.findall(r"\S+\s*", content) or [content]
+            try:
+                for piece in pieces:
+                    chunk = dict(base, choices=[{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+                    self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    time.sleep(args.stream_chunk_ms / 1000.0)
+                end = dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}])
+                self.wfile.write(f"data: {json.dumps(end)}\n\n".encode("utf-8"))
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    self.wfile.write(f"data: {json.dumps(dict(base, choices=[], usage=usage))}\n\n".encode("utf-8"))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # 客户端超出长度预算后主动断开
+                with _stats_lock:
+                    stats["streams_cut"] += 1
+
+        def _send_error(self, status, message, headers=None):
+            self._send_json(status, {"error": {"message": message, "type": "mock_error", "code": status}}, headers)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/models"):
+                self._send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model"}]})
+            else:
+                self._send_error(404, "not found")
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_error(404, "not found")
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            role = _role(body)
+            with _stats_lock:
+                stats["requests"] += 1
+
+            # 延迟：以配置值为中位数的对数正态分布
+            median = latency_ms[role] / 1000.0
+            if median > 0:
+                time.sleep(draw(lambda r: median * math.exp(r.gauss(0, args.latency_sigma))))
+
+            roll = draw(lambda r: r.random())
+            if roll < args.rate_429:
+                with _stats_lock:
+                    stats["errors_429"] += 1
+                self._send_error(429, "Rate limit exceeded (mock)", {"Retry-After": "1"})
+                return
+            if roll < args.rate_429 + args.rate_5xx:
+                with _stats_lock:
+                    stats["errors_5xx"] += 1
+                self._send_error(draw(lambda r: r.choice([500, 502, 503])), "Upstream error (mock)")
+                return
+
+            messages = body.get("messages", [])
+            text = _message_text(messages)
+            n = int(body.get("n") or 1)
+            content = [_fake_content(role, text, i, args.long_tweet_rate if role == "generator" else 0.0) for i in range(n)]
+            if role == "evaluator" and draw(lambda r: r.random()) < args.malformed_rate:
+                with _stats_lock:
+                    stats["malformed"] += 1
+                content = [c[: len(c) // 2] for c in content]
+
+            usage = _usage(text, content, _has_image(messages), _cached_prefix_tokens(messages))
+            if body.get("stream"):
+                self._send_stream(body, content[0], usage)
+                return
+            self._send_json(200, {
+                "id": f"mock-{_digest(text) % 10**12}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "mock"),
+                "choices": [
+                    {"index": i, "message": {"role": "assistant", "content": c}, "finish_reason": "stop"}
+                    for i, c in enumerate(content)
+                ],
+                "usage": usage,
+            })
+
+    return Handler
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible mock backend")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency-generator", type=float, default=800, help="median latency (ms)")
+    parser.add_argument("--latency-evaluator", type=float, default=1500, help="median latency (ms)")
+    parser.add_argument("--latency-mutator", type=float, default=2000, help="median latency (ms)")
+    parser.add_argument("--latency-sigma", type=float, default=0.4, help="lognormal sigma")
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--rate-5xx", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="evaluator malformed-JSON rate")
+    parser.add_argument("--long-tweet-rate", type=float, default=0.0, help="share of over-long generator outputs")
+    parser.add_argument("--stream-chunk-ms", type=float, default=20, help="delay between streamed chunks (ms)")
+    parser.add_argument("--verbose", action="store_true")
+    return parser.parse_args(argv)
+
+def serve(args):
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args))
+    server.daemon_threads = True
+    print(f"Mock LLM backend listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Mock stats: {stats}")
+
+if __name__ == "__main__":
+    serve(parse_args())
@@ -0,0 +1,203 @@
+# pipeline.py
+"""
+流水线 GA 调度器 (GA_SCHEDULER = "pipelined")
+
+逐代版本每代严格三步：整代评估 -> 排序 -> 繁殖 (阻塞的变异/交叉调用)，
+评估时变异器闲着，繁殖时生成器和评估器闲着。这里把相邻两代重叠起来：
+1. 第 g 代每个个体评完分就进入该代的"已评分池"；
+2. 池里有 PIPELINE_MIN_PARENTS 个个体后立即开始繁殖第 g+1 代，
+   锦标赛只在当时已评分的个体里选父代 (池子随评估推进变大)；
+3. 子代一出生就开始评估，不等整代繁殖完；
+4. 第 g 代全部评完后照常写历史、做早停检查，并把它的精英并入第 g+1 代。
+每代的 history / 运行日志记录格式与逐代版本相同；
+多个繁殖线程同时使用全局随机数，因此不保证与逐代版本相同的随机序列。
+"""
+import asyncio
+import logging
+from config import (
+    ELITISM_COUNT, GENERATIONS, POPULATION_SIZE, PIPELINE_MIN_PARENTS, PIPELINE_BREED_WORKERS, OFFSPRING_MAX_ROUNDS
+)
+from evaluator import aevaluate_prompt, ledger_result, summarize_samples, evaluation_failed
+from evolution import breed_child
+from llm_client import run_async
+import lineage
+import llm_metrics
+from similarity import DiversityFilter
+
+class _Cohort:
+    """
+    一代个体：成员陆续加入，每个成员一加入就开始评估
+    size 为本代的目标成员数：繁殖出来的一代成员是一个个加入的，
+    "父代就绪"要按目标成员数判断，不能按当时已加入的成员数
+    """
+
+    def __init__(self, gen, dataset, ledger, on_samples, done=None, sampler=None, size=None):
+        self.gen = gen
+        self.size = POPULATION_SIZE if size is None else size
+        # 本代的公共评估面板 (None 时每个成员各自随机抽样)
+        self.panel = None if sampler is None else sampler.panel(gen + 1)
+        self.dataset = dataset
+        self.ledger = ledger
+        self.on_samples = on_samples
+        self.done = done or {}
+        self.population = []
+        self.results = []
+        self.pool = []          # 已评分的 (prompt, fitness, metrics)，按完成顺序
+        self.parents_ready = asyncio.Event()
+        self._tasks = []
+        self._by_key = {}       # 规范化后相同的 Prompt 只评估一次
+
+    def add(self, prompt):
+        i = len(self.population)
+        self.population.append(prompt)
+        self.results.append(None)
+        key = prompt if self.ledger is None else self.ledger.key(prompt)
+        # 任务创建时复制上下文：评估调用的用量记到本代 (几代同时在评估)
+        with llm_metrics.scope(generation=self.gen + 1):
+            if key not in self._by_key:
+                self._by_key[key] = asyncio.ensure_future(self._evaluate(i, prompt))
+            self._tasks.append(asyncio.ensure_future(self._member(i, prompt, self._by_key[key])))
+
+    async def _evaluate(self, i, prompt):
+        if i in self.done:
+            # 续跑：本代已评估完的个体 (有账本时样本已装回账本)
+            if self.ledger is not None:
+                return ledger_result(self.ledger, prompt)
+            avg_fitness, metrics_log = summarize_samples(self.done[i])
+            return avg_fitness, metrics_log, self.done[i]
+        return await aevaluate_prompt(
+            prompt, self.dataset, self.ledger, lambda details: self.on_samples(self.gen, i, prompt, details), self.panel
+        )
+
+    async def _member(self, i, prompt, evaluation):
+        result = await evaluation
+        self.results[i] = result
+        # 全部样本失败的个体不能当父代 (0 分只是占位)
+        if not evaluation_failed(result[2]):
+            self.pool.append((prompt, result[0], result[1]))
+        if len(self.pool) >= min(PIPELINE_MIN_PARENTS, self.size):
+            self.parents_ready.set()
+
+    def cancel(self):
+        tasks = self._tasks + list(self._by_key.values())
+        for t in tasks:
+            t.cancel()
+        return tasks
+
+    async def finish(self):
+        """等所有成员评完，返回与 population 顺序一致的结果"""
+        await asyncio.gather(*self._tasks)
+        self.parents_ready.set()
+        return list(self.results)
+
+def _breed(pool):
+    """繁殖一个子代 (在线程里执行)；谱系记录先暂存，子代真正加入后再提交"""
+    with lineage.deferred() as records:
+        child = breed_child(pool)
+    return child, records
+
+async def _breed_into(source_pool, parents_ready, target, n_children, index=None):
+    """
+    从 source_pool (随评估推进变大) 繁殖 n_children 个不重复的子代并逐个加入 target
+    传入 index 时拒绝近重复的子代 (这里只拒绝、不继承 fitness)；
+    每个名额连续被拒 OFFSPRING_MAX_ROUNDS 次后只做精确去重；
+    连续 OFFSPRING_MAX_ROUNDS 次都与已有成员完全重复 (如变异器失败时返回父代原文) 时放弃该名额，
+    这一代成员数少于 POPULATION_SIZE
+    """
+    await parents_ready.wait()
+    if not source_pool:
+        logging.warning(f"  [PIPE] Generation {target.gen + 1}: no scored parents, {n_children} offspring slots left empty")
+        return
+    slots = [n_children]
+    given_up = [0]
+    screen = None if index is None else DiversityFilter(index, target.population)
+
+    async def _worker():
+        while slots[0] > 0:
+            slots[0] -= 1
+            rejected = 0
+            duplicates = 0
+            while duplicates < OFFSPRING_MAX_ROUNDS:
+                # 每次繁殖都取最新的已评分池
+                child, records = await asyncio.to_thread(_breed, list(source_pool))
+                if child in target.population:
+                    duplicates += 1
+                    continue
+                if screen is not None and rejected < OFFSPRING_MAX_ROUNDS and not screen(child):
+                    rejected += 1
+                    continue
+                lineage.commit(records, [child])
+                target.add(child)
+                break
+            else:
+                given_up[0] += 1
+
+    # 变异调用的用量记到子代所在的代
+    with llm_metrics.scope(generation=target.gen + 1):
+        await asyncio.gather(*[_worker() for _ in range(min(PIPELINE_BREED_WORKERS, n_children))])
+    if given_up[0]:
+        logging.warning(f"  [PIPE] Generation {target.gen + 1}: gave up {given_up[0]} offspring slots after "
+                        f"{OFFSPRING_MAX_ROUNDS} duplicate children each ({len(target.population)} members)")
+
+async def _run(gen, population, dataset, ledger, done, scored_population,
+               finish_generation, on_population, on_samples, index, sampler):
+    if scored_population is not None:
+        # 续跑时上次停在"评估完、繁殖前"：直接用已排序的结果繁殖
+        current = _Cohort(gen + 1, dataset, ledger, on_samples, sampler=sampler)
+        for prompt, _, _ in scored_population[:ELITISM_COUNT]:
+            current.add(prompt)
+        ready = asyncio.Event()
+        ready.set()
+        await _breed_into(scored_population, ready, current, POPULATION_SIZE - len(current.population), index)
+        gen += 1
+        on_population(gen, current.population)
+    else:
+        current = _Cohort(gen, dataset, ledger, on_samples, done, sampler, size=len(population))
+        for prompt in population:
+            current.add(prompt)
+
+    while True:
+        breeding = None
+        if gen + 1 < GENERATIONS:
+            nxt = _Cohort(gen + 1, dataset, ledger, on_samples, sampler=sampler)
+            breeding = asyncio.ensure_future(
+                _breed_into(current.pool, current.parents_ready, nxt, POPULATION_SIZE - ELITISM_COUNT, index)
+            )
+
+        results = await current.finish()
+        scored, stop = finish_generation(gen, current.population, results)
+        if stop or breeding is None:
+            if breeding is not None:
+                # 早停：已经开始的下一代直接丢弃
+                breeding.cancel()
+                await asyncio.gather(breeding, *nxt.cancel(), return_exceptions=True)
+            return
+
+        # 精英并入下一代 (有账本时只在新图片上追加样本)
+        n_early = len(nxt.population)
+        for prompt, _, _ in scored[:ELITISM_COUNT]:
+            if prompt not in nxt.population:
+                nxt.add(prompt)
+        await breeding
+        if len(nxt.population) < POPULATION_SIZE:
+            # 提前出生的子代与精英重复时补齐
+            await _breed_into(current.pool, current.parents_ready, nxt, POPULATION_SIZE - len(nxt.population), index)
+        logging.info(f"  [PIPE] Generation {gen + 2}: {n_early} children were bred before generation {gen + 1} finished")
+        gen += 1
+        on_population(gen, nxt.population)
+        current = nxt
+
+def run_pipelined(gen, population, dataset, ledger, done, scored_population,
+                  finish_generation, on_population, on_samples, index=None, sampler=None):
+    """
+    从第 gen 代 (0 起) 开始流水线运行到结束或早停
+    - population / done: 当前代的种群与续跑时已完成的样本 ({下标: 样本详情})
+    - scored_population: 续跑时当前代已评估完 (但还没繁殖) 的排序结果，否则 None
+    - finish_generation(gen, population, results) -> (排序后的 scored_population, 是否停止)
+    - on_population(gen, population): 下一代成员全部出生后回调 (写运行日志)
+    - on_samples(gen, index, prompt, details): 某个体的一批样本评估完成时回调
+    - index: SimilarityIndex，繁殖时拒绝近重复的子代
+    - sampler: sampling.PanelSampler，每代成员共用它给出的评估面板
+    """
+    run_async(_run(gen, population, dataset, ledger, done, scored_population,
+                   finish_generation, on_population, on_samples, index, sampler))
@@ -0,0 +1,100 @@
+# racing.py
+"""
+Racing / Successive-Halving 评估调度器
+
+不再给每个候选固定 SAMPLES_PER_EVAL 张图片：
+1. 所有候选先在 RACE_INITIAL_SAMPLES 张图片上评估；
+2. 计算每个候选的置信区间，精英线 = 第 ELITISM_COUNT 高的置信下界；
+   置信上界够不到精英线的候选直接淘汰 (不再花调用)；
+3. 剩余预算按轮分给仍在竞争的候选，每轮 RACE_STEP_SAMPLES 张，
+   直到预算用完 / 只剩精英数量的竞争者 / 竞争者都已达到 RACE_MAX_SAMPLES。
+样本全部记入 FitnessLedger，返回格式与 evaluator.evaluate_population 相同。
+"""
+import logging
+from evaluator import draw_samples, evaluate_panels, ledger_result
+from fitness_ledger import FitnessLedger, confidence_halfwidth
+from config import (
+    ELITISM_COUNT, RACE_INITIAL_SAMPLES, RACE_STEP_SAMPLES, RACE_MAX_SAMPLES,
+    RACE_BUDGET_PER_GEN, RACE_CONFIDENCE_Z
+)
+
+def _bounds(ledger, prompt):
+    """返回 (mean, lcb, ucb)；样本不足 2 个时区间视为无限宽"""
+    entry = ledger.summary(prompt)
+    if entry is None:
+        return 0.0, float("-inf"), float("inf")
+    hw = confidence_halfwidth([r["fitness"] for r in entry["details"]], RACE_CONFIDENCE_Z)
+    if hw is None:
+        return entry["fitness"], float("-inf"), float("inf")
+    return entry["fitness"], entry["fitness"] - hw, entry["fitness"] + hw
+
+def race_population(population, dataset, ledger=None, on_done=None):
+    """
+    自适应评估整代种群，返回与 population 顺序一致的 [(avg_fitness, average_metrics, detailed_results), ...]
+    on_done(i, details) 在第 i 个个体的一批样本完成时回调 (用于运行日志)；
+    续跑时已完成的样本在账本里，按"累计样本数目标"自然跳过
+    """
+    if ledger is None:
+        ledger = FitnessLedger()
+
+    budget = RACE_BUDGET_PER_GEN
+    # 同一代里规范化后相同的 Prompt 只参赛一次
+    contenders = []
+    seen_keys = set()
+    for i, p in enumerate(population):
+        if ledger.key(p) not in seen_keys:
+            contenders.append(i)
+            seen_keys.add(ledger.key(p))
+
+    round_no = 0
+    while contenders and budget > 0:
+        # 本轮每个竞争者需要追加的样本数
+        panels = {}
+        for i in contenders:
+            prompt = population[i]
+            have = len(ledger.seen_sids(prompt))
+            target = max(2, RACE_INITIAL_SAMPLES) if round_no == 0 else have + RACE_STEP_SAMPLES
+            want = min(target, RACE_MAX_SAMPLES) - have
+            if want <= 0 or budget <= 0:
+                continue
+            want = min(want, budget)
+            samples = draw_samples(dataset, ledger, prompt, k=want)
+            if samples:
+                panels[i] = samples
+                budget -= len(samples)
+        if not panels:
+            break
+
+        idxs = list(panels)
+        new_results = evaluate_panels(
+            [population[i] for i in idxs], [panels[i] for i in idxs],
+            None if on_done is None else (lambda k, details: on_done(idxs[k], details))
+        )
+        for i, details in zip(idxs, new_results):
+            ledger.add(population[i], details)
+
+        # 淘汰：置信上界够不到精英线
+        bounds = {i: _bounds(ledger, population[i]) for i in contenders}
+        lcbs = sorted((b[1] for b in bounds.values()), reverse=True)
+        cutoff = lcbs[min(ELITISM_COUNT, len(lcbs)) - 1]
+        survivors = [i for i in contenders if bounds[i][2] >= cutoff]
+        logging.info(
+            f"  [RACE] Round {round_no + 1}: {sum(len(v) for v in panels.values())} samples, "
+            f"{len(contenders) - len(survivors)} pruned, {len(survivors)} left, budget {budget}"
+        )
+        contenders = survivors
+        round_no += 1
+        if len(contenders) <= ELITISM_COUNT:
+            break
+
+    # 预算耗尽前没轮到的候选 (只在预算小于种群规模时出现)：至少评估一张
+    missing = list({ledger.key(population[i]): i for i in range(len(population)) if ledger.summary(population[i]) is None}.values())
+    if missing:
+        new_results = evaluate_panels(
+            [population[i] for i in missing], [draw_samples(dataset, ledger, population[i], k=1) for i in missing],
+            None if on_done is None else (lambda k, details: on_done(missing[k], details))
+        )
+        for i, details in zip(missing, new_results):
+            ledger.add(population[i], details)
+
+    return [ledger_result(ledger, p) for p in population]
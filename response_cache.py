@@ -0,0 +1,170 @@
+# response_cache.py
+"""
+LLM 响应的持久化缓存 (SQLite)
+
+Key = sha256(模型 + 完整 Prompt 文本 + temperature + 图片负载哈希 + 其他请求参数)
+只缓存成功的响应原文，清洗/解析逻辑仍由 llm_client 负责。
+
+模式 (config.CACHE_MODE):
+- off:          不读不写
+- read_through: 命中直接返回；未命中调用 API 并写入
+- record_only:  不读，只把每次 API 结果写入 (覆盖旧值)
+- replay:       严格回放，只读缓存；未命中抛出 CacheMiss，绝不调用 API
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from config import CACHE_MODE, CACHE_DB, CACHE_MAX_BYTES, CACHE_MAX_AGE_DAYS
+from image_store import payload_digest
+
+VALID_MODES = ("off", "read_through", "record_only", "replay")
+
+# 每写入多少条检查一次淘汰
+EVICT_EVERY = 200
+
+class CacheMiss(Exception):
+    """replay 模式下缓存未命中"""
+
+_lock = threading.Lock()
+_conn = None
+_conn_pid = None
+_puts_since_evict = 0
+_occurrences = {}
+# repeatable Key 的命名空间 (多进程岛屿共用缓存时，各岛的变异请求互不复用)
+_repeatable_namespace = ""
+
+# 命中统计 (本进程)
+stats = {"hits": 0, "misses": 0, "writes": 0}
+
+def _connect():
+    global _conn, _conn_pid
+    # 多进程 (fork) 下每个进程需要自己的连接
+    if _conn is not None and _conn_pid == os.getpid():
+        return _conn
+    conn = sqlite3.connect(CACHE_DB, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            model TEXT,
+            value TEXT,
+            size INTEGER,
+            created REAL,
+            last_access REAL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON responses(last_access)")
+    conn.commit()
+    _conn, _conn_pid = conn, os.getpid()
+    _evict_locked()
+    return conn
+
+def _prompt_text(messages):
+    """取出 messages 里的全部文本 (图片由 payload_digest 单独计入 Key)"""
+    parts = []
+    for m in messages:
+        content = m["content"]
+        if isinstance(content, str):
+            parts.append(f"{m['role']}:{content}")
+            continue
+        for item in content:
+            if item.get("type") == "text":
+                parts.append(f"{m['role']}:{item['text']}")
+    return "\n".join(parts)
+
+def make_key(model, messages, temperature, image_paths=(), repeatable=False, **params):
+    """
+    repeatable=True 用于本就期望"同样的请求每次给出不同结果"的调用 (如变异器)：
+    同一进程内第 n 次出现的相同请求映射到第 n 个缓存槽位，
+    这样重跑/续跑时按相同顺序回放，而同一轮内重复请求不会拿到同一个答案。
+    """
+    payload = {
+        "model": model,
+        "prompt": _prompt_text(messages),
+        "temperature": temperature,
+        "images": [payload_digest(p) for p in image_paths],
+        "params": params,
+    }
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    key = hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    if repeatable:
+        with _lock:
+            occurrence = _occurrences.get(key, 0)
+            _occurrences[key] = occurrence + 1
+        key = f"{key}#{_repeatable_namespace}{occurrence}"
+    return key
+
+def set_repeatable_namespace(name):
+    """之后的 repeatable Key 带上该命名空间 (空字符串为默认，兼容已有缓存)"""
+    global _repeatable_namespace
+    _repeatable_namespace = f"{name}:" if name else ""
+
+def get(key):
+    """
+    返回缓存的响应原文；未命中返回 None (replay 模式下抛出 CacheMiss)
+    """
+    if CACHE_MODE in ("off", "record_only"):
+        return None
+    with _lock:
+        conn = _connect()
+        row = conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+            stats["hits"] += 1
+            return row[0]
+        stats["misses"] += 1
+    if CACHE_MODE == "replay":
+        raise CacheMiss(f"No cached response for key {key[:12]}... (CACHE_MODE=replay)")
+    return None
+
+def put(key, model, value):
+    global _puts_since_evict
+    if CACHE_MODE in ("off", "replay"):
+        return
+    now = time.time()
+    with _lock:
+        conn = _connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (key, model, value, size, created, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+            (key, model, value, len(value.encode("utf-8")), now, now)
+        )
+        conn.commit()
+        stats["writes"] += 1
+        _puts_since_evict += 1
+        if _puts_since_evict >= EVICT_EVERY:
+            _evict_locked()
+
+def _evict_locked():
+    """按年龄和总大小淘汰 (最久未访问的先删)"""
+    global _puts_since_evict
+    _puts_since_evict = 0
+    conn = _conn
+    removed = 0
+    if CACHE_MAX_AGE_DAYS:
+        cutoff = time.time() - CACHE_MAX_AGE_DAYS * 86400
+        removed += conn.execute("DELETE FROM responses WHERE created < ?", (cutoff,)).rowcount
+    if CACHE_MAX_BYTES:
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total > CACHE_MAX_BYTES:
+            excess = total - CACHE_MAX_BYTES
+            rows = conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC").fetchall()
+            victims = []
+            for key, size in rows:
+                if excess <= 0:
+                    break
+                victims.append((key,))
+                excess -= size
+            conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+            removed += len(victims)
+    conn.commit()
+    if removed:
+        logging.info(f"  [CACHE] Evicted {removed} entries from {CACHE_DB}")
+
+if CACHE_MODE not in VALID_MODES:
+    raise ValueError(f"CACHE_MODE must be one of {VALID_MODES}, got {CACHE_MODE!r}")
@@ -0,0 +1,135 @@
+# results_store.py
+"""
+GA 运行结果的列式存储 (Parquet)
+
+把每个 ga_history_*.json 只解析一次，拆成两张表：
+- individuals: 每个 (运行, 代, 个体) 一行
+- samples:     每个 (运行, 代, 个体, 图片) 的样本评估一行
+按运行分文件存放在 ANALYTICS_DIR 下，增量导入 (源文件大小/修改时间没变就跳过)。
+分析时直接读 Parquet，用 pandas 向量化聚合，多次运行可以一起比较。
+读写 Parquet 需要 pyarrow (pip install pyarrow)，没装时 ingest / load_* 直接报错说明。
+"""
+import glob
+import importlib.util
+import json
+import os
+import pandas as pd
+from config import ANALYTICS_DIR
+
+MANIFEST_FILE = os.path.join(ANALYTICS_DIR, "ingested.json")
+METRIC_COLUMNS = ["hate", "fluency", "relevance", "style", "preachy"]
+SCORE_COLUMNS = ["hate_score", "fluency_score", "relevance_score", "style_score", "preachiness_score"]
+
+def run_id_of(history_file):
+    """ga_history_1765786395.json -> 1765786395"""
+    stem = os.path.splitext(os.path.basename(history_file))[0]
+    return stem.replace("ga_history_", "", 1)
+
+def _require_parquet():
+    # pandas 在第一次读写时才报"找不到引擎"，这里提前给出明确的安装提示
+    if importlib.util.find_spec("pyarrow") is None and importlib.util.find_spec("fastparquet") is None:
+        raise ImportError("results_store needs a Parquet engine for pandas: pip install pyarrow")
+
+def _table_path(table, run_id):
+    return os.path.join(ANALYTICS_DIR, table, f"{run_id}.parquet")
+
+def _load_manifest():
+    if not os.path.exists(MANIFEST_FILE):
+        return {}
+    with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _save_manifest(manifest):
+    with open(MANIFEST_FILE, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+def _flatten(history, run_id):
+    ind_rows = []
+    sample_rows = []
+    for gen_data in history:
+        g_num = gen_data["generation"]
+        for rank, ind in enumerate(gen_data["individuals"]):
+            metrics = ind.get("average_metrics", {})
+            ind_rows.append({
+                "run_id": run_id,
+                "generation": g_num,
+                "prompt_id": ind.get("prompt_id"),
+                "rank": rank,
+                "prompt_text": ind.get("prompt_text"),
+                "fitness": ind.get("fitness"),
+                # 旧版 history 没有 preachy
+                **{m: metrics.get(m, 0) for m in METRIC_COLUMNS},
+                "n_samples": ind.get("n_samples", len(ind.get("sample_evaluations", []))),
+            })
+            for s in ind.get("sample_evaluations", []):
+                raw = s.get("raw_scores") or {}
+                sample_rows.append({
+                    "run_id": run_id,
+                    "generation": g_num,
+                    "prompt_id": ind.get("prompt_id"),
+                    "sid": str(s.get("sid")),
+                    "image_path": s.get("image_path"),
+                    "generated_text": s.get("generated_text"),
+                    "fitness": s.get("fitness"),
+                    **{k: raw.get(k) for k in SCORE_COLUMNS},
+                })
+    return pd.DataFrame(ind_rows), pd.DataFrame(sample_rows)
+
+def ingest(paths=None):
+    """
+    把 history 文件导入列式存储 (默认当前目录下全部 ga_history_*.json)，
+    已导入且未变化的文件跳过。返回 {run_id: 源文件 mtime}
+    """
+    _require_parquet()
+    paths = paths if paths is not None else glob.glob("ga_history_*.json")
+    os.makedirs(os.path.join(ANALYTICS_DIR, "individuals"), exist_ok=True)
+    os.makedirs(os.path.join(ANALYTICS_DIR, "samples"), exist_ok=True)
+    manifest = _load_manifest()
+
+    for path in paths:
+        st = os.stat(path)
+        run_id = run_id_of(path)
+        entry = manifest.get(run_id)
+        if entry and entry["size"] == st.st_size and entry["mtime"] == st.st_mtime:
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            history = json.load(f)
+        individuals, samples = _flatten(history, run_id)
+        individuals.to_parquet(_table_path("individuals", run_id), index=False)
+        samples.to_parquet(_table_path("samples", run_id), index=False)
+        manifest[run_id] = {"source": path, "size": st.st_size, "mtime": st.st_mtime}
+        print(f"  Ingested {path}: {len(individuals)} individuals, {len(samples)} samples")
+
+    _save_manifest(manifest)
+    return {run_id: entry["mtime"] for run_id, entry in manifest.items()}
+
+def latest_run_id():
+    manifest = _load_manifest()
+    if not manifest:
+        return None
+    return max(manifest, key=lambda r: manifest[r]["mtime"])
+
+def _load(table, run_ids=None, columns=None):
+    _require_parquet()
+    if run_ids is None:
+        files = glob.glob(os.path.join(ANALYTICS_DIR, table, "*.parquet"))
+    else:
+        files = [_table_path(table, r) for r in run_ids]
+    if not files:
+        return pd.DataFrame()
+    return pd.concat([pd.read_parquet(f, columns=columns) for f in files], ignore_index=True)
+
+def load_individuals(run_ids=None, columns=None):
+    return _load("individuals", run_ids, columns)
+
+def load_samples(run_ids=None, columns=None):
+    return _load("samples", run_ids, columns)
+
+def generation_stats(individuals):
+    """每个 (运行, 代) 的 fitness 最大/平均值以及各子指标平均值"""
+    agg = individuals.groupby(["run_id", "generation"]).agg(
+        max_fitness=("fitness", "max"),
+        avg_fitness=("fitness", "mean"),
+        **{f"avg_{m}": (m, "mean") for m in METRIC_COLUMNS},
+    )
+    return agg.reset_index().sort_values(["run_id", "generation"])
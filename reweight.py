@@ -0,0 +1,171 @@
+# reweight.py
+"""
+离线重新加权：用 history 里保存的 raw_scores 按任意权重重算 fitness，不再调用 API
+
+fitness = Σ w_i * c_i 是各子指标 c_i (与 scoring.score_sample 的归一化相同) 的线性组合，
+所以每个候选 Prompt 只需算一次子指标均值矩阵 M (候选数 × 5)，任意一组权重下的 fitness 就是 M @ w，
+一批权重 W 就是一次矩阵乘法 M @ W.T。
+- 候选 = 去重后的 Prompt 文本 (跨代、跨运行合并)；账本模式下同一样本在多代记录里重复出现，按 (运行, 图片, 生成文本) 去重；
+- failed 样本 (raw_scores 为空) 不计入，缺失的分项按 score_sample 的默认值处理；
+  早期按 0-10 打分的运行 (整次运行分数都不超过 10) 换算到 0-100；
+- pareto_front: 五个子指标上的非支配候选 (与权重无关)；
+- sweep: 单纯形上按步长枚举的权重网格，分块计算每组权重下的最优候选和与当前权重 top-k 的重合度。
+
+用法:
+  python reweight.py                               # 当前 config 权重下的排名
+  python reweight.py --weights 0.6 0.2 0.05 0.05 0.1 --top 20
+  python reweight.py --pareto
+  python reweight.py --sweep 0.1 --out weight_sweep.csv
+"""
+import argparse
+import itertools
+import numpy as np
+import pandas as pd
+from config import W_HATE, W_PREACHY, W_FLUENCY, W_REL, W_STYLE
+from scoring import score_scale
+from results_store import ingest, load_individuals, load_samples, SCORE_COLUMNS
+
+# 子指标顺序 (权重向量按这个顺序)
+COMPONENTS = ["hate", "preachy", "fluency", "relevance", "style"]
+CONFIG_WEIGHTS = np.array([W_HATE, W_PREACHY, W_FLUENCY, W_REL, W_STYLE])
+
+def component_matrix(samples):
+    """raw_scores 列 -> 归一化子指标 (样本数 × 5)，越大越好"""
+    raw = samples[SCORE_COLUMNS].to_numpy(dtype=float)
+    hate, fluency, relevance, style, preachy = raw.T
+    return np.column_stack([
+        np.maximum(0, 100 - hate) / 100.0,
+        np.maximum(0, 100 - preachy) / 100.0,
+        fluency / 100.0,
+        relevance / 100.0,
+        style / 100.0,
+    ])
+
+def load_candidates(run_ids=None, min_samples=1):
+    """
+    返回 (prompts, M, counts)：去重后的候选 Prompt、每个候选的子指标均值矩阵、有效样本数
+    """
+    individuals = load_individuals(run_ids, columns=["run_id", "generation", "prompt_id", "prompt_text"])
+    samples = load_samples(run_ids, columns=["run_id", "generation", "prompt_id", "sid", "generated_text", "fitness"] + SCORE_COLUMNS)
+    if individuals.empty or samples.empty:
+        return [], np.zeros((0, len(COMPONENTS))), np.zeros(0, dtype=int)
+
+    # failed 样本没有 fitness；其余缺失的分项按 score_sample 的默认值补 (旧版 history 没有 preachiness_score)
+    samples = samples[samples["fitness"].notna()].copy()
+    # 早期运行的评估器按 0-10 打分：按整次运行的最大分换算成 0-100 (与 surrogate / sampling 共用 scoring.score_scale)
+    scale = samples.groupby("run_id")[SCORE_COLUMNS].max().max(axis=1).map(score_scale)
+    samples[SCORE_COLUMNS] = samples[SCORE_COLUMNS].mul(samples["run_id"].map(scale), axis=0)
+    samples = samples.fillna({k: 100 if k in ("hate_score", "preachiness_score") else 0 for k in SCORE_COLUMNS})
+    samples = samples.merge(individuals, on=["run_id", "generation", "prompt_id"])
+    samples = samples.drop_duplicates(subset=["prompt_text", "run_id", "sid", "generated_text"])
+
+    codes, prompts = pd.factorize(samples["prompt_text"])
+    counts = np.bincount(codes, minlength=len(prompts))
+    C = component_matrix(samples)
+    M = np.zeros((len(prompts), len(COMPONENTS)))
+    np.add.at(M, codes, C)
+    M /= counts[:, None]
+
+    keep = counts >= min_samples
+    return list(np.asarray(prompts)[keep]), M[keep], counts[keep]
+
+def rescore(M, weights):
+    """weights 为 (5,) 或 (k, 5)，返回 (候选数,) 或 (候选数, k) 的 fitness"""
+    return M @ np.asarray(weights, dtype=float).T
+
+def ranking(M, weights):
+    """按 fitness 从高到低的候选下标"""
+    return np.argsort(-rescore(M, weights), kind="stable")
+
+def pareto_front(M, chunk=512):
+    """非支配候选的下标：没有其他候选在所有子指标上都不差且至少一项更好"""
+    dominated = np.zeros(len(M), dtype=bool)
+    for start in range(0, len(M), chunk):
+        block = M[start:start + chunk]
+        # ge[i, j]: 候选 j 在所有子指标上 >= 候选 i；gt: 至少一项 >
+        ge = (M[None, :, :] >= block[:, None, :]).all(axis=2)
+        gt = (M[None, :, :] > block[:, None, :]).any(axis=2)
+        dominated[start:start + chunk] = (ge & gt).any(axis=1)
+    return np.flatnonzero(~dominated)
+
+def weight_grid(step):
+    """单纯形上的权重网格：各分量为 step 的整数倍且和为 1"""
+    n = int(round(1 / step))
+    grid = [c for c in itertools.product(range(n + 1), repeat=len(COMPONENTS) - 1) if sum(c) <= n]
+    return np.array([list(c) + [n - sum(c)] for c in grid], dtype=float) / n
+
+def sweep(M, W, baseline=CONFIG_WEIGHTS, top_k=10, chunk=2048):
+    """
+    对一批权重 W (k × 5) 一次算完：每组权重下的最优候选、最优 fitness，
+    以及 top_k 与 baseline 权重 top_k 的重合比例
+    """
+    k = min(top_k, len(M))
+    base_top = set(ranking(M, baseline)[:k].tolist())
+    best_idx = np.empty(len(W), dtype=int)
+    best_fit = np.empty(len(W))
+    overlap = np.empty(len(W))
+    for start in range(0, len(W), chunk):
+        F = rescore(M, W[start:start + chunk])          # 候选数 × 块大小
+        best_idx[start:start + chunk] = F.argmax(axis=0)
+        best_fit[start:start + chunk] = F.max(axis=0)
+        top = np.argpartition(-F, k - 1, axis=0)[:k].T  # 块大小 × k
+        overlap[start:start + chunk] = [len(base_top.intersection(row.tolist())) / k for row in top]
+    return best_idx, best_fit, overlap
+
+def _short(text, n=90):
+    text = " ".join(text.split())
+    return text if len(text) <= n else text[:n - 3] + "..."
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score stored GA results under different fitness weights")
+    parser.add_argument("--runs", nargs="+", help="run ids to include (default: every ingested run)")
+    parser.add_argument("--weights", nargs=5, type=float, metavar=("HATE", "PREACHY", "FLUENCY", "REL", "STYLE"),
+                        help="weight vector (default: config.py)")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--min-samples", type=int, default=3, help="ignore prompts with fewer valid samples")
+    parser.add_argument("--pareto", action="store_true", help="print the Pareto front over the five metrics")
+    parser.add_argument("--sweep", type=float, metavar="STEP", help="sweep a simplex weight grid with this step")
+    parser.add_argument("--out", help="CSV file for --sweep results")
+    args = parser.parse_args()
+
+    ingest()
+    prompts, M, counts = load_candidates(args.runs, args.min_samples)
+    if not prompts:
+        print("No scored samples found.")
+        return
+    weights = CONFIG_WEIGHTS if args.weights is None else np.array(args.weights)
+    print(f"{len(prompts)} candidate prompts, {counts.sum()} valid samples; weights {dict(zip(COMPONENTS, weights))}")
+
+    fitness = rescore(M, weights)
+    base_order = ranking(M, CONFIG_WEIGHTS)
+    base_rank = np.empty(len(prompts), dtype=int)
+    base_rank[base_order] = np.arange(len(prompts))
+    print(f"\n--- Top {args.top} ---")
+    for pos, i in enumerate(ranking(M, weights)[:args.top]):
+        print(f"{pos + 1:3d}. {fitness[i]:.4f} (config rank {base_rank[i] + 1}, n={counts[i]}) {_short(prompts[i])}")
+
+    if args.pareto:
+        front = pareto_front(M)
+        print(f"\n--- Pareto front ({len(front)} prompts) ---")
+        print("  " + " ".join(f"{c:>9}" for c in COMPONENTS))
+        for i in front[np.argsort(-fitness[front])]:
+            print("  " + " ".join(f"{v:9.3f}" for v in M[i]) + f"  {_short(prompts[i], 60)}")
+
+    if args.sweep:
+        W = weight_grid(args.sweep)
+        best_idx, best_fit, overlap = sweep(M, W, top_k=args.top)
+        print(f"\n--- Sweep: {len(W)} weight vectors ---")
+        winners = pd.Series(best_idx).value_counts()
+        for i, n in winners.head(args.top).items():
+            print(f"  best under {n:5d} vectors: {_short(prompts[i])}")
+        print(f"  top-{args.top} overlap with config weights: mean {overlap.mean():.2f}, min {overlap.min():.2f}")
+        if args.out:
+            table = pd.DataFrame(W, columns=[f"w_{c}" for c in COMPONENTS])
+            table["best_fitness"] = best_fit
+            table["best_prompt"] = [prompts[i] for i in best_idx]
+            table[f"top{args.top}_overlap"] = overlap
+            table.to_csv(args.out, index=False)
+            print(f"  Saved {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+# run_journal.py
+"""
+追加写入的运行日志 (JSONL)，用于崩溃后断点续跑
+
+每条记录一行 JSON，只追加不重写 (替代每代全量重写 ga_history json 的做法)：
+- run_start:       {history_file}
+- population:      {generation, population, rng_state}      每代开始时的种群与随机数状态
+- samples:         {generation, index, prompt, details}     某个 Prompt 的一批样本评估完成
+- individual:      {generation, record}                     某个个体的最终记录 (即 history 里的一项)
+- generation_end:  {generation, best_score, best_prompt, global_best_score, global_best_prompt, patience, rng_state}
+- run_end:         {llm_usage}  (本进程的 LLM 用量汇总，见 llm_metrics.py)
+
+用法: python run_journal.py ga_run_xxx.jsonl [output.json]   从日志导出 ga_history json
+"""
+import json
+import logging
+import os
+import sys
+from config import JOURNAL_FSYNC
+
+def encode_rng_state(state):
+    version, internal, gauss_next = state
+    return [version, list(internal), gauss_next]
+
+def decode_rng_state(data):
+    version, internal, gauss_next = data
+    return (version, tuple(internal), gauss_next)
+
+def _repair_tail(path):
+    """
+    续写前处理崩溃留下的最后一行 (没有换行符)：完整的 JSON 补上换行，写了一半的截掉，
+    否则新事件会接在残行后面，下次读日志时整行都解析不了
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        start = end
+        while start > 0:
+            step = min(1 << 16, start)
+            f.seek(start - step)
+            newline = f.read(step).rfind(b"\n")
+            if newline >= 0:
+                start = start - step + newline + 1
+                break
+            start -= step
+        if start == end:
+            return
+        f.seek(start)
+        tail = f.read()
+        try:
+            json.loads(tail.decode("utf-8"))
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            f.truncate(start)
+            logging.warning(f"  [JOURNAL] Dropped a partially written last line ({end - start} bytes) from {path}")
+        else:
+            f.write(b"\n")
+
+class RunJournal:
+    def __init__(self, path):
+        self.path = path
+        _repair_tail(path)
+        self._f = open(path, "a", encoding="utf-8")
+
+    def write(self, event, **fields):
+        fields["event"] = event
+        self._f.write(json.dumps(fields, ensure_ascii=False) + "\n")
+        self._f.flush()
+        if JOURNAL_FSYNC:
+            os.fsync(self._f.fileno())
+
+    def close(self):
+        self._f.close()
+
+def read_events(path):
+    """
+    读出全部事件；只有最后一行允许是崩溃时写了一半的残行 (跳过)，
+    中间的行解析失败说明日志已损坏，直接报错而不是丢掉后面的事件
+    """
+    # 残行可能截断在多字节字符中间
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        lines = [(n, line.strip()) for n, line in enumerate(f, 1) if line.strip()]
+    events = []
+    for k, (n, line) in enumerate(lines):
+        try:
+            events.append(json.loads(line))
+        except json.JSONDecodeError as e:
+            if k == len(lines) - 1:
+                break
+            raise ValueError(f"Corrupted journal {path}: line {n} is not valid JSON") from e
+    return events
+
+def _sort_generation(gen_data):
+    gen_data["individuals"].sort(key=lambda x: x["fitness"], reverse=True)
+    return gen_data
+
+def load_state(path, ledger=None):
+    """
+    从日志重建运行状态；传入 ledger 时把所有已评估样本重新装进账本。
+    返回 dict:
+      history_file, history (已完成代的 ga_history 列表),
+      generation (当前代, 从 0 开始), population, rng_state,
+      done ({个体下标: 本代已完成的样本详情})，scored (本代已结束时的 [(prompt, fitness, metrics)] 排序结果，否则 None),
+      global_best_score, global_best_prompt, patience, finished
+    """
+    state = {
+        "history_file": None, "history": [], "generation": 0, "population": [], "rng_state": None,
+        "done": {}, "scored": None, "global_best_score": -1.0, "global_best_prompt": "",
+        "patience": 0, "finished": False,
+    }
+    current = None
+    # 流水线调度下，下一代的样本可能先于它的 population 记录写入
+    pending = {}
+    for ev in read_events(path):
+        kind = ev["event"]
+        if kind == "run_start":
+            state["history_file"] = ev["history_file"]
+        elif kind == "population":
+            state["generation"] = ev["generation"] - 1
+            state["population"] = ev["population"]
+            state["rng_state"] = decode_rng_state(ev["rng_state"])
+            state["done"] = pending.setdefault(ev["generation"], {})
+            state["scored"] = None
+            current = {"generation": ev["generation"], "individuals": []}
+        elif kind == "samples":
+            if ledger is not None:
+                ledger.add(ev["prompt"], ev["details"])
+            pending.setdefault(ev["generation"], {}).setdefault(ev["index"], []).extend(ev["details"])
+        elif kind == "individual":
+            current["individuals"].append(ev["record"])
+        elif kind == "generation_end":
+            current["best_score"] = ev["best_score"]
+            current["best_prompt"] = ev["best_prompt"]
+            state["history"].append(_sort_generation(current))
+            state["scored"] = [
+                (ind["prompt_text"], ind["fitness"], ind["average_metrics"]) for ind in current["individuals"]
+            ]
+            state["global_best_score"] = ev["global_best_score"]
+            state["global_best_prompt"] = ev["global_best_prompt"]
+            state["patience"] = ev["patience"]
+            state["rng_state"] = decode_rng_state(ev["rng_state"])
+        elif kind == "run_end":
+            state["finished"] = True
+    return state
+
+def export_history(path, output_file=None):
+    state = load_state(path)
+    output_file = output_file or state["history_file"]
+    with open(output_file, "w", encoding="utf-8") as f:
+        json.dump(state["history"], f, indent=2, ensure_ascii=False)
+    print(f"Exported {len(state['history'])} generations to {output_file}")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python run_journal.py <journal.jsonl> [output.json]")
+    else:
+        export_history(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
@@ -1,11 +1,17 @@
 import os
 import json
 import glob
+import asyncio
+import hashlib
 import textwrap
 import random
+import functools
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from PIL import Image, ImageDraw, ImageFont
 from config import DATA_FILE, HATE_SPEECH_DEF, OUTPUT_CONSTRAINT
-from llm_client import call_generator
+from llm_client import acall_generator, run_async
+import image_store
 
 # ================= 配置 =================
 IMAGE_DIR = "images"  # 图片文件夹
@@ -18,6 +24,17 @@ OUTPUT_DIR_BEST = "pair_results"
 OUTPUT_JSON_INIT = "final_results_initial.json"
 OUTPUT_DIR_INIT = "initial_pair_results"
 
+# 生成阶段：两组 Prompt 共用的最大在途生成请求数；
+# 每条结果生成完立即追加到 final_results_*.jsonl，中断后重跑会跳过已完成的 (sid, prompt_hash)；
+# 想全部重新生成时删掉对应的 .jsonl
+GEN_MAX_IN_FLIGHT = 16
+
+# 渲染阶段 (进程池，与生成阶段并行)
+RENDER_WORKERS = max(1, (os.cpu_count() or 2) - 1)   # 渲染进程数
+RENDER_QUEUE_SIZE = 64                              # 排队等待渲染的最大任务数，满了生成阶段会等待
+RENDER_IMAGE_CACHE = 64                             # 每个渲染进程缓存的已解码原图数
+RENDER_MANIFEST = ".render_manifest.jsonl"          # 输出目录下的渲染清单 (输出文件 -> 输入指纹)
+
 def find_latest_history():
     list_of_files = glob.glob('ga_history_*.json') 
     if not list_of_files:
@@ -25,24 +42,33 @@ def find_latest_history():
     latest_file = max(list_of_files, key=os.path.getctime)
     return latest_file
 
+@functools.lru_cache(maxsize=1)
+def _load_font():
+    # 尝试加载字体，失败则使用默认 (每个渲染进程只加载一次)
+    try:
+        return ImageFont.truetype(FONT_PATH, FONT_SIZE)
+    except OSError:
+        return ImageFont.load_default()
+
+@functools.lru_cache(maxsize=RENDER_IMAGE_CACHE)
+def _load_image(image_path, mtime_ns):
+    # 同一张原图会和多个 Prompt 的文本拼接，解码结果按 (路径, 修改时间) 缓存
+    return Image.open(image_path).convert("RGB")
+
 def add_text_to_image(image_path, text, output_path):
     """
     将文本拼接到图片下方，类似长图模式，方便放进论文
+    成功返回 True
     """
     try:
-        img = Image.open(image_path).convert("RGB")
+        img = _load_image(image_path, os.stat(image_path).st_mtime_ns)
     except Exception as e:
         print(f"Error opening image {image_path}: {e}")
-        return
+        return False
 
     # 准备画布宽度和基础字体
     width, height = img.size
-    
-    # 尝试加载字体，失败则使用默认
-    try:
-        font = ImageFont.truetype(FONT_PATH, FONT_SIZE)
-    except:
-        font = ImageFont.load_default()
+    font = _load_font()
 
     # 自动换行
     # 估算每行字符数 (假设平均字符宽度为字体大小的0.5倍)
@@ -68,49 +94,187 @@ def add_text_to_image(image_path, text, output_path):
         y_text += line_height
         
     new_img.save(output_path)
+    return True
+
+def render_key(image_path, text):
+    """渲染输入的指纹：原图 (路径/大小/修改时间) + 文本 + 字体设置，任何一项变化都要重画"""
+    st = os.stat(image_path)
+    raw = json.dumps([image_path, st.st_size, st.st_mtime_ns, text, FONT_PATH, FONT_SIZE], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
 
-def run_generation_batch(prompts, image_files, output_json_name, output_img_dir):
+class RenderStage:
     """
-    使用一组 Prompts 对一组图片进行生成
+    渲染阶段：生成阶段把 (原图, 文本, 输出路径) 放进有界队列，由进程池并行渲染保存；
+    输出文件已存在且渲染清单里的输入指纹没变时直接跳过
+    """
+
+    def __init__(self, workers=RENDER_WORKERS, queue_size=RENDER_QUEUE_SIZE):
+        self._pool = ProcessPoolExecutor(max_workers=workers)
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._lock = threading.Lock()
+        self._manifests = {}
+        self.stats = {"rendered": 0, "skipped": 0, "failed": 0}
+
+    def _manifest(self, output_dir):
+        if output_dir not in self._manifests:
+            manifest = {}
+            path = os.path.join(output_dir, RENDER_MANIFEST)
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except json.JSONDecodeError:
+                            continue
+                        manifest[entry["output"]] = entry["key"]
+            self._manifests[output_dir] = manifest
+        return self._manifests[output_dir]
+
+    def submit(self, image_path, text, output_path):
+        output_dir, name = os.path.split(output_path)
+        try:
+            key = render_key(image_path, text)
+        except OSError as e:
+            print(f"Error opening image {image_path}: {e}")
+            return
+        with self._lock:
+            if self._manifest(output_dir).get(name) == key and os.path.exists(output_path):
+                self.stats["skipped"] += 1
+                return
+        # 队列满时阻塞，生成阶段不会无限堆积待渲染的任务
+        self._slots.acquire()
+        future = self._pool.submit(add_text_to_image, image_path, text, output_path)
+        future.add_done_callback(lambda f: self._done(f, output_dir, name, key))
+
+    def _done(self, future, output_dir, name, key):
+        self._slots.release()
+        ok = future.exception() is None and future.result()
+        with self._lock:
+            if not ok:
+                self.stats["failed"] += 1
+                return
+            self.stats["rendered"] += 1
+            self._manifest(output_dir)[name] = key
+            with open(os.path.join(output_dir, RENDER_MANIFEST), "a", encoding="utf-8") as f:
+                f.write(json.dumps({"output": name, "key": key}) + "\n")
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        print(f"  Rendering done: {self.stats['rendered']} rendered, {self.stats['skipped']} up to date, "
+              f"{self.stats['failed']} failed")
+
+def _stream_path(output_json_name):
+    return os.path.splitext(output_json_name)[0] + ".jsonl"
+
+def _load_stream(path):
+    """读取已流式写入的记录 (崩溃时写了一半的最后一行忽略)"""
+    records = []
+    if not os.path.exists(path):
+        return records
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
+
+def prompt_hash(prompt):
+    """续跑按 Prompt 内容匹配记录，不依赖它在这一组里的位置"""
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+def _record_hash(record):
+    # 早先的记录没有 prompt_hash 字段，按内容现算
+    return record.get("prompt_hash") or prompt_hash(record["prompt_content"])
+
+def recorded_prompts(output_json_name):
+    """上次中断的这一组用过的 Prompts (按首次出现时的 prompt_id 排序，去重)；没有记录时返回 None"""
+    first = {}
+    for r in _load_stream(_stream_path(output_json_name)):
+        first.setdefault(_record_hash(r), (r["prompt_id"], r["prompt_content"]))
+    if not first:
+        return None
+    return [content for _, content in sorted(first.values(), key=lambda v: v[0])]
+
+async def run_generation_batch(prompts, image_files, output_json_name, output_img_dir, renderer, slots):
+    """
+    使用一组 Prompts 对一组图片进行生成，拼图交给 renderer (RenderStage) 在后台进程里完成
+    slots (asyncio.Semaphore) 限制在途生成请求数；每条结果完成即追加到 .jsonl，
+    已成功完成的 (sid, prompt_hash) 不再重复生成，最后再汇总写出 output_json_name
     """
     if not os.path.exists(output_img_dir):
         os.makedirs(output_img_dir)
-        
-    results = []
-    
-    print(f"\n>>> Processing batch for {output_json_name}...")
-    
+
+    stream_path = _stream_path(output_json_name)
+    hashes = [prompt_hash(p) for p in prompts]
+    done = {}
+    for r in _load_stream(stream_path):
+        # 只认成功记录；prompt_id 按本次的顺序重新编号
+        if r.get("status") != "failed" and _record_hash(r) in hashes:
+            p_idx = hashes.index(_record_hash(r))
+            done[(r["sid"], p_idx)] = dict(r, prompt_id=p_idx, prompt_hash=hashes[p_idx])
+
+    jobs = []
     for p_idx, prompt in enumerate(prompts):
-        print(f"  Using Prompt {p_idx+1}/{len(prompts)}")
-        
         for img_file in image_files:
-            img_path = os.path.join(IMAGE_DIR, img_file)
-            sid = os.path.splitext(img_file)[0]
-            
+            jobs.append((p_idx, prompt, img_file))
+    print(f"\n>>> Processing batch for {output_json_name}: {len(jobs)} pairs, {len(done)} already done")
+
+    results = {}
+    stream = open(stream_path, "a", encoding="utf-8")
+
+    async def _one(p_idx, prompt, img_file):
+        img_path = os.path.join(IMAGE_DIR, img_file)
+        sid = os.path.splitext(img_file)[0]
+        record = done.get((sid, p_idx))
+        if record is None:
             # 生成文本
             # 注意：这里需要加上 Output Constraint，保持和训练时一致
             full_instruction = prompt + "\n" + OUTPUT_CONSTRAINT
-            
-            tweet_text = call_generator(img_path, HATE_SPEECH_DEF, full_instruction)
-            
+            async with slots:
+                tweet_text = await acall_generator(img_path, HATE_SPEECH_DEF, full_instruction)
+
             # 记录结果
             record = {
                 "sid": sid,
                 "prompt_id": p_idx,
+                "prompt_hash": hashes[p_idx],
                 "prompt_content": prompt,
                 "generated_text": tweet_text
             }
-            results.append(record)
-            
-            # 生成图片
-            out_img_name = f"{sid}_p{p_idx}.jpg"
-            out_img_path = os.path.join(output_img_dir, out_img_name)
-            add_text_to_image(img_path, tweet_text, out_img_path)
-    
-    # 保存 JSON
+            if tweet_text is None:
+                # 重试耗尽，记录为失败且不出图 (重跑时会再试)
+                record["status"] = "failed"
+            stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+            stream.flush()
+        results[(sid, p_idx)] = record
+        if record.get("status") == "failed":
+            return
+
+        # 生成图片 (已是最新的会跳过；渲染队列满时在线程里等待，不阻塞事件循环)
+        out_img_name = f"{sid}_p{p_idx}.jpg"
+        out_img_path = os.path.join(output_img_dir, out_img_name)
+        await asyncio.to_thread(renderer.submit, img_path, record["generated_text"], out_img_path)
+
+    try:
+        await asyncio.gather(*[_one(*job) for job in jobs])
+    finally:
+        stream.close()
+
+    # 保存 JSON (顺序与串行版本一致：按 Prompt，再按图片)
+    ordered = [results[(os.path.splitext(f)[0], p_idx)] for p_idx, _, f in jobs]
     with open(output_json_name, "w", encoding="utf-8") as f:
-        json.dump(results, f, indent=2, ensure_ascii=False)
-    print(f"  Saved results to {output_json_name} and images to {output_img_dir}/")
+        json.dump(ordered, f, indent=2, ensure_ascii=False)
+    n_failed = sum(1 for r in ordered if r.get("status") == "failed")
+    print(f"  Saved results to {output_json_name} ({n_failed} failed), images are rendered into {output_img_dir}/")
+
+async def run_batches(batches, renderer):
+    """多组 Prompt 并发生成，共用在途请求上限"""
+    slots = asyncio.Semaphore(GEN_MAX_IN_FLIGHT)
+    await asyncio.gather(*[
+        run_generation_batch(prompts, image_files, output_json_name, output_img_dir, renderer, slots)
+        for prompts, image_files, output_json_name, output_img_dir in batches
+    ])
 
 def main():
     # 1. 读取最新的历史记录
@@ -129,6 +293,12 @@ def main():
         return
     image_files = [f for f in os.listdir(IMAGE_DIR) if f.lower().endswith(('.jpg', '.png', '.jpeg'))]
     print(f"Found {len(image_files)} images.")
+    # 清单 (generate_dataset_json.py) 里的内容哈希直接复用；生成前先把上传负载编码进 pack，已在 pack 里的跳过
+    if os.path.exists(DATA_FILE):
+        with open(DATA_FILE, "r", encoding="utf-8") as f:
+            image_store.register_manifest(json.load(f))
+    encoded = image_store.warm([os.path.join(IMAGE_DIR, f) for f in image_files])
+    print(f"Image payload pack ready ({encoded} newly encoded).")
 
     # 3. 提取 Prompts
     # --- 3.1 最优 Prompts (从最后一代选前3) ---
@@ -140,19 +310,29 @@ def main():
     print(f"Extracted {len(best_prompts)} best prompts from Generation {last_gen['generation']}.")
 
     # --- 3.2 初始 Prompts (从第1代随机选3个) ---
-    first_gen = history[0]
-    initial_individuals = first_gen['individuals']
-    # 随机抽3个，如果不够就全拿
-    random_initials = random.sample(initial_individuals, min(3, len(initial_individuals)))
-    initial_prompts = [item['prompt_text'] for item in random_initials]
-    print(f"Extracted {len(initial_prompts)} random initial prompts from Generation 1.")
-
-    # 4. 执行生成任务
-    # Task A: Best Prompts
-    run_generation_batch(best_prompts, image_files, OUTPUT_JSON_BEST, OUTPUT_DIR_BEST)
-    
-    # Task B: Initial Prompts
-    run_generation_batch(initial_prompts, image_files, OUTPUT_JSON_INIT, OUTPUT_DIR_INIT)
+    # 续跑时沿用上次抽中的那几个，已完成的结果才能接上
+    initial_prompts = recorded_prompts(OUTPUT_JSON_INIT)
+    if initial_prompts is not None:
+        print(f"Reusing {len(initial_prompts)} initial prompts from the interrupted run.")
+    else:
+        first_gen = history[0]
+        initial_individuals = first_gen['individuals']
+        # 随机抽3个，如果不够就全拿
+        random_initials = random.sample(initial_individuals, min(3, len(initial_individuals)))
+        initial_prompts = [item['prompt_text'] for item in random_initials]
+        print(f"Extracted {len(initial_prompts)} random initial prompts from Generation 1.")
+
+    # 4. 执行生成任务 (两组并发生成，渲染在后台进程池里进行)
+    renderer = RenderStage()
+    try:
+        run_async(run_batches([
+            # Task A: Best Prompts
+            (best_prompts, image_files, OUTPUT_JSON_BEST, OUTPUT_DIR_BEST),
+            # Task B: Initial Prompts
+            (initial_prompts, image_files, OUTPUT_JSON_INIT, OUTPUT_DIR_INIT),
+        ], renderer))
+    finally:
+        renderer.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,86 @@
+# sampling.py
+"""
+评估样本的抽取方式 (SAMPLING_MODE = "panel")
+
+原来每个 Prompt 各自 random.sample 一组图片，个体之间的 fitness 差异很大一部分来自"抽到了哪些图片"。
+这里改为：
+- 公共评估面板：同一代的所有个体在同一组图片上评估 (common random numbers)，差值里不再有抽样噪声；
+- 分层抽样：按以往 ga_history_*.json 里每张图片的平均样本分把图片分成 SAMPLING_STRATA 个难度层，
+  面板按各层大小成比例分配名额；历史里没出现过的图片单独成一层；
+- 轮转：每层用固定种子打乱一次，第 g 代取该层序列里接下来的若干张，循环往复，
+  多代下来覆盖 train_images.json 里的全部图片。
+面板只由 (代号, 难度分层, SAMPLING_SEED) 决定，不消耗 GA 的全局随机数，断点续跑和岛屿模式下同一代的面板相同。
+"""
+import glob
+import json
+import logging
+import random
+from collections import defaultdict
+from scoring import normalize_history
+from config import SAMPLES_PER_EVAL, SAMPLING_STRATA, SAMPLING_SEED
+
+def sample_id(sample):
+    return sample.get('sid', sample['image_path'])
+
+def image_difficulty(exclude=()):
+    """以往 history 里每张图片 (按 sid) 的平均样本分 (各运行统一到 0-100 量纲)，failed 样本不计"""
+    totals = defaultdict(float)
+    counts = defaultdict(int)
+    files = [f for f in glob.glob("ga_history_*.json") if f not in exclude]
+    for path in files:
+        with open(path, "r", encoding="utf-8") as f:
+            # 早期 0-10 量纲的运行先换算到 0-100 并重算样本分 (见 scoring.py)
+            for gen_data in normalize_history(json.load(f)):
+                for ind in gen_data["individuals"]:
+                    for s in ind.get("sample_evaluations", []):
+                        if s.get("fitness") is None:
+                            continue
+                        sid = s.get("sid", s.get("image_path"))
+                        totals[sid] += s["fitness"]
+                        counts[sid] += 1
+    return {sid: totals[sid] / counts[sid] for sid in totals}
+
+def _allocate(sizes, k):
+    """按层大小成比例分配 k 个名额 (最大余数法)，每层不超过其大小"""
+    total = sum(sizes)
+    k = min(k, total)
+    quotas = [k * s / total for s in sizes]
+    alloc = [int(q) for q in quotas]
+    order = sorted(range(len(sizes)), key=lambda i: quotas[i] - alloc[i], reverse=True)
+    for i in order[:k - sum(alloc)]:
+        alloc[i] += 1
+    return alloc
+
+class PanelSampler:
+    def __init__(self, dataset, exclude=(), n_strata=SAMPLING_STRATA, seed=SAMPLING_SEED):
+        difficulty = image_difficulty(exclude)
+        known = sorted((d for d in dataset if sample_id(d) in difficulty), key=lambda d: difficulty[sample_id(d)])
+        unknown = [d for d in dataset if sample_id(d) not in difficulty]
+
+        # 按难度分位数等分成 n_strata 层 (从难到易)，没见过的图片单独一层
+        n = min(n_strata, len(known))
+        self.strata = [known[len(known) * j // n:len(known) * (j + 1) // n] for j in range(n)]
+        if unknown:
+            self.strata.append(unknown)
+        self.strata = [s for s in self.strata if s]
+
+        rng = random.Random(seed)
+        for stratum in self.strata:
+            rng.shuffle(stratum)
+        self._cache = {}
+        logging.info(f"  [PANEL] {len(dataset)} images in {len(self.strata)} strata "
+                     f"{[len(s) for s in self.strata]} ({len(unknown)} without history)")
+
+    def panel(self, generation, k=SAMPLES_PER_EVAL):
+        """第 generation 代 (1 起) 的公共评估面板"""
+        if not self.strata:
+            return []
+        if (generation, k) not in self._cache:
+            alloc = _allocate([len(s) for s in self.strata], k)
+            panel = []
+            for stratum, m in zip(self.strata, alloc):
+                # 每层按固定顺序轮转：第 g 代取第 (g-1)*m 个起的 m 张
+                start = (generation - 1) * m
+                panel.extend(stratum[(start + j) % len(stratum)] for j in range(m))
+            self._cache[(generation, k)] = panel
+        return self._cache[(generation, k)]
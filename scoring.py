@@ -0,0 +1,75 @@
+# scoring.py
+"""
+样本打分：原始分 -> fitness，以及历史 history 的分数量纲换算
+
+早期运行的评估器按 0-10 打分，之后改为 0-100；一次运行里所有原始分都不超过 10 时视为 0-10 量纲。
+读以往 history 的地方 (surrogate 训练、sampling 难度分层、reweight) 都先换算到 0-100，
+并按当前的 score_sample 重算 fitness，不同运行的分数才能放在一起比较。
+"""
+from config import W_HATE, W_FLUENCY, W_REL, W_STYLE, W_PREACHY
+
+SCORE_KEYS = ("hate_score", "fluency_score", "relevance_score", "style_score", "preachiness_score")
+TEN_POINT_MAX = 10
+
+def score_sample(scores):
+    """
+    把评估器的原始打分归一化并加权，得到单个样本的 fitness
+    """
+    # Hate: 越低越好
+    s_hate = max(0, 100 - scores.get('hate_score', 100)) / 100.0
+
+    # Preachy: 越低越好 (新增)
+    s_preachy = max(0, 100 - scores.get('preachiness_score', 100)) / 100.0
+
+    # 其他: 越高越好
+    s_fluency = scores.get('fluency_score', 0) / 100.0
+    s_rel = scores.get('relevance_score', 0) / 100.0
+    s_style = scores.get('style_score', 0) / 100.0
+
+    # 加权求和
+    return (s_hate * W_HATE) + \
+           (s_preachy * W_PREACHY) + \
+           (s_fluency * W_FLUENCY) + \
+           (s_rel * W_REL) + \
+           (s_style * W_STYLE)
+
+def score_scale(max_score):
+    """一次运行的最大原始分 -> 换算到 0-100 的倍数 (没有有效分数时不换算)"""
+    if max_score is None or max_score != max_score:
+        return 1
+    return 100 // TEN_POINT_MAX if max_score <= TEN_POINT_MAX else 1
+
+def history_scale(history):
+    """一整份 ga_history (各代记录列表) 的量纲倍数"""
+    values = [
+        v
+        for gen_data in history
+        for ind in gen_data["individuals"]
+        for s in ind.get("sample_evaluations", [])
+        for k, v in (s.get("raw_scores") or {}).items()
+        if k in SCORE_KEYS and isinstance(v, (int, float))
+    ]
+    return score_scale(max(values) if values else None)
+
+def normalize_history(history):
+    """
+    以往运行的 history 换算到 0-100 量纲，样本和个体的 fitness 按当前 score_sample 重算
+    (failed 样本不变；个体 fitness 为其成功样本 fitness 的均值，没有成功样本时不变)。返回新列表，不修改原数据
+    """
+    scale = history_scale(history)
+    normalized = []
+    for gen_data in history:
+        individuals = []
+        for ind in gen_data["individuals"]:
+            samples = []
+            for s in ind.get("sample_evaluations", []):
+                if s.get("raw_scores") and s.get("fitness") is not None:
+                    raw = {k: v * scale if k in SCORE_KEYS else v for k, v in s["raw_scores"].items()}
+                    s = dict(s, raw_scores=raw, fitness=score_sample(raw))
+                samples.append(s)
+            ok = [s["fitness"] for s in samples if s.get("raw_scores") and s.get("fitness") is not None]
+            individuals.append(dict(
+                ind, sample_evaluations=samples, fitness=sum(ok) / len(ok) if ok else ind["fitness"]
+            ))
+        normalized.append(dict(gen_data, individuals=individuals))
+    return normalized
@@ -0,0 +1,129 @@
+# similarity.py
+"""
+本地近重复 Prompt 检测 (MinHash + LSH，不走网络)
+
+变异器的输出经常只差标点或一句话，精确字符串去重拦不住，每个都要花一整轮评估。
+- SimilarityIndex: 本次运行评估过的所有 Prompt 的索引，按词 n-gram 的 Jaccard 相似度查最近邻；
+- DiversityFilter: 繁殖时的过滤器 (evolution.produce_offspring 的 accept)：
+  1. 与新种群里已有个体 (精英/兄弟) 相似度 >= SIMILARITY_THRESHOLD 的子代直接拒绝；
+  2. 与历史个体相似度 >= SIMILARITY_INHERIT_THRESHOLD 且开启继承时，子代保留；
+     最终进入种群时 (代理模型筛选之后，见 commit) 在账本里并入邻居的样本 (继承它的 fitness)，本代不再单独评估；
+  3. 其余与历史个体相似度 >= SIMILARITY_THRESHOLD 的子代拒绝。
+"""
+import hashlib
+import random
+import re
+import threading
+from collections import defaultdict
+from fitness_ledger import normalize_prompt
+from config import (
+    SIMILARITY_THRESHOLD, SIMILARITY_INHERIT_THRESHOLD, SIMILARITY_INHERIT,
+    SIMILARITY_NUM_PERM, SIMILARITY_BANDS, SIMILARITY_SHINGLE_SIZE
+)
+
+_PRIME = (1 << 61) - 1
+
+stats = {"rejected": 0, "inherited": 0}
+
+def shingles(text, k=SIMILARITY_SHINGLE_SIZE):
+    """规范化后按词切 k-gram (忽略大小写和标点)"""
+    tokens = re.findall(r"\w+", normalize_prompt(text).lower())
+    if len(tokens) <= k:
+        return {" ".join(tokens)}
+    return {" ".join(tokens[i:i + k]) for i in range(len(tokens) - k + 1)}
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+def _hash64(s):
+    return int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big")
+
+class SimilarityIndex:
+    def __init__(self, num_perm=SIMILARITY_NUM_PERM, bands=SIMILARITY_BANDS, seed=1):
+        # 固定种子的哈希族，不消耗 GA 的全局随机数
+        rng = random.Random(seed)
+        self._perms = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(num_perm)]
+        self.bands = bands
+        self.rows = num_perm // bands
+        self._buckets = [defaultdict(set) for _ in range(bands)]
+        self._entries = {}   # normalized prompt -> (prompt, shingle set)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _signature(self, sh):
+        hashes = [_hash64(s) for s in sh]
+        return [min((a * h + b) % _PRIME for h in hashes) for a, b in self._perms]
+
+    def _band_keys(self, sig):
+        return [tuple(sig[b * self.rows:(b + 1) * self.rows]) for b in range(self.bands)]
+
+    def add(self, prompt):
+        norm = normalize_prompt(prompt)
+        with self._lock:
+            if norm in self._entries:
+                return
+            sh = shingles(prompt)
+            self._entries[norm] = (prompt, sh)
+            for bucket, key in zip(self._buckets, self._band_keys(self._signature(sh))):
+                bucket[key].add(norm)
+
+    def nearest(self, prompt):
+        """返回 (最相似的已索引 Prompt, Jaccard 相似度)；没有 LSH 候选时返回 (None, 0.0)"""
+        norm = normalize_prompt(prompt)
+        sh = shingles(prompt)
+        with self._lock:
+            if norm in self._entries:
+                return self._entries[norm][0], 1.0
+            candidates = set()
+            for bucket, key in zip(self._buckets, self._band_keys(self._signature(sh))):
+                candidates |= bucket.get(key, set())
+            best, best_sim = None, 0.0
+            for c in candidates:
+                other, other_sh = self._entries[c]
+                sim = jaccard(sh, other_sh)
+                if sim > best_sim:
+                    best, best_sim = other, sim
+        return best, best_sim
+
+class DiversityFilter:
+    """
+    繁殖时的近重复过滤器：population 为新种群里已有的个体，
+    接受的子代会自动加入 (后续子代也要和它比较)；
+    要继承邻居 fitness 的子代先记在 pending 里，由 commit 在最终子代确定后写进账本
+    """
+
+    def __init__(self, index, population, ledger=None):
+        self.index = index
+        self.members = [(p, shingles(p)) for p in population]
+        self.ledger = ledger
+        self.pending = {}   # 子代 -> 近重复的邻居
+
+    def __call__(self, child):
+        sh = shingles(child)
+        if any(jaccard(sh, other) >= SIMILARITY_THRESHOLD for _, other in self.members):
+            stats["rejected"] += 1
+            return False
+
+        neighbor, sim = self.index.nearest(child)
+        if neighbor is not None and sim >= SIMILARITY_THRESHOLD:
+            if SIMILARITY_INHERIT and self.ledger is not None and sim >= SIMILARITY_INHERIT_THRESHOLD \
+                    and self.ledger.summary(neighbor) is not None:
+                self.pending[child] = neighbor
+            else:
+                stats["rejected"] += 1
+                return False
+
+        self.members.append((child, sh))
+        return True
+
+    def commit(self, children):
+        """children 为最终进入种群的子代：其中接受为继承的才在账本里并入邻居，返回继承的个数"""
+        inherited = [c for c in children if c in self.pending]
+        for child in inherited:
+            self.ledger.inherit(child, self.pending[child])
+        stats["inherited"] += len(inherited)
+        return len(inherited)
@@ -0,0 +1,147 @@
+# surrogate.py
+"""
+本地代理适应度模型 (surrogate)：在花 API 评估之前先给子代打个预估分
+
+- 特征：Prompt 的词 1/2-gram 哈希 TF (L2 归一化) + 长度/句子/标点等词法统计；
+- 模型：岭回归，只维护充分统计量 X^T X 与 X^T y，增量更新 (每代评估完把新结果加进去)，
+  启动时先用已有的 ga_history_*.json 训练；
+- SURROGATE_MODE = "screen" 时繁殖阶段多产生 SURROGATE_CANDIDATE_FACTOR 倍的子代，
+  只把预估分最高的 k 个送去真实评估；"report" 只预测不筛选；
+- 每代报告预估分与真实 fitness 的 Spearman 秩相关，用来判断预筛是否可信。
+"""
+import glob
+import hashlib
+import json
+import logging
+import math
+import re
+import numpy as np
+from fitness_ledger import normalize_prompt
+from scoring import normalize_history
+from config import SURROGATE_HASH_DIM, SURROGATE_L2, SURROGATE_MIN_RECORDS
+
+LEXICAL_FEATURES = [
+    "log_chars", "log_words", "log_sentences", "words_per_sentence", "type_token_ratio",
+    "upper_ratio", "exclamations", "questions", "digits", "newlines", "quotes",
+]
+
+def _hash(token):
+    h = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+    # 低位选桶，最高位决定符号 (减少哈希冲突带来的偏差)
+    return h % SURROGATE_HASH_DIM, (1.0 if h >> 63 else -1.0)
+
+def _lexical(text):
+    words = re.findall(r"\w+", text.lower())
+    sentences = [s for s in re.split(r"[.!?\n]+", text) if s.strip()]
+    letters = [c for c in text if c.isalpha()]
+    return [
+        math.log1p(len(text)),
+        math.log1p(len(words)),
+        math.log1p(len(sentences)),
+        len(words) / max(1, len(sentences)) / 20.0,
+        len(set(words)) / max(1, len(words)),
+        sum(c.isupper() for c in letters) / max(1, len(letters)),
+        math.log1p(text.count("!")),
+        math.log1p(text.count("?")),
+        math.log1p(sum(c.isdigit() for c in text)),
+        math.log1p(text.count("\n")),
+        math.log1p(text.count('"') + text.count("'")),
+    ]
+
+def features(prompt):
+    """单个 Prompt 的特征向量 (最后一维为截距)"""
+    text = normalize_prompt(prompt)
+    words = re.findall(r"\w+", text.lower())
+    hashed = np.zeros(SURROGATE_HASH_DIM)
+    for token in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+        idx, sign = _hash(token)
+        hashed[idx] += sign
+    norm = np.linalg.norm(hashed)
+    if norm > 0:
+        hashed /= norm
+    return np.concatenate([hashed, _lexical(prompt), [1.0]])
+
+def spearman(x, y):
+    """Spearman 秩相关 (并列取平均秩)；样本不足或某一边全相同时返回 None"""
+    if len(x) < 3:
+        return None
+    rx = _rank(np.asarray(x, dtype=float))
+    ry = _rank(np.asarray(y, dtype=float))
+    if rx.std() == 0 or ry.std() == 0:
+        return None
+    return float(np.corrcoef(rx, ry)[0, 1])
+
+def _rank(values):
+    order = values.argsort(kind="mergesort")
+    ranks = np.empty(len(values))
+    sorted_vals = values[order]
+    i = 0
+    while i < len(values):
+        j = i
+        while j + 1 < len(values) and sorted_vals[j + 1] == sorted_vals[i]:
+            j += 1
+        ranks[order[i:j + 1]] = (i + j) / 2.0
+        i = j + 1
+    return ranks
+
+class SurrogateModel:
+    def __init__(self, l2=SURROGATE_L2):
+        dim = SURROGATE_HASH_DIM + len(LEXICAL_FEATURES) + 1
+        self._xtx = np.zeros((dim, dim))
+        self._xty = np.zeros(dim)
+        # 截距不做正则
+        self._penalty = np.full(dim, l2)
+        self._penalty[-1] = 0.0
+        self._weights = None
+        self.n = 0
+
+    @property
+    def ready(self):
+        return self.n >= SURROGATE_MIN_RECORDS
+
+    def update(self, prompts, fitnesses):
+        if not prompts:
+            return
+        X = np.stack([features(p) for p in prompts])
+        y = np.asarray(fitnesses, dtype=float)
+        self._xtx += X.T @ X
+        self._xty += X.T @ y
+        self.n += len(prompts)
+        self._weights = None
+
+    def _solve(self):
+        if self._weights is None:
+            self._weights = np.linalg.solve(self._xtx + np.diag(self._penalty) + 1e-9 * np.eye(len(self._xty)), self._xty)
+        return self._weights
+
+    def predict(self, prompts):
+        if not prompts:
+            return []
+        X = np.stack([features(p) for p in prompts])
+        return (X @ self._solve()).tolist()
+
+    def top_k(self, prompts, k):
+        """按预估分从高到低保留 k 个"""
+        preds = self.predict(prompts)
+        order = sorted(range(len(prompts)), key=lambda i: preds[i], reverse=True)
+        return [prompts[i] for i in order[:k]]
+
+    def update_from_generation(self, gen_data):
+        """用 ga_history 的一代记录更新 (全部样本都失败的个体不算)"""
+        prompts, fitnesses = [], []
+        for ind in gen_data["individuals"]:
+            if any(s.get("status") != "failed" for s in ind.get("sample_evaluations", [])):
+                prompts.append(ind["prompt_text"])
+                fitnesses.append(ind["fitness"])
+        self.update(prompts, fitnesses)
+
+    def fit_history(self, exclude=()):
+        """用当前目录下已有的 ga_history_*.json 训练 (各运行统一到 0-100 量纲)"""
+        files = [f for f in glob.glob("ga_history_*.json") if f not in exclude]
+        for path in files:
+            with open(path, "r", encoding="utf-8") as f:
+                # 早期 0-10 量纲的运行先换算到 0-100 并重算 fitness (见 scoring.py)
+                for gen_data in normalize_history(json.load(f)):
+                    self.update_from_generation(gen_data)
+        logging.info(f"  [SURROGATE] Trained on {self.n} records from {len(files)} history files")
+        return self
@@ -0,0 +1,6 @@
+# 测试直接导入仓库根目录下的模块；连本地替身服务的配置 (不需要 API Key，测试本身不发请求)
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LLM_BACKEND", "mock")
@@ -0,0 +1,57 @@
+# 单个 Prompt 的评估入口 (evaluator.calculate_fitness / acalculate_fitness) 的返回结构
+import asyncio
+
+import pytest
+
+import evaluator
+from scoring import score_sample
+
+DATASET = [{"sid": str(i), "image_path": f"images/{i}.jpg"} for i in range(3)]
+SCORES = {"hate_score": 10, "fluency_score": 80, "relevance_score": 70, "style_score": 60, "preachiness_score": 5}
+
+@pytest.fixture
+def stub_llm(monkeypatch):
+    def generator(image_path, system_def, prompt):
+        return None if image_path.endswith("2.jpg") else f"tweet about {image_path}"
+
+    async def agenerator(image_path, system_def, prompt):
+        return generator(image_path, system_def, prompt)
+
+    async def aevaluator(image_path, text, hate_def):
+        return dict(SCORES)
+
+    monkeypatch.setattr(evaluator, "call_generator", generator)
+    monkeypatch.setattr(evaluator, "call_evaluator", lambda image_path, text, hate_def: dict(SCORES))
+    monkeypatch.setattr(evaluator, "acall_generator", agenerator)
+    monkeypatch.setattr(evaluator, "acall_evaluator", aevaluator)
+    monkeypatch.setattr(evaluator, "EVAL_FAILED_RETRY_ROUNDS", 0)
+
+def _check_shape(result):
+    avg_fitness, metrics, details = result
+    assert avg_fitness == pytest.approx(score_sample(SCORES))
+    assert metrics == {"hate": 10, "fluency": 80, "relevance": 70, "style": 60, "preachy": 5}
+    assert sorted(d["sid"] for d in details) == ["0", "1", "2"]
+    assert [d.get("status") for d in sorted(details, key=lambda d: d["sid"])] == [None, None, "failed"]
+    assert set(details[0]) >= {"sid", "image_path", "generated_text", "raw_scores", "fitness"}
+
+@pytest.mark.parametrize("async_eval", [True, False])
+def test_calculate_fitness_shape(stub_llm, monkeypatch, async_eval):
+    monkeypatch.setattr(evaluator, "ASYNC_EVAL", async_eval)
+    _check_shape(evaluator.calculate_fitness("prompt", DATASET))
+
+def test_acalculate_fitness_shape(stub_llm):
+    _check_shape(asyncio.run(evaluator.acalculate_fitness("prompt", DATASET)))
+    _check_shape(asyncio.run(evaluator.acalculate_fitness("prompt", [], test_samples=DATASET)))
+
+def test_evaluation_failed_only_when_no_sample_succeeded(stub_llm, monkeypatch):
+    assert not evaluator.evaluation_failed(evaluator.calculate_fitness("p", DATASET)[2])
+
+    async def agenerator(image_path, system_def, prompt):
+        return None
+
+    monkeypatch.setattr(evaluator, "call_generator", lambda image_path, system_def, prompt: None)
+    monkeypatch.setattr(evaluator, "acall_generator", agenerator)
+    avg_fitness, _, details = evaluator.calculate_fitness("p", DATASET)
+    assert avg_fitness == 0
+    assert evaluator.evaluation_failed(details)
+    assert evaluator.evaluation_failed([])
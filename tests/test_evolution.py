@@ -0,0 +1,57 @@
+# 并发子代工厂 (evolution.produce_offspring)：提交数量与谱系记录
+import threading
+
+import pytest
+
+import evolution
+import lineage
+
+@pytest.fixture(autouse=True)
+def fresh_lineage(monkeypatch):
+    monkeypatch.setattr(lineage, "_entries", {})
+
+def _maker(outputs):
+    """第 k 个请求返回 outputs[k] 并记一条谱系"""
+    calls = []
+    lock = threading.Lock()
+
+    def make_child(rng, k):
+        with lock:
+            calls.append(k)
+        child = outputs[k]
+        lineage.record(child, ["parent"], "span", "rewrite")
+        return child
+
+    return make_child, calls
+
+def test_first_round_is_not_overprovisioned():
+    make_child, calls = _maker([f"child {k}" for k in range(10)])
+    children = evolution.produce_offspring(make_child, 4, ["parent"])
+    assert sorted(children) == [f"child {k}" for k in range(4)]
+    assert sorted(calls) == [0, 1, 2, 3]
+    assert set(lineage._entries) == set(children)
+
+def test_discarded_children_leave_no_lineage():
+    make_child, calls = _maker(["parent", "dup", "dup", "bad", "good", "fine", "extra", "more", "spare"])
+    children = evolution.produce_offspring(make_child, 3, ["parent"], accept=lambda c: c != "bad")
+    assert len(children) == 3
+    assert "parent" not in lineage._entries and "bad" not in lineage._entries
+    assert set(lineage._entries) == set(children)
+
+def test_records_are_left_to_the_caller():
+    make_child, _ = _maker(["a", "b", "c"])
+    records = {}
+    children = evolution.produce_offspring(make_child, 3, records=records)
+    assert lineage._entries == {}
+    assert set(records) == set(children)
+
+    lineage.commit(records, ["b"])
+    assert set(lineage._entries) == {"b"}
+    assert lineage._entries["b"]["operator"] == "span"
+
+def test_record_outside_deferred_is_immediate():
+    with lineage.deferred() as records:
+        lineage.record("x", ["p"], "global")
+    lineage.record("y", ["p"], "global")
+    assert set(records) == {"x"}
+    assert set(lineage._entries) == {"y"}
@@ -0,0 +1,72 @@
+# Prompt 适应度账本 (fitness_ledger.FitnessLedger)：累计样本、规范化 Key、近重复继承
+import pytest
+
+from fitness_ledger import FitnessLedger, confidence_halfwidth, prompt_key
+
+DATASET = [{"sid": str(i), "image_path": f"images/{i}.jpg"} for i in range(4)]
+
+def _record(sid, fitness, status=None):
+    record = {"sid": sid, "fitness": fitness, "raw_scores": {"hate_score": fitness}}
+    if status is not None:
+        record = dict(record, fitness=None, raw_scores=None, status=status)
+    return record
+
+def test_key_normalizes_whitespace_and_unicode():
+    assert prompt_key("Write  a\ttweet \n") == prompt_key("Write a tweet")
+    assert prompt_key("ｗｒｉｔｅ") == prompt_key("write")
+    assert prompt_key("Write a tweet") != prompt_key("write a tweet")
+
+def test_samples_accumulate_across_evaluations():
+    ledger = FitnessLedger()
+    ledger.add("p", [_record("0", 0.2), _record("1", 0.4)])
+    ledger.add(" p ", [_record("2", 0.6)])
+    summary = ledger.summary("p")
+    assert summary["n"] == 3
+    assert summary["fitness"] == pytest.approx(0.4)
+    assert summary["ci"] == pytest.approx(confidence_halfwidth([0.2, 0.4, 0.6]))
+    assert [d["sid"] for d in ledger.unseen("p", DATASET)] == ["3"]
+
+def test_failed_samples_are_not_seen():
+    ledger = FitnessLedger()
+    ledger.add("p", [_record("0", 0.2), _record("1", None, status="failed")])
+    assert ledger.seen_sids("p") == {"0"}
+    assert ledger.summary("p")["n"] == 1
+    assert ledger.summary("unknown") is None
+    assert "unknown" not in ledger
+
+def test_inherit_aliases_the_neighbor():
+    ledger = FitnessLedger()
+    ledger.add("parent", [_record("0", 0.5)])
+    ledger.inherit("child", "parent")
+    assert "child" in ledger
+    assert ledger.inherited_from("child") == "parent"
+    assert ledger.summary("child")["fitness"] == pytest.approx(0.5)
+
+    # 之后任一方的新样本两者共用
+    ledger.add("child", [_record("1", 0.7)])
+    assert ledger.summary("parent")["n"] == 2
+    assert ledger.seen_sids("child") == ledger.seen_sids("parent") == {"0", "1"}
+
+def test_pop_inherited_only_once():
+    ledger = FitnessLedger()
+    ledger.add("parent", [_record("0", 0.5)])
+    ledger.inherit("child", "parent")
+    assert ledger.pop_inherited("child")
+    assert not ledger.pop_inherited("child")
+    assert not ledger.pop_inherited("parent")
+
+def test_inherit_follows_alias_chains_and_skips_self():
+    ledger = FitnessLedger()
+    ledger.add("a", [_record("0", 0.5)])
+    ledger.inherit("b", "a")
+    ledger.inherit("c", "b")
+    assert ledger.key("c") == ledger.key("a")
+    assert ledger.inherited_from("c") == "b"
+
+    ledger.inherit(" a", "a")
+    assert ledger.inherited_from("a") is None
+    assert not ledger.pop_inherited("a")
+
+def test_confidence_needs_two_samples():
+    assert confidence_halfwidth([0.3]) is None
+    assert confidence_halfwidth([0.5, 0.5]) == 0
@@ -0,0 +1,74 @@
+# 图片负载的 LRU / pack 缓存 (image_store.get_data_url)
+import threading
+
+import pytest
+from PIL import Image
+
+import image_store
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_store, "IMAGE_PACK_FILE", str(tmp_path / "pack" / "payloads.bin"))
+    monkeypatch.setattr(image_store, "_index", None)
+    monkeypatch.setattr(image_store, "_pack", None)
+    monkeypatch.setattr(image_store, "_lru", image_store.OrderedDict())
+    monkeypatch.setattr(image_store, "stats", dict.fromkeys(image_store.stats, 0))
+    return tmp_path
+
+def _image(tmp_path, name, color):
+    path = str(tmp_path / name)
+    Image.new("RGB", (64, 48), color).save(path, format="PNG")
+    return path
+
+def test_payload_is_read_back_from_pack(store, monkeypatch):
+    path = _image(store, "a.png", "red")
+    data_url = image_store.get_data_url(path)
+    assert data_url.startswith("data:image/jpeg;base64,")
+
+    # 新进程：内存状态为空，从 pack 读出同一负载，不再编码
+    monkeypatch.setattr(image_store, "_index", None)
+    monkeypatch.setattr(image_store, "_lru", image_store.OrderedDict())
+    monkeypatch.setattr(image_store, "_encode", lambda p: pytest.fail("payload re-encoded"))
+    assert image_store.get_data_url(path) == data_url
+    assert image_store.stats["encoded"] == 1
+
+def test_pack_is_remapped_after_append(store):
+    first = image_store.get_data_url(_image(store, "a.png", "red"))
+    second = image_store.get_data_url(_image(store, "b.png", "blue"))
+    image_store._lru.clear()
+    assert image_store.get_data_url(str(store / "b.png")) == second
+    assert image_store.get_data_url(str(store / "a.png")) == first
+
+def test_encode_runs_outside_the_lock(store, monkeypatch):
+    slow, fast = _image(store, "slow.png", "red"), _image(store, "fast.png", "blue")
+    encode = image_store._encode
+    started, release = threading.Event(), threading.Event()
+
+    def blocking_encode(path):
+        if path == slow:
+            started.set()
+            assert release.wait(5)
+        return encode(path)
+
+    monkeypatch.setattr(image_store, "_encode", blocking_encode)
+    worker = threading.Thread(target=image_store.get_data_url, args=(slow,))
+    worker.start()
+    assert started.wait(5)
+    # 另一张图片的编码不等 slow 的编码结束
+    assert image_store.get_data_url(fast).startswith("data:image/jpeg;base64,")
+    release.set()
+    worker.join(5)
+    assert image_store.stats["encoded"] == 2
+
+def test_concurrent_misses_append_once(store):
+    path = _image(store, "a.png", "red")
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(image_store.get_data_url(path))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(set(results)) == 1
+    assert len(image_store._load_index()) == 1
+    assert image_store.stats["encoded"] == 1
+    assert image_store.stats["calls"] == 8
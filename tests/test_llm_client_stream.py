@@ -0,0 +1,80 @@
+# 流式读取与非流式输出的清理一致性 (llm_client._read_stream / _clean_to_budget)
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import llm_client
+import llm_metrics
+
+def _chunks(content, size=7):
+    pieces = [content[i:i + size] for i in range(0, len(content), size)]
+    return [SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=p))]) for p in pieces]
+
+class _Stream:
+    def __init__(self, content):
+        self._chunks = _chunks(content)
+        self.closed = False
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            if self.closed:
+                return
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+class _AStream(_Stream):
+    async def __aiter__(self):
+        for chunk in self._chunks:
+            if self.closed:
+                return
+            yield chunk
+
+    async def close(self):
+        self.closed = True
+
+def _tracker():
+    tracker = llm_metrics.CallTracker("m", "Generator")
+    tracker.attempt()
+    return tracker
+
+CONTENTS = [
+    "this meme is so lazy it hurts",
+    '"seriously? this again?"',
+    '  "quoted with spaces around"  ',
+    'Here is the tweet: imagine believing this lol',
+    'Here is the tweet without any colon at all',
+    'Here is the tweet: "wrapped in quotes"',
+    '"Here is the tweet: quoted preamble"',
+    '"only an opening quote',
+    '',
+]
+
+@pytest.mark.parametrize("content", CONTENTS)
+def test_stream_matches_non_stream(content):
+    tracker = _tracker()
+    raw = llm_client._read_stream(_Stream(content), tracker, 200)
+    assert not tracker.truncated
+    assert llm_client._clean_to_budget(raw, 200) == llm_client._clean_generator_output(content)
+
+@pytest.mark.parametrize("content", CONTENTS)
+def test_async_stream_matches_non_stream(content):
+    raw = asyncio.run(llm_client._aread_stream(_AStream(content), _tracker(), 200))
+    assert llm_client._clean_to_budget(raw, 200) == llm_client._clean_generator_output(content)
+
+def test_long_stream_is_cut_without_stray_quotes():
+    content = '"' + "This goes on and on. " * 20 + '"'
+    stream = _Stream(content)
+    tracker = _tracker()
+    raw = llm_client._read_stream(stream, tracker, 100)
+    text = llm_client._clean_to_budget(raw, 100)
+    assert stream.closed and tracker.truncated
+    assert len(text) <= 100
+    assert not text.startswith('"') and not text.endswith('"')
+    assert text.endswith("on.")
+
+def test_cut_prefers_sentence_end_then_space():
+    assert llm_client._cut_to_budget("First sentence here. second part keeps going", 30) == "First sentence here."
+    assert llm_client._cut_to_budget("no sentence end in this long line", 20) == "no sentence end in"
@@ -0,0 +1,102 @@
+# AIMD 并发上限 (llm_transport.AIMDLimiter) 与重试路径上的调整
+import asyncio
+
+import pytest
+
+import llm_transport
+from config import AIMD_MAX_CONCURRENCY_FACTOR, MAX_RETRIES
+
+def _held(initial):
+    lim = llm_transport.AIMDLimiter(initial)
+    lim.acquire()
+    return lim
+
+def test_success_increases_additively():
+    lim = _held(4)
+    lim.release(ok=True)
+    assert lim.limit == pytest.approx(4.25)
+    assert lim.in_flight == 0
+
+def test_increase_is_capped():
+    lim = llm_transport.AIMDLimiter(2)
+    for _ in range(100):
+        lim.acquire()
+        lim.release(ok=True)
+    assert lim.limit == 2 * AIMD_MAX_CONCURRENCY_FACTOR
+
+def test_throttle_halves_once_per_wave():
+    lim = llm_transport.AIMDLimiter(8)
+    for _ in range(3):
+        lim.acquire()
+        lim.release(throttled=True)
+    assert lim.limit == 4
+    assert lim.in_flight == 0
+
+def test_other_failures_leave_limit_unchanged():
+    lim = _held(4)
+    lim.release()
+    assert lim.limit == 4
+    assert lim.in_flight == 0
+
+@pytest.fixture
+def no_wait(monkeypatch):
+    monkeypatch.setattr(llm_transport, "_backoff", lambda attempt, retry_after: 0.0)
+    monkeypatch.setattr(llm_transport, "_limiters", {})
+    monkeypatch.setattr(llm_transport, "_bucket", lambda model: llm_transport.TokenBucket(0))
+
+def test_request_only_grows_on_success(no_wait):
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ValueError("malformed JSON")
+        return "ok"
+
+    assert llm_transport.request("m", flaky) == "ok"
+    lim = llm_transport.limiter("m")
+    initial = float(llm_transport.DEFAULT_MAX_CONCURRENCY)
+    assert lim.limit == pytest.approx(initial + 1.0 / initial)
+    assert lim.in_flight == 0
+
+def test_arequest_exhausted_retries_do_not_grow(no_wait):
+    async def broken():
+        raise ValueError("malformed JSON")
+
+    with pytest.raises(llm_transport.LLMCallFailed):
+        asyncio.run(llm_transport.arequest("m", broken))
+    lim = llm_transport.limiter("m")
+    assert lim.limit == llm_transport.DEFAULT_MAX_CONCURRENCY
+    assert lim.in_flight == 0
+
+def test_request_gives_up_after_max_retries(no_wait):
+    calls = []
+
+    def broken():
+        calls.append(1)
+        raise KeyError("score")
+
+    with pytest.raises(llm_transport.LLMCallFailed):
+        llm_transport.request("m", broken)
+    assert len(calls) == MAX_RETRIES + 1
+
+def test_programming_errors_are_not_retried(no_wait):
+    calls = []
+
+    def buggy():
+        calls.append(1)
+        raise TypeError("unsupported operand")
+
+    # 代码错误原样抛出，不被包装成 LLMCallFailed (否则会被当作一次失败的评估吞掉)
+    with pytest.raises(TypeError):
+        llm_transport.request("m", buggy)
+    assert len(calls) == 1
+
+    async def abuggy():
+        calls.append(1)
+        raise AttributeError("'NoneType' object has no attribute 'content'")
+
+    with pytest.raises(AttributeError):
+        asyncio.run(llm_transport.arequest("m", abuggy))
+    assert len(calls) == 2
+    assert llm_transport.limiter("m").in_flight == 0
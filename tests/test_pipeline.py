@@ -0,0 +1,84 @@
+# 流水线繁殖的名额上限 (pipeline._breed_into)
+import asyncio
+
+import pipeline
+from config import OFFSPRING_MAX_ROUNDS
+
+class _Target:
+    def __init__(self, population):
+        self.gen = 1
+        self.population = list(population)
+
+    def add(self, prompt):
+        self.population.append(prompt)
+
+def _run(target, n_children):
+    ready = asyncio.Event()
+    ready.set()
+    pool = [("parent", 0.5, {}), ("other", 0.4, {})]
+    asyncio.run(pipeline._breed_into(pool, ready, target, n_children))
+
+def test_duplicate_children_give_up_the_slot(monkeypatch):
+    calls = []
+
+    def breed_child(pool):
+        calls.append(1)
+        return "parent"
+
+    monkeypatch.setattr(pipeline, "breed_child", breed_child)
+    target = _Target(["parent"])
+    _run(target, 3)
+    assert target.population == ["parent"]
+    assert len(calls) == 3 * OFFSPRING_MAX_ROUNDS
+
+def test_fresh_children_fill_every_slot(monkeypatch):
+    counter = iter(range(100))
+    monkeypatch.setattr(pipeline, "breed_child", lambda pool: f"child {next(counter)}")
+    target = _Target(["parent"])
+    _run(target, 4)
+    assert len(target.population) == 5
+    assert len(set(target.population)) == 5
+
+def test_bred_cohort_waits_for_enough_scored_parents(monkeypatch):
+    # 第 2 代的第一个子代瞬间评完 (账本/缓存命中)，其余子代和精英都较慢：
+    # 第 3 代的繁殖不能在只有 1 个已评分父代时开始
+    import evolution
+
+    for name, value in dict(GENERATIONS=3, POPULATION_SIZE=4, ELITISM_COUNT=1,
+                            PIPELINE_MIN_PARENTS=2, PIPELINE_BREED_WORKERS=1).items():
+        monkeypatch.setattr(pipeline, name, value)
+    born = iter(range(100))
+    monkeypatch.setattr(evolution, "get_next_variant", lambda parent, rng=None, parent_fitness=None: f"child {next(born)}")
+    monkeypatch.setattr(evolution, "crossover_prompts", lambda a, b: f"child {next(born)}")
+    monkeypatch.setattr(pipeline, "breed_child", evolution.breed_child)
+
+    evaluated = {}
+
+    async def aevaluate_prompt(prompt, dataset, ledger, on_done, panel):
+        evaluated[prompt] = evaluated.get(prompt, 0) + 1
+        if prompt == "child 0":
+            delay = 0
+        elif prompt.startswith("seed") and evaluated[prompt] == 1:
+            delay = 0.1 if prompt == "seed 3" else 0.01
+        else:
+            delay = 0.3
+        await asyncio.sleep(delay)
+        return 0.5, {}, [{"sid": "0", "fitness": 0.5}]
+
+    monkeypatch.setattr(pipeline, "aevaluate_prompt", aevaluate_prompt)
+    generations = []
+
+    def finish_generation(gen, population, results):
+        generations.append(list(population))
+        scored = sorted(((p, r[0], r[1]) for p, r in zip(population, results)), key=lambda x: x[1], reverse=True)
+        return scored, False
+
+    asyncio.run(pipeline._run(0, [f"seed {i}" for i in range(4)], [], None, {}, None, finish_generation,
+                              lambda gen, population: None, lambda *args: None, None, None))
+    assert [len(p) for p in generations] == [4, 4, 4]
+
+def test_breed_child_with_a_single_parent(monkeypatch):
+    import evolution
+
+    monkeypatch.setattr(evolution, "get_next_variant", lambda parent, rng=None, parent_fitness=None: parent + "!")
+    assert evolution.breed_child([("only", 0.5, {})]) == "only!"
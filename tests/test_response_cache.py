@@ -0,0 +1,84 @@
+# LLM 响应缓存：Key 的组成 (response_cache.make_key) 与各缓存模式
+import pytest
+
+import response_cache
+
+def _messages(text, url="data:image/jpeg;base64,AAAA"):
+    return [{"role": "user", "content": [
+        {"type": "image_url", "image_url": {"url": url}},
+        {"type": "text", "text": text},
+    ]}]
+
+@pytest.fixture
+def image(tmp_path):
+    path = tmp_path / "1.jpg"
+    path.write_bytes(b"\xff\xd8\xff first image")
+    return path
+
+@pytest.fixture
+def fresh(monkeypatch, tmp_path):
+    monkeypatch.setattr(response_cache, "_occurrences", {})
+    monkeypatch.setattr(response_cache, "_repeatable_namespace", "")
+    monkeypatch.setattr(response_cache, "CACHE_DB", str(tmp_path / "cache.sqlite"))
+    monkeypatch.setattr(response_cache, "_conn", None)
+    monkeypatch.setattr(response_cache, "stats", {"hits": 0, "misses": 0, "writes": 0})
+
+def test_key_is_stable_and_ignores_the_inline_image(fresh, image):
+    key = response_cache.make_key("m", _messages("hi"), 1.0, [str(image)], stream_max_chars=280)
+    # data URL 不进 Key，图片由内容哈希代表
+    assert key == response_cache.make_key(
+        "m", _messages("hi", url="data:image/jpeg;base64,BBBB"), 1.0, [str(image)], stream_max_chars=280
+    )
+
+@pytest.mark.parametrize("change", [
+    {"model": "other"},
+    {"messages": _messages("hello")},
+    {"temperature": 0.0},
+    {"params": {"stream_max_chars": 200}},
+    {"params": {}},
+])
+def test_key_covers_request_fields(fresh, image, change):
+    base = {"model": "m", "messages": _messages("hi"), "temperature": 1.0, "params": {"stream_max_chars": 280}}
+    other = dict(base, **change)
+    assert response_cache.make_key(base["model"], base["messages"], base["temperature"], [str(image)],
+                                   **base["params"]) != \
+        response_cache.make_key(other["model"], other["messages"], other["temperature"], [str(image)],
+                                **other["params"])
+
+def test_key_follows_image_content(fresh, image):
+    before = response_cache.make_key("m", _messages("hi"), 1.0, [str(image)])
+    image.write_bytes(b"\xff\xd8\xff a different image")
+    assert response_cache.make_key("m", _messages("hi"), 1.0, [str(image)]) != before
+
+def test_repeatable_keys_count_occurrences(fresh):
+    keys = [response_cache.make_key("m", _messages("mutate"), 1.0, repeatable=True) for _ in range(3)]
+    assert [k.rsplit("#", 1)[1] for k in keys] == ["0", "1", "2"]
+    assert len({k.split("#")[0] for k in keys}) == 1
+
+    response_cache.set_repeatable_namespace("island1")
+    assert response_cache.make_key("m", _messages("mutate"), 1.0, repeatable=True).endswith("#island1:3")
+
+def test_read_through_round_trip(fresh, monkeypatch):
+    monkeypatch.setattr(response_cache, "CACHE_MODE", "read_through")
+    key = response_cache.make_key("m", _messages("hi"), 0.0)
+    assert response_cache.get(key) is None
+    response_cache.put(key, "m", '{"hate_score": 1}')
+    assert response_cache.get(key) == '{"hate_score": 1}'
+    assert response_cache.stats == {"hits": 1, "misses": 1, "writes": 1}
+
+def test_replay_never_falls_through(fresh, monkeypatch):
+    monkeypatch.setattr(response_cache, "CACHE_MODE", "replay")
+    key = response_cache.make_key("m", _messages("hi"), 0.0)
+    response_cache.put(key, "m", "ignored")
+    with pytest.raises(response_cache.CacheMiss):
+        response_cache.get(key)
+
+def test_off_and_record_only_do_not_read(fresh, monkeypatch):
+    key = response_cache.make_key("m", _messages("hi"), 0.0)
+    monkeypatch.setattr(response_cache, "CACHE_MODE", "record_only")
+    response_cache.put(key, "m", "value")
+    assert response_cache.get(key) is None
+    monkeypatch.setattr(response_cache, "CACHE_MODE", "off")
+    assert response_cache.get(key) is None
+    monkeypatch.setattr(response_cache, "CACHE_MODE", "read_through")
+    assert response_cache.get(key) == "value"
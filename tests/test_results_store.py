@@ -0,0 +1,55 @@
+# 结果列式存储 (results_store.ingest / load_*)
+import json
+import os
+
+import pytest
+
+import results_store
+
+HISTORY = [{
+    "generation": 1,
+    "individuals": [{
+        "prompt_id": "g1_p0",
+        "prompt_text": "seed",
+        "fitness": 0.5,
+        "average_metrics": {"hate": 10, "fluency": 80, "relevance": 70, "style": 60, "preachy": 5},
+        "sample_evaluations": [
+            {"sid": 1, "image_path": "images/1.jpg", "generated_text": "t", "fitness": 0.5,
+             "raw_scores": {"hate_score": 10, "fluency_score": 80}},
+            {"sid": 2, "image_path": "images/2.jpg", "generated_text": None, "fitness": None,
+             "raw_scores": None, "status": "failed"},
+        ],
+    }],
+}]
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    analytics = str(tmp_path / "analytics")
+    monkeypatch.setattr(results_store, "ANALYTICS_DIR", analytics)
+    monkeypatch.setattr(results_store, "MANIFEST_FILE", os.path.join(analytics, "ingested.json"))
+    with open("ga_history_100.json", "w", encoding="utf-8") as f:
+        json.dump(HISTORY, f)
+    return tmp_path
+
+def test_ingest_round_trip(store, capsys):
+    pytest.importorskip("pyarrow")
+    assert list(results_store.ingest()) == ["100"]
+    individuals = results_store.load_individuals(["100"])
+    samples = results_store.load_samples()
+    assert individuals["fitness"].tolist() == [0.5]
+    assert individuals["n_samples"].tolist() == [2]
+    assert samples["sid"].tolist() == ["1", "2"]
+    assert results_store.latest_run_id() == "100"
+
+    # 源文件没变：不再重新导入
+    capsys.readouterr()
+    results_store.ingest()
+    assert "Ingested" not in capsys.readouterr().out
+
+def test_missing_parquet_engine_is_reported(store, monkeypatch):
+    monkeypatch.setattr(results_store.importlib.util, "find_spec", lambda name: None)
+    with pytest.raises(ImportError, match="pip install pyarrow"):
+        results_store.ingest()
+    with pytest.raises(ImportError, match="pip install pyarrow"):
+        results_store.load_samples()
@@ -0,0 +1,55 @@
+# 离线重新加权 (reweight)：子指标矩阵、Pareto 前沿、权重网格与批量扫描
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import reweight
+from results_store import SCORE_COLUMNS
+from scoring import score_sample
+
+def _brute_front(M):
+    return [i for i in range(len(M))
+            if not any((M[j] >= M[i]).all() and (M[j] > M[i]).any() for j in range(len(M)))]
+
+def test_rescore_matches_score_sample():
+    rows = [
+        {"hate_score": 10, "fluency_score": 80, "relevance_score": 70, "style_score": 60, "preachiness_score": 5},
+        {"hate_score": 100, "fluency_score": 0, "relevance_score": 100, "style_score": 30, "preachiness_score": 90},
+    ]
+    M = reweight.component_matrix(pd.DataFrame(rows, columns=SCORE_COLUMNS))
+    assert reweight.rescore(M, reweight.CONFIG_WEIGHTS) == pytest.approx([score_sample(r) for r in rows])
+
+def test_pareto_front_matches_brute_force():
+    rng = np.random.default_rng(0)
+    # 取值离散，制造相等和部分相等的候选
+    M = rng.integers(0, 4, size=(60, 5)) / 4
+    assert reweight.pareto_front(M, chunk=7).tolist() == _brute_front(M)
+
+def test_pareto_front_keeps_identical_candidates():
+    M = np.array([[0.5, 0.5, 0.5, 0.5, 0.5],
+                  [0.5, 0.5, 0.5, 0.5, 0.5],
+                  [0.4, 0.5, 0.5, 0.5, 0.5],
+                  [0.9, 0.1, 0.5, 0.5, 0.5]])
+    assert reweight.pareto_front(M).tolist() == [0, 1, 3]
+
+def test_weight_grid_covers_the_simplex():
+    W = reweight.weight_grid(0.25)
+    assert len(W) == math.comb(4 + 4, 4)
+    assert np.allclose(W.sum(axis=1), 1)
+    assert (W >= 0).all()
+    assert len({tuple(w) for w in W}) == len(W)
+
+def test_sweep_matches_per_weight_ranking():
+    rng = np.random.default_rng(1)
+    M = rng.random((30, 5))
+    W = reweight.weight_grid(0.5)
+    best_idx, best_fit, overlap = reweight.sweep(M, W, baseline=W[0], top_k=5, chunk=4)
+    base_top = set(reweight.ranking(M, W[0])[:5].tolist())
+    for w, idx, fit, ov in zip(W, best_idx, best_fit, overlap):
+        order = reweight.ranking(M, w)
+        assert idx == order[0]
+        assert fit == pytest.approx(reweight.rescore(M, w)[order[0]])
+        assert ov == pytest.approx(len(base_top & set(order[:5].tolist())) / 5)
+    assert overlap[0] == 1
@@ -0,0 +1,127 @@
+# 运行日志与断点续跑 (run_journal.RunJournal / load_state)
+import json
+import random
+
+import pytest
+
+from fitness_ledger import FitnessLedger
+from run_journal import RunJournal, encode_rng_state, export_history, load_state, read_events
+
+def _sample(sid, fitness):
+    return {"sid": sid, "fitness": fitness, "raw_scores": {"hate_score": fitness}}
+
+def _individual(prompt, fitness):
+    return {"prompt_text": prompt, "fitness": fitness, "average_metrics": {"hate": fitness}}
+
+def _write_first_generation(journal, rng):
+    journal.write("run_start", history_file="ga_history_1.json")
+    journal.write("population", generation=1, population=["a", "b"], rng_state=encode_rng_state(rng.getstate()))
+    journal.write("samples", generation=1, index=0, prompt="a", details=[_sample("0", 0.2)])
+    journal.write("samples", generation=1, index=1, prompt="b", details=[_sample("0", 0.6)])
+    journal.write("individual", generation=1, record=_individual("a", 0.2))
+    journal.write("individual", generation=1, record=_individual("b", 0.6))
+    journal.write("generation_end", generation=1, best_score=0.6, best_prompt="b", global_best_score=0.6,
+                  global_best_prompt="b", patience=0, rng_state=encode_rng_state(rng.getstate()))
+
+def test_resume_mid_generation(tmp_path):
+    path = str(tmp_path / "run.jsonl")
+    rng = random.Random(7)
+    journal = RunJournal(path)
+    _write_first_generation(journal, rng)
+    rng.random()
+    journal.write("population", generation=2, population=["b", "c"], rng_state=encode_rng_state(rng.getstate()))
+    journal.write("samples", generation=2, index=1, prompt="c", details=[_sample("1", 0.9)])
+    journal.close()
+    # 崩溃时写了一半的一行
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"event": "samples", "generation": 2, "ind')
+
+    ledger = FitnessLedger()
+    state = load_state(path, ledger)
+    assert state["history_file"] == "ga_history_1.json"
+    assert state["generation"] == 1
+    assert state["population"] == ["b", "c"]
+    assert state["done"] == {1: [_sample("1", 0.9)]}
+    assert state["scored"] is None
+    assert not state["finished"]
+    assert state["global_best_prompt"] == "b"
+
+    # 随机数状态接着本代开始时的位置
+    restored = random.Random()
+    restored.setstate(state["rng_state"])
+    assert restored.random() == rng.random()
+
+    # 已完成的代按 fitness 排序
+    assert [ind["prompt_text"] for ind in state["history"][0]["individuals"]] == ["b", "a"]
+    assert ledger.summary("c")["n"] == 1
+
+    # 续跑后继续写：新事件从新的一行开始，再次续跑时不丢
+    journal = RunJournal(path)
+    journal.write("samples", generation=2, index=0, prompt="b", details=[_sample("2", 0.5)])
+    journal.close()
+    state = load_state(path)
+    assert state["done"] == {1: [_sample("1", 0.9)], 0: [_sample("2", 0.5)]}
+
+def test_complete_last_line_without_newline_is_kept(tmp_path):
+    path = str(tmp_path / "run.jsonl")
+    journal = RunJournal(path)
+    _write_first_generation(journal, random.Random(7))
+    journal.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"event": "samples", "generation": 2, "index": 0, "prompt": "c",
+                            "details": [_sample("1", 0.4)]}))
+
+    journal = RunJournal(path)
+    journal.write("samples", generation=2, index=1, prompt="d", details=[_sample("1", 0.3)])
+    journal.close()
+    assert [ev.get("prompt") for ev in read_events(path)[-2:]] == ["c", "d"]
+
+def test_corrupted_middle_line_raises(tmp_path):
+    path = str(tmp_path / "run.jsonl")
+    journal = RunJournal(path)
+    _write_first_generation(journal, random.Random(7))
+    journal.close()
+    with open(path, encoding="utf-8") as f:
+        lines = f.readlines()
+    lines[2] = lines[2][:20] + "\n"
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(lines)
+
+    with pytest.raises(ValueError, match="line 3"):
+        load_state(path)
+
+def test_resume_after_generation_end(tmp_path):
+    path = str(tmp_path / "run.jsonl")
+    journal = RunJournal(path)
+    _write_first_generation(journal, random.Random(7))
+    journal.close()
+
+    state = load_state(path)
+    assert state["scored"] == [("b", 0.6, {"hate": 0.6}), ("a", 0.2, {"hate": 0.2})]
+    assert state["done"] == {0: [_sample("0", 0.2)], 1: [_sample("0", 0.6)]}
+
+def test_samples_before_population_are_kept(tmp_path):
+    # 流水线调度：下一代的样本可能先于它的 population 记录写入
+    path = str(tmp_path / "run.jsonl")
+    journal = RunJournal(path)
+    _write_first_generation(journal, random.Random(7))
+    journal.write("samples", generation=2, index=0, prompt="c", details=[_sample("1", 0.4)])
+    journal.write("population", generation=2, population=["c", "d"],
+                  rng_state=encode_rng_state(random.Random(1).getstate()))
+    journal.close()
+
+    assert load_state(path)["done"] == {0: [_sample("1", 0.4)]}
+
+def test_export_history(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    journal = RunJournal("run.jsonl")
+    _write_first_generation(journal, random.Random(7))
+    journal.write("run_end", llm_usage={})
+    journal.close()
+
+    assert load_state("run.jsonl")["finished"]
+    export_history("run.jsonl")
+    with open("ga_history_1.json", encoding="utf-8") as f:
+        history = json.load(f)
+    assert history[0]["best_prompt"] == "b"
+    assert "Exported 1 generations" in capsys.readouterr().out
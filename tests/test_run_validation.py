@@ -0,0 +1,71 @@
+# 验证脚本的断点续跑 (run_validation.recorded_prompts / run_generation_batch)
+import asyncio
+import json
+
+import pytest
+
+import run_validation
+
+class _Renderer:
+    def __init__(self):
+        self.outputs = []
+
+    def submit(self, image_path, text, output_path):
+        self.outputs.append(output_path)
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    calls = []
+
+    async def acall_generator(image_path, system_def, instruction):
+        calls.append((image_path, instruction))
+        return f"tweet for {image_path}"
+
+    monkeypatch.setattr(run_validation, "acall_generator", acall_generator)
+    return calls
+
+def _write_stream(records):
+    with open("out.jsonl", "w", encoding="utf-8") as f:
+        for r in records:
+            f.write(json.dumps(r) + "\n")
+
+def _run(prompts, images):
+    renderer = _Renderer()
+    asyncio.run(run_validation.run_generation_batch(
+        prompts, images, "out.json", "imgs", renderer, asyncio.Semaphore(4)
+    ))
+    with open("out.json", encoding="utf-8") as f:
+        return json.load(f), renderer
+
+def test_records_carry_prompt_hash(workdir):
+    results, renderer = _run(["a", "b"], ["1.jpg"])
+    assert [r["prompt_hash"] for r in results] == [run_validation.prompt_hash("a"), run_validation.prompt_hash("b")]
+    assert [r["prompt_id"] for r in results] == [0, 1]
+    assert len(renderer.outputs) == 2
+
+def test_recorded_prompts_survive_gaps(workdir):
+    # prompt 1 中断前一条记录都没写出
+    _write_stream([
+        {"sid": "1", "prompt_id": 2, "prompt_content": "c", "generated_text": "x"},
+        {"sid": "1", "prompt_id": 0, "prompt_content": "a", "generated_text": "x"},
+        {"sid": "2", "prompt_id": 0, "prompt_content": "a", "generated_text": "x"},
+    ])
+    assert run_validation.recorded_prompts("out.json") == ["a", "c"]
+
+def test_recorded_prompts_without_stream(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert run_validation.recorded_prompts("out.json") is None
+
+def test_resume_matches_on_prompt_not_position(workdir):
+    # 旧记录 (没有 prompt_hash) 里 "c" 的 prompt_id 是 2，这次它排在第 1 位
+    _write_stream([
+        {"sid": "1", "prompt_id": 2, "prompt_content": "c", "generated_text": "old c"},
+        {"sid": "1", "prompt_id": 0, "prompt_content": "a", "generated_text": None, "status": "failed"},
+    ])
+    results, _ = _run(["a", "c"], ["1.jpg"])
+    assert [instruction.split("\n")[0] for _, instruction in workdir] == ["a"]
+    by_prompt = {r["prompt_content"]: r for r in results}
+    assert by_prompt["c"]["generated_text"] == "old c"
+    assert by_prompt["c"]["prompt_id"] == 1
+    assert by_prompt["a"]["generated_text"] == "tweet for images/1.jpg"
@@ -0,0 +1,38 @@
+# 公共评估面板 (sampling.py)
+import json
+
+from sampling import PanelSampler, image_difficulty, _allocate
+
+def _dataset(n):
+    return [{"sid": f"s{i}", "image_path": f"images/s{i}.png"} for i in range(n)]
+
+def _write_history(path, scores_by_sid):
+    samples = [
+        {"sid": sid, "image_path": f"images/{sid}.png", "fitness": 0.0,
+         "raw_scores": {"hate_score": 0, "fluency_score": v, "relevance_score": v,
+                        "style_score": v, "preachiness_score": 0}}
+        for sid, v in scores_by_sid.items()
+    ]
+    history = [{"generation": 1, "individuals": [{"prompt_text": "p", "fitness": 0.0, "sample_evaluations": samples}]}]
+    path.write_text(json.dumps(history), encoding="utf-8")
+
+def test_allocate_is_proportional_and_exact():
+    assert _allocate([10, 10, 10], 6) == [2, 2, 2]
+    assert sum(_allocate([7, 2, 1], 5)) == 5
+    assert _allocate([1, 1], 5) == [1, 1]
+
+def test_panel_is_shared_deterministic_and_rotates():
+    data = _dataset(12)
+    a, b = PanelSampler(data, seed=1), PanelSampler(data, seed=1)
+    assert a.panel(1, 4) == b.panel(1, 4)
+    seen = {d["sid"] for g in range(1, 4) for d in a.panel(g, 4)}
+    # 三代 x 4 张覆盖全部 12 张图片
+    assert seen == {d["sid"] for d in data}
+
+def test_difficulty_puts_ten_and_hundred_point_runs_on_one_scale(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _write_history(tmp_path / "ga_history_1.json", {"s0": 9, "s1": 3})
+    _write_history(tmp_path / "ga_history_2.json", {"s2": 90, "s3": 30})
+    difficulty = image_difficulty()
+    assert abs(difficulty["s0"] - difficulty["s2"]) < 1e-9
+    assert abs(difficulty["s1"] - difficulty["s3"]) < 1e-9
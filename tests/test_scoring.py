@@ -0,0 +1,49 @@
+# 样本打分与历史量纲换算 (scoring.py)
+import copy
+
+import pytest
+
+from scoring import score_sample, score_scale, history_scale, normalize_history
+
+def _history(raw_list):
+    samples = [
+        {"sid": str(i), "raw_scores": raw, "fitness": None if raw is None else 0.5, **({"status": "failed"} if raw is None else {})}
+        for i, raw in enumerate(raw_list)
+    ]
+    return [{"generation": 1, "individuals": [{"prompt_text": "p", "fitness": 0.5, "sample_evaluations": samples}]}]
+
+def test_score_sample_best_and_worst():
+    best = {"hate_score": 0, "preachiness_score": 0, "fluency_score": 100, "relevance_score": 100, "style_score": 100}
+    worst = {"hate_score": 100, "preachiness_score": 100, "fluency_score": 0, "relevance_score": 0, "style_score": 0}
+    assert score_sample(best) == pytest.approx(1.0)
+    assert score_sample(worst) == pytest.approx(0.0)
+    # 缺失的分项按最差处理
+    assert score_sample({}) == pytest.approx(0.0)
+
+def test_score_scale():
+    assert score_scale(10) == 10
+    assert score_scale(7) == 10
+    assert score_scale(11) == 1
+    assert score_scale(None) == 1
+    assert score_scale(float("nan")) == 1
+
+def test_ten_point_history_is_rescaled_and_rescored():
+    raw10 = {"hate_score": 0, "fluency_score": 9, "relevance_score": 8, "style_score": 6}
+    history = _history([raw10, None])
+    original = copy.deepcopy(history)
+    assert history_scale(history) == 10
+
+    normalized = normalize_history(history)
+    assert history == original
+    samples = normalized[0]["individuals"][0]["sample_evaluations"]
+    assert samples[0]["raw_scores"] == {"hate_score": 0, "fluency_score": 90, "relevance_score": 80, "style_score": 60}
+    assert samples[0]["fitness"] == pytest.approx(score_sample(samples[0]["raw_scores"]))
+    assert samples[1] == original[0]["individuals"][0]["sample_evaluations"][1]
+    assert normalized[0]["individuals"][0]["fitness"] == pytest.approx(samples[0]["fitness"])
+
+def test_hundred_point_history_keeps_scores():
+    raw = {"hate_score": 5, "fluency_score": 95, "relevance_score": 80, "style_score": 60, "preachiness_score": 30}
+    normalized = normalize_history(_history([raw]))
+    sample = normalized[0]["individuals"][0]["sample_evaluations"][0]
+    assert sample["raw_scores"] == raw
+    assert sample["fitness"] == pytest.approx(score_sample(raw))
@@ -0,0 +1,76 @@
+# 近重复检测：MinHash/LSH 索引 (similarity.SimilarityIndex) 与繁殖过滤器 (similarity.DiversityFilter)
+import pytest
+
+import similarity
+from fitness_ledger import FitnessLedger
+
+BASE = ("You are a casual social media user. Look at the image and write one short reply tweet that "
+        "pushes back on any hateful reading of it, sounds like a real person, avoids lecturing the "
+        "reader, stays on topic with what is shown, and uses natural everyday slang without emojis.")
+# 只差大小写和标点：shingle 完全相同
+SAME = BASE.upper().replace(",", "").replace(".", "!")
+# 换掉一个词：相似度在 SIMILARITY_THRESHOLD 与 SIMILARITY_INHERIT_THRESHOLD 之间
+CLOSE = BASE.replace("lecturing", "scolding")
+OTHER = "Describe the picture in the voice of a sports commentator who just saw the final goal of the season."
+
+@pytest.fixture(autouse=True)
+def fresh_stats(monkeypatch):
+    monkeypatch.setattr(similarity, "stats", {"rejected": 0, "inherited": 0})
+
+def _index(*prompts):
+    index = similarity.SimilarityIndex()
+    for p in prompts:
+        index.add(p)
+    return index
+
+def test_shingles_ignore_case_and_punctuation():
+    assert similarity.shingles(SAME) == similarity.shingles(BASE)
+    assert similarity.shingles("a b") == {"a b"}
+
+def test_nearest_finds_near_duplicates():
+    index = _index(BASE, OTHER)
+    assert index.nearest(BASE) == (BASE, 1.0)
+    neighbor, sim = index.nearest(CLOSE)
+    assert neighbor == BASE
+    assert similarity.SIMILARITY_THRESHOLD <= sim < similarity.SIMILARITY_INHERIT_THRESHOLD
+    assert sim == similarity.jaccard(similarity.shingles(CLOSE), similarity.shingles(BASE))
+
+def test_nearest_without_lsh_candidates():
+    assert _index(BASE).nearest(OTHER) == (None, 0.0)
+    assert _index().nearest(BASE) == (None, 0.0)
+
+def test_add_is_idempotent_after_normalization():
+    assert len(_index(BASE, BASE + "  ", OTHER)) == 2
+
+def test_filter_rejects_siblings_and_history():
+    screen = similarity.DiversityFilter(_index(BASE), [OTHER])
+    assert not screen(OTHER.lower())        # 与新种群里的个体近重复
+    assert not screen(CLOSE)                # 与历史个体近重复，不够继承
+    assert similarity.stats["rejected"] == 2
+
+def _scored_ledger():
+    ledger = FitnessLedger()
+    ledger.add(BASE, [{"sid": "1", "fitness": 0.6, "raw_scores": {}}])
+    return ledger
+
+def test_inheritance_waits_for_commit():
+    ledger = _scored_ledger()
+    screen = similarity.DiversityFilter(_index(BASE), [], ledger)
+    assert screen(SAME)
+    # 接受时不写账本：候选还可能被代理模型筛掉
+    assert ledger.inherited_from(SAME) is None
+    assert similarity.stats["inherited"] == 0
+
+    assert screen.commit([SAME]) == 1
+    assert ledger.inherited_from(SAME) == BASE
+    assert ledger.pop_inherited(SAME)
+    assert similarity.stats["inherited"] == 1
+
+def test_screened_out_candidates_do_not_inherit():
+    ledger = _scored_ledger()
+    screen = similarity.DiversityFilter(_index(BASE), [], ledger)
+    assert screen(SAME) and screen(OTHER)
+    assert screen.commit([OTHER]) == 0
+    assert ledger.inherited_from(SAME) is None
+    assert SAME not in ledger
+    assert similarity.stats["inherited"] == 0